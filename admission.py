@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Admission control for webhook routes
+Tracks in-flight requests and downstream queue depth and switches the
+webhooks into a shedding mode (store raw payload, answer fast) under load
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+
+class AdmissionController:
+    """
+    Decide per request whether to run full processing or shed.
+
+    Shedding starts when in-flight requests or queue depth pass their limit
+    and stops once both fall below recover_ratio of it, so the mode does not
+    flap on every request. Callbacks registered with on_recover() run on a
+    background thread each time shedding ends.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_queue_depth: int = 1000,
+                 queue_depth: Callable[[], int] = lambda: 0, recover_ratio: float = 0.5):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_depth = queue_depth
+        self.recover_ratio = recover_ratio
+        self.in_flight = 0
+        self.shedding = False
+        self.shedding_since: Optional[float] = None
+        self.stats = {'admitted': 0, 'shed': 0, 'shed_episodes': 0}
+        self._lock = threading.Lock()
+        self._recover_callbacks: List[Callable] = []
+
+    def on_recover(self, callback: Callable) -> None:
+        self._recover_callbacks.append(callback)
+
+    def _update(self) -> bool:
+        """Re-evaluate the mode (caller holds the lock); True if we just recovered"""
+        depth = self.queue_depth()
+        if not self.shedding:
+            if self.in_flight > self.max_in_flight or depth > self.max_queue_depth:
+                self.shedding = True
+                self.shedding_since = time.time()
+                self.stats['shed_episodes'] += 1
+                print(f"⚠️ Load shedding ON (in flight {self.in_flight}, queue {depth})")
+            return False
+        if (self.in_flight <= self.max_in_flight * self.recover_ratio
+                and depth <= self.max_queue_depth * self.recover_ratio):
+            self.shedding = False
+            self.shedding_since = None
+            print("✅ Load shedding OFF")
+            return True
+        return False
+
+    def _recovered(self):
+        for callback in self._recover_callbacks:
+            threading.Thread(target=callback, name='admission-recover', daemon=True).start()
+
+    @contextmanager
+    def admit(self) -> Iterator[bool]:
+        """Yields True for full processing, False when the request should shed"""
+        with self._lock:
+            self.in_flight += 1
+            recovered = self._update()
+            full = not self.shedding
+            self.stats['admitted' if full else 'shed'] += 1
+        if recovered:
+            self._recovered()
+        try:
+            yield full
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                recovered = self._update()
+            if recovered:
+                self._recovered()
+
+    def metrics(self) -> dict:
+        return {
+            'shedding': self.shedding,
+            'shedding_since': self.shedding_since,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth(),
+            'max_in_flight': self.max_in_flight,
+            'max_queue_depth': self.max_queue_depth,
+            **self.stats
+        }
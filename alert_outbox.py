@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Durable alert outbox
+Alerts are inserted as rows in the same transaction as the data that
+triggered them; a worker pool delivers them off the request path with
+exponential backoff, per-recipient ordering and dead-lettering. Sent rows
+are purged after sent_retention, so the table holds the backlog plus recent
+history only
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+
+import storage
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS alert_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at REAL,
+        channel TEXT,
+        recipient TEXT,
+        dedup_key TEXT,
+        payload TEXT,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL,
+        claimed_until REAL,
+        last_error TEXT,
+        sent_at REAL,
+        UNIQUE (channel, recipient, dedup_key)
+    )
+'''
+
+BACKLOG = '''
+    SELECT status, COUNT(*) FROM alert_outbox
+    WHERE status IN ('pending', 'sending', 'dead') GROUP BY status
+'''
+
+
+class AlertOutbox:
+    """
+    Outbox table plus a pool of delivery workers.
+
+    senders maps a channel ('email', later 'sms') to send(recipient, payload);
+    raising from send() schedules a retry. Each recipient is owned by one
+    worker (stable hash) and only its oldest undelivered row is eligible, so
+    a recipient's alerts always arrive in order, even across processes.
+    dedup_key only suppresses duplicates while the first row is kept: sent
+    rows are purged sent_retention seconds after delivery.
+    """
+
+    def __init__(self, db_path, senders: Dict[str, Callable], workers: int = 2,
+                 max_attempts: int = 8, base_delay: float = 5, max_delay: float = 900,
+                 lease: float = 120, poll_interval: float = 1.0,
+                 sent_retention: float = 7 * 86400, purge_interval: float = 3600):
+        self.db_path = db_path
+        self.senders = senders
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.sent_retention = sent_retention
+        self.purge_interval = purge_interval
+        self.stats = {'sent': 0, 'retried': 0, 'dead': 0, 'purged': 0}
+        self._next_purge = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+        self._lock = threading.Lock()
+        with storage.transaction(db_path) as c:
+            c.execute(SCHEMA)
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_recipient
+                ON alert_outbox(channel, recipient, status, id)
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status ON alert_outbox(status, next_attempt_at)')
+
+    def enqueue(self, c, channel: str, recipient: str, payload: dict,
+                dedup_key: Optional[str] = None) -> bool:
+        """Insert an alert on the caller's open transaction; False if already queued"""
+        now = time.time()
+        cursor = c.execute('''
+            INSERT OR IGNORE INTO alert_outbox
+            (created_at, channel, recipient, dedup_key, payload, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (now, channel, recipient, dedup_key, json.dumps(payload), now))
+        return cursor.rowcount > 0
+
+    def notify(self) -> None:
+        """Wake the workers after a commit that added rows"""
+        self.start()
+        self._wake.set()
+
+    def start(self) -> None:
+        """Start the worker pool once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, args=(k,), name=f'alert-worker-{k}', daemon=True)
+                for k in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _owns(self, worker: int, recipient: str) -> bool:
+        return zlib.crc32(recipient.encode('utf-8')) % self.workers == worker
+
+    def _due_heads(self, now: float):
+        """Oldest undelivered row per recipient, if it is due"""
+        return storage.get_connection(self.db_path).execute('''
+            SELECT o.id, o.channel, o.recipient, o.payload, o.attempts
+            FROM alert_outbox o
+            WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+              AND o.id = (
+                  SELECT MIN(id) FROM alert_outbox
+                  WHERE channel = o.channel AND recipient = o.recipient
+                    AND status IN ('pending', 'sending')
+              )
+            ORDER BY o.id
+            LIMIT 100
+        ''', (now,)).fetchall()
+
+    def _claim(self, row_id: int, now: float) -> bool:
+        with storage.transaction(self.db_path) as c:
+            # Leases abandoned by a crashed worker go back to pending
+            c.execute('''
+                UPDATE alert_outbox SET status = 'pending'
+                WHERE status = 'sending' AND claimed_until < ?
+            ''', (now,))
+            return c.execute('''
+                UPDATE alert_outbox SET status = 'sending', claimed_until = ?
+                WHERE id = ? AND status = 'pending'
+            ''', (now + self.lease, row_id)).rowcount == 1
+
+    def _deliver(self, row) -> None:
+        sender = self.senders.get(row['channel'])
+        try:
+            if sender is None:
+                raise RuntimeError(f"no sender for channel '{row['channel']}'")
+            sender(row['recipient'], json.loads(row['payload']))
+        except Exception as e:
+            attempts = row['attempts'] + 1
+            with storage.transaction(self.db_path) as c:
+                if attempts >= self.max_attempts:
+                    c.execute('''
+                        UPDATE alert_outbox SET status = 'dead', attempts = ?, last_error = ?
+                        WHERE id = ?
+                    ''', (attempts, str(e)[:500], row['id']))
+                    self.stats['dead'] += 1
+                    print(f"💀 Alert {row['id']} to {row['recipient']} dead-lettered: {e}")
+                    return
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                delay *= random.uniform(0.8, 1.2)
+                c.execute('''
+                    UPDATE alert_outbox
+                    SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?
+                    WHERE id = ?
+                ''', (attempts, str(e)[:500], time.time() + delay, row['id']))
+            self.stats['retried'] += 1
+            print(f"⚠️ Alert {row['id']} to {row['recipient']} failed ({e}), retry in {delay:.0f}s")
+            return
+
+        with storage.transaction(self.db_path) as c:
+            c.execute('''
+                UPDATE alert_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?
+                WHERE id = ?
+            ''', (time.time(), row['id']))
+        self.stats['sent'] += 1
+
+    def purge(self, now: Optional[float] = None, batch_size: int = 1000) -> int:
+        """Delete rows sent more than sent_retention ago, in short transactions"""
+        cutoff = (now if now is not None else time.time()) - self.sent_retention
+        purged = 0
+        while True:
+            with storage.transaction(self.db_path) as c:
+                deleted = c.execute('''
+                    DELETE FROM alert_outbox WHERE id IN (
+                        SELECT id FROM alert_outbox WHERE status = 'sent' AND sent_at < ? LIMIT ?
+                    )
+                ''', (cutoff, batch_size)).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                break
+        self.stats['purged'] += purged
+        return purged
+
+    def _run(self, worker: int) -> None:
+        while not self._stop.is_set():
+            delivered = False
+            try:
+                now = time.time()
+                if worker == 0 and now >= self._next_purge:
+                    self._next_purge = now + self.purge_interval
+                    self.purge(now)
+                for row in self._due_heads(now):
+                    if self._stop.is_set():
+                        break
+                    if self._owns(worker, row['recipient']) and self._claim(row['id'], now):
+                        self._deliver(row)
+                        delivered = True
+            except Exception as e:
+                print(f"❌ Alert worker {worker}: {e}")
+            if not delivered:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        storage.close_connection(self.db_path)
+
+    def metrics(self) -> dict:
+        # One idx_outbox_status range per status; sent rows are never read
+        rows = storage.get_connection(self.db_path).execute(BACKLOG).fetchall()
+        return {'backlog': {status: n for status, n in rows}, **self.stats}
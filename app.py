@@ -1,23 +1,97 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, stream_with_context
+from functools import wraps
 from datetime import datetime, timedelta
+import csv
+import io
 import json
 import os
-import sqlite3
+import time
+import atexit
 import threading
+import zlib
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+import storage
+from write_queue import PriorityLanes
+from spool import Spool
+from admission import AdmissionController
+from dedup import DedupCache, webhook_key
+from transcript_analyzer import analyze_transcript, HIGH_SEVERITY_KEYWORDS
+import issue_classifier
+from live_transcripts import LiveTranscriptTracker
+from alert_outbox import AlertOutbox
+from payload_store import PayloadStore
+from page_cache import VersionedPageCache
+from live_feed import LiveFeed
+import recent_calls
+from recent_calls import RecentCalls
+from phone import normalize_phone, add_phone_columns, backfill_phone_columns
+import customer_profiles
+import sms_replies
+import queries
+import counters
+import transcript_search
+import rollups
+import partitions
+import tenants
+from urllib.parse import parse_qsl, urlencode
+from xml.sax.saxutils import escape
+
 app = Flask(__name__)
 
 # Database setup
-DB_PATH = '/tmp/revenue_rescue.db'
+DB_PATH = os.environ.get('DATABASE_PATH', '/tmp/revenue_rescue.db')
+
+# Raw webhook payloads, compressed and kept out of the calls rows
+PAYLOADS = PayloadStore(DB_PATH)
+
+# Months older than the hot window live in one file each next to the database
+PARTITIONS = partitions.Partitions(
+    DB_PATH,
+    os.environ.get('PARTITION_DIR'),
+    hot_months=int(os.environ.get('HOT_MONTHS', 1)),
+    payload_months=int(os.environ.get('PAYLOAD_RETENTION_MONTHS', 12))
+)
 
 def init_db():
     """Initialize SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    with storage.transaction(DB_PATH) as c:
+        phones_added, profiles_created = create_schema(c)
+    if phones_added:
+        # One-shot migration for databases created before phone normalization
+        print(f"✅ Normalized {backfill_phone_columns(DB_PATH)} existing phone numbers")
+    if profiles_created:
+        with storage.transaction(DB_PATH) as c:
+            print(f"✅ Built {customer_profiles.rebuild_profiles(c)} customer profiles")
+    print("✅ Database initialized")
+
+def create_schema(c):
+    """
+    Every table, index and trigger of a calls database, the main one or a
+    tenant's; returns (phone columns added, profiles created)
+    """
+    init_schema(c)
+    recent_calls.init_schema(c)
+    phones_added = add_phone_columns(c)
+    profiles_created = customer_profiles.init_schema(c)
+    sms_replies.init_schema(c)
+    issue_classifier.init_schema(c)
+    queries.create_indexes(c)
+    # Before counters and rollups, which aggregate archived_calls too
+    partitions.init_schema(c)
+    if counters.init_schema(c):
+        # Counted from the rows as they are, in the transaction that adds the triggers
+        print(f"✅ Built {counters.rebuild_counters(c)} metric counters")
+    if transcript_search.init_schema(c):
+        print(f"✅ Indexed {transcript_search.rebuild(c)} transcripts for search")
+    if rollups.init_schema(c):
+        print(f"✅ Built {rollups.rebuild(c)} hourly rollup rows")
+    return phones_added, profiles_created
+
+def init_schema(c):
+    """Create tables on an open connection"""
     # Calls table
     c.execute('''
         CREATE TABLE IF NOT EXISTS calls (
@@ -37,6 +111,7 @@ def init_db():
             raw_data TEXT
         )
     ''')
+    PAYLOADS.init_schema(c)
     
     # Appointments table
     c.execute('''
@@ -68,105 +143,684 @@ def init_db():
         )
     ''')
     
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized")
+    # Alerts of calls committed in a tenant database, kept until the main
+    # transaction has queued them in the outbox; recovered at startup
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS pending_alerts (
+            call_id TEXT PRIMARY KEY,
+            payload TEXT,
+            created_at REAL
+        )
+    ''')
 
 init_db()
 
+# Which business a call belongs to, from the number the caller dialled
+TENANT_DIRECTORY = tenants.TenantDirectory(
+    os.environ.get('TENANTS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'companies.json')),
+    queries.DEFAULT_BUSINESS_ID
+)
+
+# The default business stays in DB_PATH; every other one gets its own file
+TENANT_DBS = tenants.TenantDatabases(
+    DB_PATH,
+    os.environ.get('TENANT_DB_DIR', os.path.splitext(DB_PATH)[0] + '_tenants'),
+    queries.DEFAULT_BUSINESS_ID,
+    init=create_schema,
+    max_open=int(os.environ.get('TENANT_MAX_OPEN', 64)),
+    idle_timeout=int(os.environ.get('TENANT_IDLE_SECONDS', 300))
+)
+
+# Payload dictionaries are per database, so each tenant has its own store
+_tenant_payloads = {queries.DEFAULT_BUSINESS_ID: PAYLOADS}
+_tenant_payloads_lock = threading.Lock()
+
+def tenant_payloads(business_id):
+    store = _tenant_payloads.get(business_id)
+    if store is None:
+        with _tenant_payloads_lock:
+            store = _tenant_payloads.setdefault(business_id, PayloadStore(TENANT_DBS.path(business_id)))
+    return store
+
+# Each tenant database has its own month files: <PARTITION_DIR>/<business_id>/
+# when PARTITION_DIR is set, else <business_id>_partitions next to its database
+_tenant_partitions = {queries.DEFAULT_BUSINESS_ID: PARTITIONS}
+
+def tenant_partitions(business_id):
+    store = _tenant_partitions.get(business_id)
+    if store is None:
+        with _tenant_payloads_lock:
+            directory = os.environ.get('PARTITION_DIR')
+            store = _tenant_partitions.setdefault(business_id, partitions.Partitions(
+                TENANT_DBS.path(business_id),
+                os.path.join(directory, business_id) if directory else None,
+                hot_months=PARTITIONS.hot_months,
+                payload_months=PARTITIONS.payload_months
+            ))
+    return store
+
+CALL_COLUMNS = (
+    'id', 'timestamp', 'business_id', 'customer_phone', 'customer_phone_e164',
+    'customer_name', 'transcript', 'issue_type', 'issue_labels', 'severity', 'is_emergency',
+    'booking_requested', 'booking_confirmed', 'technician_notified', 'call_duration', 'status'
+)
+
+PAC_COLUMNS = ('id', 'timestamp', 'transcript', 'call_duration', 'status')
+
+# A rewritten call (replay, deferred call processed) keeps an alert already sent
+CALL_MERGE = {
+    'technician_notified': 'MAX(COALESCE(technician_notified, 0), COALESCE(excluded.technician_notified, 0))'
+}
+
+SMS_COLUMNS = (
+    'timestamp', 'from_number', 'from_number_e164', 'to_number', 'to_number_e164',
+    'body', 'direction'
+)
+
+def calls_by_tenant(call_records):
+    by_tenant = {}
+    for record in call_records:
+        by_tenant.setdefault(record['business_id'] or queries.DEFAULT_BUSINESS_ID, []).append(record)
+    return by_tenant
+
+def write_calls(c, call_records):
+    """Persist a batch of call records in their businesses' databases (replay, backfill)"""
+    write_sharded_calls(call_records)
+    write_main_calls(c, call_records)
+
+def write_sharded_calls(call_records):
+    """
+    Calls of every business but the default one, each committed in its own
+    database. The writer runs this before its main transaction opens; a
+    batch retried after a failure rewrites the same rows. Calls to alert on
+    leave a pending_alerts row in the same transaction, so an alert lost
+    with the main transaction is queued at the next startup.
+    """
+    for business_id, records in calls_by_tenant(call_records).items():
+        if business_id != queries.DEFAULT_BUSINESS_ID:
+            with TENANT_DBS.transaction(business_id) as t, HOT_CALLS.tracking(t, business_id):
+                write_tenant_calls(t, records, tenant_payloads(business_id))
+                t.executemany('INSERT OR REPLACE INTO pending_alerts VALUES (?, ?, ?)', [
+                    (r['id'], json.dumps(alert_payload(r)), time.time()) for r in records if r.get('alert')
+                ])
+
+def clear_pending_alerts(call_records):
+    """Drop the pending_alerts rows of calls whose alerts the main database has committed"""
+    for business_id, records in calls_by_tenant(call_records).items():
+        ids = [r['id'] for r in records if r.get('alert')]
+        if ids and business_id != queries.DEFAULT_BUSINESS_ID:
+            with TENANT_DBS.transaction(business_id) as t:
+                t.execute(f"DELETE FROM pending_alerts WHERE call_id IN ({', '.join('?' * len(ids))})", ids)
+
+def resume_pending_alerts():
+    """Queue the alerts of tenant calls whose main transaction never committed (startup)"""
+    queued = 0
+    for business_id in TENANT_DBS.tenants():
+        if business_id == queries.DEFAULT_BUSINESS_ID:
+            continue
+        pending = TENANT_DBS.read(business_id, lambda t: [
+            json.loads(row[0]) for row in t.execute('SELECT payload FROM pending_alerts')
+        ], [])
+        if not pending:
+            continue
+        with storage.transaction(DB_PATH) as c:
+            for payload in pending:
+                queue_emergency_alert(c, payload)  # the dedup key skips alerts already queued
+        clear_pending_alerts([{**payload, 'business_id': business_id, 'alert': True} for payload in pending])
+        queued += len(pending)
+    if queued:
+        ALERT_OUTBOX.notify()
+        print(f"🚨 Queued {queued} alerts left pending by a previous process")
+    return queued
+
+def write_main_calls(c, call_records):
+    """The main database's part of a batch, after write_sharded_calls()"""
+    for business_id, records in calls_by_tenant(call_records).items():
+        if business_id == queries.DEFAULT_BUSINESS_ID:
+            write_tenant_calls(c, records, PAYLOADS)
+            continue
+        # Calls deferred while shedding wait in the main database until processed
+        ids = [r['id'] for r in records]
+        c.execute(f"DELETE FROM call_payloads WHERE call_id IN ({', '.join('?' * len(ids))})", ids)
+        c.execute(f"DELETE FROM calls WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+def write_tenant_calls(c, call_records, payloads):
+    """Persist call records of one business on its database's connection"""
+    customer_profiles.apply_calls(c, call_records)
+    c.executemany(storage.upsert_sql('calls', CALL_COLUMNS, merge=CALL_MERGE),
+                  [tuple(r[col] for col in CALL_COLUMNS) for r in call_records])
+    payloads.store_many(c, [(r['id'], r['payload'], r['transcript']) for r in call_records])
+
+def write_pac_calls(c, call_records):
+    """Persist a batch of simplified PAC call records"""
+    customer_profiles.apply_calls(c, call_records)
+    c.executemany(storage.upsert_sql('calls', PAC_COLUMNS),
+                  [tuple(r[col] for col in PAC_COLUMNS) for r in call_records])
+    PAYLOADS.store_many(c, [(r['id'], r['payload'], r['transcript']) for r in call_records])
+
+def write_sms(c, sms_records):
+    """Persist a batch of SMS log entries"""
+    c.executemany(f'''
+        INSERT INTO sms_log ({', '.join(SMS_COLUMNS)})
+        VALUES ({', '.join('?' * len(SMS_COLUMNS))})
+    ''', [tuple(r[col] for col in SMS_COLUMNS) for r in sms_records])
+
+def write_ingested_calls(c, call_records):
+    """Writer batch: calls rows plus outbox rows for new emergencies, one transaction"""
+    with HOT_CALLS.tracking(c, queries.DEFAULT_BUSINESS_ID):
+        write_main_calls(c, call_records)
+    for record in call_records:
+        if record.get('alert'):
+            queue_emergency_alert(c, record)
+
+def calls_committed(call_records):
+    """Writer after-commit hook: wake the alert workers, fan out the new rows"""
+    if any(record.get('alert') for record in call_records):
+        ALERT_OUTBOX.notify()
+        clear_pending_alerts(call_records)
+    share_committed_calls(call_records)
+
+# Committed calls and appointment changes, pushed to /api/calls/stream
+LIVE_FEED = LiveFeed(
+    max_queue=int(os.environ.get('LIVE_FEED_QUEUE', 1000)),
+    keepalive=int(os.environ.get('LIVE_FEED_KEEPALIVE_SECONDS', 15))
+)
+
+LIVE_CALL_FIELDS = (
+    'id', 'timestamp', 'business_id', 'customer_name', 'customer_phone', 'issue_type',
+    'is_emergency', 'booking_requested', 'status'
+)
+
+API_CALL_FIELDS = (
+    'id', 'timestamp', 'customer_name', 'customer_phone', 'issue_type', 'issue_labels',
+    'severity', 'is_emergency', 'booking_requested', 'status'
+)
+
+# Newest calls of each business, so recent-window reads skip SQLite
+HOT_CALLS = RecentCalls(
+    API_CALL_FIELDS + LIVE_CALL_FIELDS,
+    size=int(os.environ.get('RECENT_CALLS_PER_TENANT', 500))
+)
+
+def warm_recent_calls():
+    """Load the recent-calls buffer from every tenant's database (startup)"""
+    return sum(
+        TENANT_DBS.read(business_id, lambda c: HOT_CALLS.warm(c, business_id), 0)
+        for business_id in TENANT_DBS.tenants()
+    )
+
+print(f"✅ Warmed {warm_recent_calls()} recent calls")
+
+def sync_recent_calls(business_id):
+    """Re-warm business_id's buffer if its calls changed behind it (backfill.py, replay.py, ...)"""
+    TENANT_DBS.read(business_id, lambda c: HOT_CALLS.sync(c, business_id))
+
+def share_committed_calls(call_records):
+    """Recent-calls buffer and one 'call' event per record; only after commit"""
+    HOT_CALLS.add(call_records, queries.DEFAULT_BUSINESS_ID)
+    for record in call_records:
+        event = {f: record.get(f) for f in LIVE_CALL_FIELDS}
+        event['business_id'] = event['business_id'] or queries.DEFAULT_BUSINESS_ID
+        LIVE_FEED.publish('call', event)
+
+def call_lane(record):
+    """Emergencies (classify_issue) get the high-priority lane"""
+    return 'emergency' if record.get('is_emergency') else 'routine'
+
+# Write-behind queue for end-of-call reports: the webhook answers as soon as
+# the record is queued, the writers group-commit batches. Emergencies have a
+# reserved writer that commits immediately and routine batches wait for it
+CALL_WRITER = PriorityLanes(
+    DB_PATH, write_ingested_calls,
+    write_first=write_sharded_calls,
+    lanes=('emergency', 'routine'),
+    lane_of=call_lane,
+    lane_options={'emergency': {'max_batch_size': 20, 'max_flush_delay': 0}},
+    max_batch_size=int(os.environ.get('CALL_WRITE_BATCH_SIZE', 200)),
+    max_flush_delay=int(os.environ.get('CALL_WRITE_FLUSH_MS', 50)) / 1000,
+    name='call-writer',
+    after_commit=calls_committed
+)
+
+# Every webhook body is spooled before parsing so ingestion can be replayed
+SPOOL = Spool(
+    os.environ.get('SPOOL_DIR', '/tmp/revenue_rescue_spool'),
+    segment_bytes=int(os.environ.get('SPOOL_SEGMENT_MB', 64)) * 1024 * 1024,
+    fsync=os.environ.get('SPOOL_FSYNC') == '1'
+)
+
+# Sheds webhook processing to a raw-payload-only path during call bursts
+ADMISSION = AdmissionController(
+    max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 32)),
+    max_queue_depth=int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', 1000)),
+    queue_depth=CALL_WRITER.depth
+)
+
+# Drops Vapi retries before they are classified, written or alerted twice
+DEDUP = DedupCache(
+    DB_PATH,
+    max_entries=int(os.environ.get('DEDUP_MAX_ENTRIES', 50000)),
+    ttl=int(os.environ.get('DEDUP_TTL_HOURS', 24)) * 3600
+)
+
+atexit.register(storage.close_all)
+atexit.register(TENANT_DBS.close)
+atexit.register(SPOOL.close)
+atexit.register(DEDUP.stop)
+atexit.register(CALL_WRITER.stop)
+atexit.register(LIVE_FEED.close)
+
+def spool_request(source):
+    """Append the raw request body to the spool, returns its receive time"""
+    received_at = time.time()
+    try:
+        SPOOL.append(source, request.get_data(cache=True), received_at)
+    except OSError as e:
+        print(f"⚠️ Spool write failed: {e}")
+    return received_at
+
+# Multi-label issue model, once one has been trained (python issue_classifier.py train)
+ISSUE_MODEL = issue_classifier.load_model()
+EMERGENCY_SEVERITY = float(os.environ.get('EMERGENCY_SEVERITY', 0.5))
+
+def score_issue(transcript, analysis):
+    """(labels, severity, is_emergency) for a transcript and its keyword analysis"""
+    if ISSUE_MODEL is None:
+        return None, None, analysis.is_emergency
+    probs = ISSUE_MODEL.predict_proba(transcript)
+    labels = [label for label, p in zip(ISSUE_MODEL.labels, probs) if p >= ISSUE_MODEL.threshold]
+    severity = ISSUE_MODEL.severity(probs)
+    # The model can overrule weak keyword hits ("no ice maker") but never a
+    # high-severity phrase
+    is_emergency = analysis.is_emergency and (
+        severity >= EMERGENCY_SEVERITY
+        or any(phrase in HIGH_SEVERITY_KEYWORDS for _, _, phrase in analysis.emergency_matches)
+    )
+    return ','.join(labels), round(severity, 3), is_emergency
+
 def classify_issue(transcript):
     """Classify if emergency based on transcript keywords"""
-    if not transcript:
-        return 'routine', False
+    analysis = analyze_transcript(transcript)
+    _, _, is_emergency = score_issue(transcript, analysis)
+    return ('emergency' if is_emergency else 'routine'), is_emergency
+
+def extract_customer_name(transcript):
+    """Extract customer name from transcript"""
+    return analyze_transcript(transcript).customer_name
+
+def called_number(data):
+    """The number the customer dialled, from a Vapi webhook"""
+    call = data.get('call') or {}
+    phone_number = call.get('phoneNumber') or (data.get('message') or {}).get('phoneNumber') or {}
+    return phone_number.get('number') if isinstance(phone_number, dict) else None
+
+def build_call_record(data, received_at):
+    """Parse a Vapi end-of-call report into a calls row"""
+    message = data.get('message', {})
+    customer_phone = data.get('call', {}).get('customer', {}).get('number')
     
-    emergency_keywords = [
-        'no heat', 'no ac', 'no air', 'not working', 'completely dead',
-        'leaking', 'water', 'burning smell', 'smoke', 'fire',
-        'frozen', 'ice', 'urgent', 'emergency', 'dangerous',
-        'unsafe', 'gas smell', 'carbon monoxide', 'pregnant', 'baby', 'elderly'
-    ]
+    # Classification, booking intent and caller name in one pass
+    transcript = message.get('transcript', '')
+    analysis = analyze_transcript(transcript)
+    issue_labels, severity, is_emergency = score_issue(transcript, analysis)
     
-    transcript_lower = transcript.lower()
+    return {
+        'id': data.get('call', {}).get('id', 'unknown'),
+        'timestamp': datetime.fromtimestamp(received_at).isoformat(),
+        'business_id': TENANT_DIRECTORY.resolve(called_number(data)),
+        'customer_phone': customer_phone,
+        'customer_phone_e164': normalize_phone(customer_phone),
+        'customer_name': analysis.customer_name,
+        'transcript': transcript,
+        'issue_type': 'emergency' if is_emergency else 'routine',
+        'issue_labels': issue_labels,
+        'severity': severity,
+        'is_emergency': is_emergency,
+        'booking_requested': analysis.booking_requested,
+        'booking_confirmed': False,  # Will be updated when actually booked
+        'technician_notified': False,
+        'call_duration': message.get('duration'),
+        'status': 'open',
+        'payload': data
+    }
+
+def build_pac_record(data, received_at):
+    """Parse a PAC end-of-call report into a simplified calls row"""
+    message = data.get('message', {})
+    return {
+        'id': data.get('call', {}).get('id', 'unknown'),
+        'timestamp': datetime.fromtimestamp(received_at).isoformat(),
+        'transcript': message.get('transcript', ''),
+        'call_duration': message.get('duration', 0),
+        'status': 'completed',
+        'payload': data
+    }
+
+def build_sms_record(data, received_at):
+    """Turn a Twilio form payload into an sms_log row"""
+    return {
+        'timestamp': datetime.fromtimestamp(received_at).isoformat(),
+        'from_number': data.get('From'),
+        'from_number_e164': normalize_phone(data.get('From')),
+        'to_number': data.get('To'),
+        'to_number_e164': normalize_phone(data.get('To')),
+        'body': data.get('Body'),
+        'direction': 'inbound'
+    }
+
+def _end_of_call_only(build):
+    """Replay helper: only end-of-call reports become calls rows"""
+    def builder(data, received_at):
+        if data.get('message', {}).get('type') != 'end-of-call-report':
+            return None
+        return build(data, received_at)
+    return builder
+
+def _decode_form(body):
+    return dict(parse_qsl(body.decode('utf-8')))
+
+# Spool source -> (body decoder, record builder, batch writer), shared by the
+# webhooks and replay.py
+INGESTORS = {
+    'vapi': (json.loads, _end_of_call_only(build_call_record), write_calls),
+    'pac': (json.loads, _end_of_call_only(build_pac_record), write_pac_calls),
+    'twilio': (_decode_form, build_sms_record, write_sms),
+}
+
+def build_deferred_record(data, source, received_at):
+    """Raw-payload-only calls row written while shedding load"""
+    record = dict.fromkeys(CALL_COLUMNS)
+    record.update({
+        'id': data.get('call', {}).get('id', 'unknown'),
+        'timestamp': datetime.fromtimestamp(received_at).isoformat(),
+        # Waits in the main database; the record rebuilt later goes to its business
+        'business_id': queries.DEFAULT_BUSINESS_ID,
+        'status': f'deferred:{source}',
+        'payload': data
+    })
+    return record
+
+def send_emergency_alert(recipient, call_data):
+    """Send email alert for emergency calls (called by the outbox workers)"""
+    subject = f"🚨 Emergency call: {call_data.get('issue_type', 'Unknown')}"
+    body = (
+        f"Customer: {call_data.get('customer_name') or 'Unknown'}\n"
+        f"Phone: {call_data.get('customer_phone') or 'Unknown'}\n"
+        f"Issue: {call_data.get('issue_type', 'Unknown')}\n"
+        f"Call: {call_data.get('id')}\n"
+        f"Time: {call_data.get('timestamp') or datetime.now().isoformat()}\n"
+    )
     
-    for keyword in emergency_keywords:
-        if keyword in transcript_lower:
-            return 'emergency', True
+    sender_password = os.environ.get('SENDER_PASSWORD')
+    if not sender_password:
+        # For demo, just print. Set SENDER_PASSWORD to send through SMTP
+        print(f"🚨 EMERGENCY ALERT - Would send email to {recipient}:")
+        for line in body.splitlines():
+            print(f"   {line}")
+        return
     
-    return 'routine', False
+    sender_email = os.environ.get('SENDER_EMAIL', 'Connor@pac-holding.com')
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Exceptions propagate so the outbox retries with backoff
+    smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
+    smtp_port = int(os.environ.get('SMTP_PORT', 587))
+    with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
+        server.starttls()
+        server.login(sender_email, sender_password)
+        server.send_message(msg)
 
-def extract_customer_name(transcript):
-    """Extract customer name from transcript"""
-    if not transcript:
-        return None
-    
-    # Simple extraction - look for "my name is" or similar patterns
-    import re
-    patterns = [
-        r'my name is (\w+)',
-        r'this is (\w+)',
-        r'name is (\w+)',
-        r'(?:hello|hi) (?:i\'m|this is) (\w+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, transcript, re.IGNORECASE)
-        if match:
-            return match.group(1)
-    
-    return None
-
-def send_emergency_alert(call_data):
-    """Send email alert for emergency calls"""
+# Alerts are delivered from a durable outbox, never on the webhook thread
+ALERT_OUTBOX = AlertOutbox(
+    DB_PATH,
+    {'email': send_emergency_alert},
+    workers=int(os.environ.get('ALERT_WORKERS', 2)),
+    max_attempts=int(os.environ.get('ALERT_MAX_ATTEMPTS', 8)),
+    sent_retention=int(os.environ.get('ALERT_SENT_RETENTION_DAYS', 7)) * 86400
+)
+atexit.register(ALERT_OUTBOX.stop)
+
+# Compiled once; pages are re-rendered only after a commit
+DASHBOARD_TEMPLATE = app.jinja_env.get_template('dashboard.html')
+DASHBOARD_CACHE = VersionedPageCache(DB_PATH)
+atexit.register(DASHBOARD_CACHE.close)
+
+ALERT_RECIPIENTS = [r.strip() for r in os.environ.get('ALERT_EMAIL', 'connorsisk14@gmail.com').split(',') if r.strip()]
+
+def alert_payload(call_data):
+    return {k: call_data.get(k) for k in ('id', 'timestamp', 'customer_name', 'customer_phone', 'issue_type')}
+
+def queue_emergency_alert(c, call_data):
+    """Add outbox rows for an emergency on the caller's open transaction"""
+    payload = alert_payload(call_data)
+    for recipient in ALERT_RECIPIENTS:
+        # One page per call: live and end-of-call alerts share the dedup key
+        ALERT_OUTBOX.enqueue(c, 'email', recipient, payload, dedup_key=f"{call_data['id']}:emergency")
+
+def alert_live_emergency(live_call, phrase, data):
+    """Page the on-call tech mid-call when a high-severity phrase is heard"""
+    with storage.transaction(DB_PATH) as c:
+        queue_emergency_alert(c, {
+            'id': live_call.call_id,
+            'timestamp': datetime.now().isoformat(),
+            'customer_phone': data.get('call', {}).get('customer', {}).get('number'),
+            'customer_name': None,
+            'issue_type': f'emergency ({phrase})'
+        })
+    ALERT_OUTBOX.notify()
+    print(f"🚨 Early emergency alert queued for {live_call.call_id}: '{phrase}'")
+
+# Per-call incremental matcher over live 'transcript' messages
+LIVE_CALLS = LiveTranscriptTracker(
+    alert_live_emergency,
+    max_calls=int(os.environ.get('LIVE_MAX_CALLS', 500)),
+    idle_ttl=int(os.environ.get('LIVE_IDLE_MINUTES', 30)) * 60
+)
+
+def shed_webhook(source):
+    """Degraded path: keep the raw payload, classify and alert later"""
+    received_at = spool_request(source)
+    data = request.get_json(silent=True) or {}
+    if data.get('message', {}).get('type') == 'end-of-call-report':
+        CALL_WRITER.put(build_deferred_record(data, source, received_at))
+    return jsonify({"status": "deferred", "action": "continue"}), 200
+
+def admission_controlled(source):
+    """Route decorator: full processing when admitted, shed_webhook otherwise"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with ADMISSION.admit() as full:
+                if full:
+                    return view(*args, **kwargs)
+                return shed_webhook(source)
+        return wrapper
+    return decorator
+
+def deduplicated(view):
+    """Route decorator: answer Vapi retries of an identical webhook from the cache"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        data = request.get_json(silent=True) or {}
+        key = webhook_key(
+            data.get('call', {}).get('id', 'unknown'),
+            data.get('message', {}).get('type', 'unknown'),
+            request.get_data(cache=True)
+        )
+        if not DEDUP.claim(key):
+            print(f"♻️ Duplicate webhook ignored: {key}")
+            return jsonify({"status": "duplicate", "action": "continue"}), 200
+        try:
+            return view(*args, **kwargs)
+        except Exception:
+            DEDUP.release(key)
+            raise
+    return wrapper
+
+_deferred_lock = threading.Lock()
+
+def process_deferred_calls(batch_size=200):
+    """Run classification and alerts for calls stored raw while shedding"""
+    if not _deferred_lock.acquire(blocking=False):
+        return 0
     try:
-        # For demo, just print. In production, use SMTP
-        print(f"🚨 EMERGENCY ALERT - Would send email:")
-        print(f"   Customer: {call_data.get('customer_name', 'Unknown')}")
-        print(f"   Phone: {call_data.get('customer_phone', 'Unknown')}")
-        print(f"   Issue: {call_data.get('issue_type', 'Unknown')}")
-        print(f"   Time: {datetime.now().isoformat()}")
-        
-        # TODO: Implement SMTP email sending
-        # smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-        # smtp_port = int(os.environ.get('SMTP_PORT', 587))
-        # sender_email = os.environ.get('SENDER_EMAIL', 'Connor@pac-holding.com')
-        # sender_password = os.environ.get('SENDER_PASSWORD')
-        # recipient = os.environ.get('ALERT_EMAIL', 'connorsisk14@gmail.com')
+        CALL_WRITER.flush(timeout=30)
+        conn = storage.get_connection(DB_PATH)
+        processed = 0
+        while not ADMISSION.shedding:
+            rows = conn.execute('''
+                SELECT id, timestamp, status FROM calls
+                WHERE status LIKE 'deferred:%'
+                LIMIT ?
+            ''', (batch_size,)).fetchall()
+            if not rows:
+                break
+            
+            batches, failed = {}, []  # batch writer -> records
+            for row in rows:
+                source = row['status'].split(':', 1)[1]
+                _, build, write = INGESTORS[source]
+                received_at = datetime.fromisoformat(row['timestamp']).timestamp()
+                try:
+                    data = PAYLOADS.load(row['id'], conn)
+                    record = build(data, received_at) if data is not None else None
+                except (ValueError, KeyError, zlib.error) as e:
+                    print(f"⚠️ Deferred call {row['id']} unreadable: {e}")
+                    record = None
+                if record is None:
+                    failed.append(row['id'])
+                    continue
+                record['alert'] = bool(record.get('is_emergency'))
+                # Same split as the writer: other businesses' databases first
+                batches.setdefault(write_main_calls if write is write_calls else write, []).append(record)
+            
+            write_sharded_calls(batches.get(write_main_calls, []))
+            with storage.transaction(DB_PATH) as c, HOT_CALLS.tracking(c, queries.DEFAULT_BUSINESS_ID):
+                c.executemany("UPDATE calls SET status = 'deferred-failed' WHERE id = ?", [(i,) for i in failed])
+                for write, records in batches.items():
+                    write(c, records)
+                    for record in records:
+                        if record['alert']:
+                            queue_emergency_alert(c, record)
+            written = [record for records in batches.values() for record in records]
+            
+            ALERT_OUTBOX.notify()
+            clear_pending_alerts(written)
+            for call_id in failed:
+                HOT_CALLS.update(call_id, status='deferred-failed')
+            share_committed_calls(written)
+            processed += len(rows)
         
-    except Exception as e:
-        print(f"❌ Failed to send alert: {e}")
+        if processed:
+            print(f"✅ Processed {processed} deferred calls")
+        return processed
+    finally:
+        _deferred_lock.release()
+
+ADMISSION.on_recover(process_deferred_calls)
+
+_deferred_pid = None
+
+def resume_deferred_calls():
+    """
+    Alerts and calls deferred before a restart get no recovery callback;
+    handle them once per process
+    """
+    global _deferred_pid
+    if _deferred_pid == os.getpid():
+        return
+    _deferred_pid = os.getpid()
+
+    def resume():
+        resume_pending_alerts()
+        process_deferred_calls()
+    threading.Thread(target=resume, name='deferred-resume', daemon=True).start()
+
+# Folds the buckets touched by new writes into the hourly rollups of every tenant database
+ROLLUPS = rollups.RollupRefresher(
+    lambda: {business_id: TENANT_DBS.path(business_id) for business_id in TENANT_DBS.tenants()},
+    interval=int(os.environ.get('ROLLUP_INTERVAL_SECONDS', 60))
+)
+atexit.register(ROLLUPS.stop)
+
+# Moves cold months of every tenant database to their partition files, compacts
+# them, applies retention; the recent-calls buffer must stop answering for the
+# calls that moved
+ARCHIVER = partitions.Archiver(
+    lambda: {business_id: tenant_partitions(business_id) for business_id in TENANT_DBS.tenants()},
+    interval=int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 86400)),
+    on_archived=lambda business_id, store, stats: HOT_CALLS.forget(store.cutoff(), business_id)
+)
+atexit.register(ARCHIVER.stop)
+
+@app.before_request
+def start_background_workers():
+    """Alert workers, the rollup refresher, the archiver and leftover deferred calls start lazily in each (forked) worker process"""
+    ALERT_OUTBOX.start()
+    ROLLUPS.start()
+    ARCHIVER.start()
+    resume_deferred_calls()
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    # Get counts from database
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT COUNT(*) FROM calls')
-    total_calls = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM calls WHERE is_emergency = 1')
-    emergency_calls = c.fetchone()[0]
+    # Get counts from the trigger-maintained counters, a few primary-key reads
+    # per database: one business's, or every business's all-tenant bucket
+    business_id = request.args.get('business_id')
+    today = datetime.now().date().isoformat()
     
-    c.execute('SELECT COUNT(*) FROM appointments')
-    total_appointments = c.fetchone()[0]
-    
-    conn.close()
+    try:
+        if business_id is None:
+            per_tenant = TENANT_DBS.map(lambda c: (
+                counters.read_counters(c), counters.read_counters(c, counters.ALL, today)
+            )).values()
+        else:
+            per_tenant = [TENANT_DBS.read(business_id, lambda c: (
+                counters.read_counters(c, business_id), counters.read_counters(c, business_id, today)
+            ), ({},) * 2)]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    tenant, tenant_today = (
+        {metric: sum(counts[i].get(metric, 0) for counts in per_tenant) for metric, *_ in counters.COUNTED}
+        for i in (0, 1)
+    )
+    # Appointments are kept in the main database only
+    everyone = counters.read_counters(storage.get_connection(DB_PATH))
     
     return jsonify({
-        "status": "healthy",
+        "status": "shedding" if ADMISSION.shedding else "healthy",
         "service": "revenue-rescue",
         "time": datetime.now().isoformat(),
         "metrics": {
-            "total_calls": total_calls,
-            "emergency_calls": emergency_calls,
-            "total_appointments": total_appointments
-        }
-    })
+            "total_calls": tenant['calls'],
+            "emergency_calls": tenant['emergencies'],
+            "total_appointments": everyone['appointments'],
+            "calls_today": tenant_today['calls'],
+            "emergencies_today": tenant_today['emergencies']
+        },
+        "write_queue": CALL_WRITER.metrics(),
+        "admission": ADMISSION.metrics(),
+        "dedup": DEDUP.metrics(),
+        "live_calls": LIVE_CALLS.metrics(),
+        "alerts": ALERT_OUTBOX.metrics(),
+        "dashboard_cache": DASHBOARD_CACHE.metrics(),
+        "live_feed": LIVE_FEED.metrics(),
+        "recent_calls": HOT_CALLS.metrics(),
+        "rollups": ROLLUPS.metrics(),
+        "partitions": ARCHIVER.metrics(),
+        "tenants": TENANT_DBS.metrics()
+    }), 200, {'X-Load-Shedding': '1' if ADMISSION.shedding else '0'}
 
 @app.route('/webhook/vapi', methods=['POST'])
+@deduplicated
+@admission_controlled('vapi')
 def vapi_webhook():
     """Handle Vapi voice calls - process conversation and log everything"""
+    received_at = spool_request('vapi')
     data = request.get_json() or {}
     
     message_type = data.get('message', {}).get('type', 'unknown')
@@ -176,79 +830,55 @@ def vapi_webhook():
     
     # Handle end-of-call report
     if message_type == 'end-of-call-report':
-        message = data.get('message', {})
-        
-        # Extract conversation data
-        transcript = message.get('transcript', '')
-        customer_name = extract_customer_name(transcript)
-        issue_type, is_emergency = classify_issue(transcript)
+        call_record = build_call_record(data, received_at)
+        customer_name = call_record['customer_name']
+        is_emergency = call_record['is_emergency']
+        booking_requested = call_record['booking_requested']
         
-        # Check if booking was requested
-        booking_keywords = ['schedule', 'appointment', 'book', 'come out', 'send someone']
-        booking_requested = any(kw in transcript.lower() for kw in booking_keywords)
+        # The tech may already have been paged from the live transcript
+        live_call = LIVE_CALLS.finish(call_id)
+        alerted_live = live_call is not None and live_call.alerted
+        call_record['technician_notified'] = alerted_live
+        call_record['alert'] = is_emergency and not alerted_live
         
-        # Build call record
-        call_record = {
-            'id': call_id,
-            'timestamp': datetime.now().isoformat(),
-            'business_id': 'demo',  # Will be dynamic per client
-            'customer_phone': data.get('call', {}).get('customer', {}).get('number'),
-            'customer_name': customer_name,
-            'transcript': transcript,
-            'issue_type': issue_type,
-            'is_emergency': is_emergency,
-            'booking_requested': booking_requested,
-            'booking_confirmed': False,  # Will be updated when actually booked
-            'technician_notified': False,
-            'call_duration': message.get('duration'),
-            'status': 'open',
-            'raw_data': json.dumps(data)
-        }
+        # Queue for the group-commit writer instead of waiting on our own fsync
+        CALL_WRITER.put(call_record)
         
-        # Save to database
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            INSERT OR REPLACE INTO calls 
-            (id, timestamp, business_id, customer_phone, customer_name, transcript,
-             issue_type, is_emergency, booking_requested, booking_confirmed,
-             technician_notified, call_duration, status, raw_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            call_record['id'], call_record['timestamp'], call_record['business_id'],
-            call_record['customer_phone'], call_record['customer_name'],
-            call_record['transcript'], call_record['issue_type'],
-            call_record['is_emergency'], call_record['booking_requested'],
-            call_record['booking_confirmed'], call_record['technician_notified'],
-            call_record['call_duration'], call_record['status'], call_record['raw_data']
-        ))
-        conn.commit()
-        conn.close()
-        
-        print(f"✅ Call logged: {call_id}")
+        print(f"✅ Call queued: {call_id}")
         print(f"   Customer: {customer_name or 'Unknown'}")
+        profile = TENANT_DBS.read(call_record['business_id'], lambda c: customer_profiles.get_profile(
+            c, call_record['customer_phone_e164']
+        ))
+        if profile and profile['call_count']:
+            print(f"   Returning customer: {profile['call_count']} prior calls, "
+                  f"{profile['emergency_count']} emergencies")
         print(f"   Emergency: {is_emergency}")
         print(f"   Booking requested: {booking_requested}")
         
-        # Send alert for emergencies
-        if is_emergency:
-            send_emergency_alert(call_record)
-            print(f"🚨 Emergency alert sent for {call_id}")
+        if call_record['alert']:
+            print(f"🚨 Emergency alert queued for {call_id}")
         
         return jsonify({"status": "logged", "call_id": call_id}), 200
     
     # Handle real-time transcript updates
     elif message_type == 'transcript':
-        transcript = data.get('message', {}).get('transcript', '')
+        message = data.get('message', {})
+        transcript = message.get('transcript', '')
         print(f"📝 Live transcript: {transcript[:80]}...")
+        # Partials are superseded by the final fragment, scan each utterance once
+        if message.get('transcriptType', 'final') == 'final' and message.get('role', 'user') == 'user':
+            LIVE_CALLS.feed(call_id, transcript, data)
         return jsonify({"status": "received"}), 200
     
     # Default: tell Vapi to continue
     return jsonify({"status": "ok", "action": "continue"}), 200
 
 @app.route('/webhook/pac', methods=['POST'])
+@deduplicated
+@admission_controlled('pac')
 def pac_webhook():
     """NEW: Simplified PAC webhook for Vapi - bulletproof version"""
+    received_at = spool_request('pac')
     data = request.get_json() or {}
     
     message_type = data.get('message', {}).get('type', 'unknown')
@@ -266,31 +896,16 @@ def pac_webhook():
     # Log end-of-call reports
     if message_type == 'end-of-call-report':
         try:
-            message = data.get('message', {})
-            transcript = message.get('transcript', '')
-            duration = message.get('duration', 0)
+            call_record = build_pac_record(data, received_at)
             
             print(f"✅ Call ended: {call_id}")
-            print(f"   Duration: {duration}s")
-            print(f"   Transcript preview: {transcript[:100]}...")
+            print(f"   Duration: {call_record['call_duration']}s")
+            print(f"   Transcript preview: {call_record['transcript'][:100]}...")
             
             # Simple database log
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute('''
-                INSERT OR REPLACE INTO calls 
-                (id, timestamp, transcript, call_duration, status, raw_data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                call_id, 
-                datetime.now().isoformat(),
-                transcript,
-                duration,
-                'completed',
-                json.dumps(data)
-            ))
-            conn.commit()
-            conn.close()
+            with storage.transaction(DB_PATH) as c, HOT_CALLS.tracking(c, queries.DEFAULT_BUSINESS_ID):
+                write_pac_calls(c, [call_record])
+            share_committed_calls([call_record])
         except Exception as e:
             print(f"⚠️ Logging error: {e}")
     
@@ -299,200 +914,352 @@ def pac_webhook():
 @app.route('/webhook/twilio', methods=['POST'])
 def twilio_webhook():
     """Handle Twilio SMS"""
+    received_at = spool_request('twilio')
     data = request.form.to_dict()
     
-    sms_record = {
-        'timestamp': datetime.now().isoformat(),
-        'from_number': data.get('From'),
-        'to_number': data.get('To'),
-        'body': data.get('Body'),
-        'direction': 'inbound'
-    }
+    sms_record = build_sms_record(data, received_at)
     
-    # Save to database
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO sms_log (timestamp, from_number, to_number, body, direction)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (sms_record['timestamp'], sms_record['from_number'], 
-          sms_record['to_number'], sms_record['body'], sms_record['direction']))
-    conn.commit()
-    conn.close()
+    # Log the message and apply CONFIRM/CANCEL/reschedule in one transaction
+    with storage.transaction(DB_PATH) as c:
+        write_sms(c, [sms_record])
+        outcome = sms_replies.apply_reply(c, sms_record['from_number_e164'], sms_record['body'])
     
     print(f"💬 SMS from {data.get('From')}: {data.get('Body')}")
+    if outcome.appointment_id:
+        print(f"📅 Appointment {outcome.appointment_id} -> {outcome.status}")
+        LIVE_FEED.publish('appointment', {'id': outcome.appointment_id, 'status': outcome.status})
     
-    return """<?xml version="1.0" encoding="UTF-8"?>
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-    <Message>Thanks for your message. Our team will follow up shortly.</Message>
+    <Message>{escape(outcome.reply)}</Message>
 </Response>""", 200, {'Content-Type': 'application/xml'}
 
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
     """Dashboard view - today's calls and appointments"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    business_id = request.args.get('business_id', queries.DEFAULT_BUSINESS_ID)
+    if not tenants.BUSINESS_ID.fullmatch(business_id):
+        return jsonify({"error": f"invalid business_id: {business_id!r}"}), 400
+    today = (business_id, *queries.day_range())
     
-    # Today's calls
-    today = datetime.now().strftime('%Y-%m-%d')
-    c.execute('''
-        SELECT * FROM calls 
-        WHERE date(timestamp) = date('now')
-        ORDER BY timestamp DESC
-        LIMIT 20
-    ''')
-    today_calls = c.fetchall()
+    # Refreshes while nothing was committed reuse the page, or get a 304. The
+    # recent-calls buffer is updated just after commits, or re-warmed after
+    # another process's, so it versions the page too. The sync is one PRAGMA
+    # read until the database reports a commit
+    sync_recent_calls(business_id)
+    etag, html = DASHBOARD_CACHE.get(today, lambda: render_dashboard(today), tag=HOT_CALLS.generation)
+    response = app.make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate, cheap when unchanged
+    return response.make_conditional(request)
+
+def render_dashboard(today):
+    """Query and render the dashboard for (business_id, day start, day end)"""
+    c = storage.get_connection(DB_PATH)
+    # Read before the queries: live mode replays anything published since
+    last_event_id = LIVE_FEED.last_event_id
     
-    # Pending appointments
-    c.execute('''
-        SELECT * FROM appointments 
-        WHERE status = 'pending'
-        ORDER BY created_at DESC
-        LIMIT 10
-    ''')
-    pending_appointments = c.fetchall()
-    
-    # Stats
-    c.execute('SELECT COUNT(*) FROM calls WHERE date(timestamp) = date("now")')
-    calls_today = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM calls WHERE is_emergency = 1 AND date(timestamp) = date("now")')
-    emergencies_today = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM appointments WHERE status = "pending"')
-    pending_count = c.fetchone()[0]
-    
-    conn.close()
-    
-    # Simple HTML dashboard
-    html = '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Revenue Rescue Dashboard</title>
-        <style>
-            body { font-family: Arial, sans-serif; padding: 20px; background: #0a0a0a; color: #e5e5e5; }
-            .stats { display: flex; gap: 20px; margin-bottom: 30px; }
-            .stat-box { background: #1a1a1a; padding: 20px; border-radius: 8px; flex: 1; border: 1px solid #2a2a2a; }
-            .stat-number { font-size: 2em; color: #00d4ff; }
-            h2 { color: #00d4ff; border-bottom: 1px solid #2a2a2a; padding-bottom: 10px; }
-            table { width: 100%; border-collapse: collapse; margin-top: 20px; }
-            th { text-align: left; padding: 10px; background: #1a1a1a; color: #00d4ff; }
-            td { padding: 10px; border-bottom: 1px solid #2a2a2a; }
-            .emergency { color: #ff6b35; font-weight: bold; }
-            .routine { color: #10b981; }
-            .refresh { float: right; background: #00d4ff; color: #0a0a0a; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer; }
-        </style>
-    </head>
-    <body>
-        <h1>📞 Revenue Rescue Dashboard</h1>
-        <button class="refresh" onclick="location.reload()">Refresh</button>
-        
-        <div class="stats">
-            <div class="stat-box">
-                <div class="stat-number">''' + str(calls_today) + '''</div>
-                <div>Calls Today</div>
-            </div>
-            <div class="stat-box">
-                <div class="stat-number" style="color: #ff6b35;">''' + str(emergencies_today) + '''</div>
-                <div>Emergencies</div>
-            </div>
-            <div class="stat-box">
-                <div class="stat-number" style="color: #f7931e;">''' + str(pending_count) + '''</div>
-                <div>Pending Appointments</div>
-            </div>
-        </div>
-        
-        <h2>🚨 Recent Calls (Today)</h2>
-        <table>
-            <tr>
-                <th>Time</th>
-                <th>Customer</th>
-                <th>Phone</th>
-                <th>Type</th>
-                <th>Booking</th>
-                <th>Status</th>
-            </tr>
-    '''
-    
-    for call in today_calls:
-        call_id, timestamp, business_id, phone, name, transcript, issue_type, is_emergency, booking_req, booking_conf, tech_notified, duration, status, raw = call
-        time_str = timestamp.split('T')[1][:5] if 'T' in timestamp else timestamp
-        type_class = 'emergency' if is_emergency else 'routine'
-        type_label = '🔴 EMERGENCY' if is_emergency else '🟢 Routine'
-        booking_status = '✅ Yes' if booking_req else '❌ No'
-        
-        html += f'''
-            <tr>
-                <td>{time_str}</td>
-                <td>{name or 'Unknown'}</td>
-                <td>{phone or 'N/A'}</td>
-                <td class="{type_class}">{type_label}</td>
-                <td>{booking_status}</td>
-                <td>{status}</td>
-            </tr>
-        '''
-    
-    if not today_calls:
-        html += '<tr><td colspan="6" style="text-align: center; padding: 20px;">No calls today yet</td></tr>'
-    
-    html += '''
-        </table>
-        
-        <h2 style="margin-top: 40px;">📅 Pending Appointments</h2>
-    '''
-    
-    if pending_appointments:
-        html += '''
-        <table>
-            <tr>
-                <th>Customer</th>
-                <th>Phone</th>
-                <th>Address</th>
-                <th>Issue</th>
-                <th>Date/Time</th>
-            </tr>
-        '''
-        for appt in pending_appointments:
-            html += f'''
-                <tr>
-                    <td>{appt[2] or 'Unknown'}</td>
-                    <td>{appt[3] or 'N/A'}</td>
-                    <td>{appt[4] or 'N/A'}</td>
-                    <td>{appt[5] or 'N/A'}</td>
-                    <td>{appt[6] or 'TBD'} {appt[7] or ''}</td>
-                </tr>
-            '''
-        html += '</table>'
-    else:
-        html += '<p style="text-align: center; padding: 20px;">No pending appointments</p>'
-    
-    html += '''
-    </body>
-    </html>
-    '''
-    
-    return html
+    # Today's calls from the recent-calls buffer when it covers them, else a
+    # timestamp range the indexes of the business's database can seek to
+    business_id, start, end = today
+    window = {'business_id': business_id, 'since': start, 'until': end}
+    today_calls = HOT_CALLS.page(window, limit=20)
+    calls_today = HOT_CALLS.count(window)
+    emergencies_today = HOT_CALLS.count({**window, 'is_emergency': 1})
+    if None in (today_calls, calls_today, emergencies_today):
+        def read(t):
+            return (
+                t.execute(queries.RECENT_CALLS, today).fetchall() if today_calls is None else today_calls,
+                t.execute(queries.COUNT_CALLS, today).fetchone()[0] if calls_today is None else calls_today,
+                t.execute(queries.COUNT_EMERGENCIES, today).fetchone()[0] if emergencies_today is None
+                else emergencies_today,
+            )
+        today_calls, calls_today, emergencies_today = TENANT_DBS.read(business_id, read, ([], 0, 0))
+    
+    return DASHBOARD_TEMPLATE.render(
+        business_id=business_id,
+        day=start[:10],
+        last_event_id=last_event_id,
+        today_calls=today_calls,
+        pending_appointments=c.execute(queries.PENDING_APPOINTMENTS).fetchall(),
+        calls_today=calls_today,
+        emergencies_today=emergencies_today,
+        pending_count=c.execute(queries.COUNT_PENDING_APPOINTMENTS).fetchone()[0],
+    )
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+def call_filters(args):
+    """queries.calls_page filters from the query string; ValueError on bad input"""
+    filters = {}
+    for name in ('business_id', 'issue_type'):
+        if args.get(name):
+            filters[name] = args[name]
+    for name in ('since', 'until'):
+        if args.get(name):
+            # Same ISO form as calls.timestamp, so the range compares correctly
+            filters[name] = datetime.fromisoformat(args[name]).isoformat()
+    if args.get('is_emergency'):
+        flag = args['is_emergency'].lower()
+        if flag not in TRUE_VALUES + FALSE_VALUES:
+            raise ValueError(f"is_emergency must be true or false, not {args['is_emergency']!r}")
+        filters['is_emergency'] = 1 if flag in TRUE_VALUES else 0
+    if 'business_id' in filters:
+        TENANT_DBS.path(filters['business_id'])  # ValueError if it cannot be a tenant
+    return filters
+
+def tenant_scope(filters):
+    """business_ids a read covers: the filtered one, or every tenant with a database"""
+    return [filters['business_id']] if 'business_id' in filters else TENANT_DBS.tenants()
+
+def calls_page(filters, after, limit):
+    """
+    Partitions.page in each tenant database in scope, merged newest first.
+    A deferred call is briefly in its business's database and, as the main
+    database's placeholder, in the default one: only the first is listed.
+    """
+    wanted = limit
+    while True:
+        rows, full = [], False
+        for business_id in tenant_scope(filters):
+            store = tenant_partitions(business_id)
+            page = TENANT_DBS.read(business_id, lambda c: store.page(c, API_CALL_FIELDS, filters, after, wanted), [])
+            full = full or len(page) == wanted
+            rows += page
+        processed = {r['id'] for r in rows if not (r['status'] or '').startswith('deferred:')}
+        unique = [r for r in rows if r['id'] not in processed or not (r['status'] or '').startswith('deferred:')]
+        if len(unique) >= limit or len(unique) == len(rows) or not full:
+            break
+        wanted += len(rows) - len(unique)
+    unique.sort(key=lambda r: (r['timestamp'] or '', r['id']), reverse=True)
+    return unique[:limit]
+
+def iter_calls(filters, after, batch_size=500):
+    """Every matching call in scope, one merged keyset page at a time (exports)"""
+    while True:
+        rows = calls_page(filters, after, batch_size)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]['timestamp'], rows[-1]['id']
+
+def stream_calls(rows, fmt):
+    """Encode rows one at a time, for exports larger than memory"""
+    if fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(row)) + '\n'
+        return
+    line = io.StringIO()
+    writer = csv.writer(line)
+    writer.writerow(API_CALL_FIELDS)
+    for row in rows:
+        writer.writerow([row[f] for f in API_CALL_FIELDS])
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+    yield line.getvalue()
 
 @app.route('/api/calls', methods=['GET'])
 def api_calls():
-    """API endpoint to get all calls"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT * FROM calls ORDER BY timestamp DESC LIMIT 100')
-    calls = c.fetchall()
-    conn.close()
-    
-    return jsonify([{
-        'id': c[0],
-        'timestamp': c[1],
-        'customer_name': c[4],
-        'customer_phone': c[3],
-        'issue_type': c[6],
-        'is_emergency': c[7],
-        'booking_requested': c[8],
-        'status': c[12]
-    } for c in calls])
+    """
+    Calls, newest first, filtered by business_id, since/until (ISO, [since,
+    until)), issue_type and is_emergency. Pages of ?limit= follow the cursor
+    in the Link header; ?format=ndjson or csv streams every match instead.
+    Archived months are included (partitions.py); without a business_id,
+    every tenant's database is (tenants.py).
+    """
+    fmt = request.args.get('format', 'json')
+    try:
+        filters = call_filters(request.args)
+        cursor = request.args.get('cursor')
+        after = queries.decode_cursor(cursor) if cursor else None
+        limit = min(int(request.args.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        if limit < 1 or fmt not in ('json', 'ndjson', 'csv'):
+            raise ValueError('limit must be positive and format json, ndjson or csv')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if fmt != 'json':
+        def rows():
+            # Pages are read on the thread that writes the response
+            yield from iter_calls(filters, after)
+        return Response(stream_with_context(stream_calls(rows(), fmt)), headers={
+            'Content-Type': 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv; charset=utf-8',
+            'Content-Disposition': f'attachment; filename=calls.{fmt}',
+        })
+    
+    # One tenant's recent pages come from memory when the buffer covers them
+    calls = None
+    if 'business_id' in filters:
+        sync_recent_calls(filters['business_id'])
+        calls = HOT_CALLS.page(filters, after, limit)
+    if calls is None:
+        calls = calls_page(filters, after, limit)
+    calls = [{f: c[f] for f in API_CALL_FIELDS} for c in calls]
+    headers = {}
+    if len(calls) == limit:
+        next_cursor = queries.encode_cursor(calls[-1])
+        args = {**request.args.to_dict(), 'cursor': next_cursor}
+        headers = {'Link': f'<{request.path}?{urlencode(args)}>; rel="next"', 'X-Next-Cursor': next_cursor}
+    
+    return jsonify(calls), 200, headers
+
+@app.route('/api/calls/stream', methods=['GET'])
+def api_calls_stream():
+    """
+    Server-Sent Events: a 'call' event per committed call and an
+    'appointment' event per status change, optionally for one business_id
+    """
+    business_id = request.args.get('business_id')
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+    
+    def accept(event, data):
+        return business_id is None or event != 'call' or data['business_id'] == business_id
+    
+    return Response(LIVE_FEED.stream(last_event_id, accept), headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx/Render proxies must not buffer the stream
+    })
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+@app.route('/api/calls/search', methods=['GET'])
+def api_calls_search():
+    """
+    Transcript search: ?q= words and "quoted phrases" (all required), ranked,
+    with highlighted snippets; same business_id / since / until / issue_type /
+    is_emergency filters as /api/calls
+    """
+    try:
+        filters = call_filters(request.args)
+        limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        results = []
+        for business_id in tenant_scope(filters):
+            store = tenant_partitions(business_id)
+            results += TENANT_DBS.read(business_id, lambda c: store.search(c, request.args.get('q'), filters, limit), [])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    results.sort(key=lambda r: r['rank'], reverse=True)
+    del results[limit:]
+    
+    return jsonify({'query': request.args.get('q'), 'results': results})
+
+@app.route('/api/calls/<call_id>', methods=['GET'])
+def api_call_detail(call_id):
+    """
+    One call with its full webhook payload, decompressed on demand (archived
+    months too); ?business_id= saves looking through every tenant
+    """
+    def find(business_id):
+        def read(c):
+            with tenant_partitions(business_id).locate(c, call_id) as schema:
+                call = c.execute(
+                    f"SELECT {partitions.select_list(c, schema, CALL_COLUMNS)} FROM {schema}.calls WHERE id = ?",
+                    (call_id,)
+                ).fetchone()
+                return call and {**dict(call), 'raw_data': tenant_payloads(business_id).load(call_id, c, schema)}
+        return TENANT_DBS.read(business_id, read)
+    
+    try:
+        scope = tenant_scope(call_filters(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for business_id in scope:
+        call = find(business_id)
+        if call is not None:
+            return jsonify(call)
+    return jsonify({"error": "call not found"}), 404
+
+ANALYTICS_DAYS = 90
+
+@app.route('/api/analytics', methods=['GET'])
+def api_analytics():
+    """
+    Call volume, emergency share, booking-request rate and average duration
+    from the hourly rollups. ?since=&until= (ISO, default the last 90 days),
+    ?group_by=day,issue_type (hour, day, weekday, hour_of_day, issue_type,
+    is_emergency, booking_requested)
+    """
+    business_id = request.args.get('business_id', queries.DEFAULT_BUSINESS_ID)
+    now = datetime.now()
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') \
+            else now - timedelta(days=ANALYTICS_DAYS)
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') \
+            else now + timedelta(hours=1)
+        group_by = [g.strip() for g in request.args.get('group_by', 'day').split(',') if g.strip()]
+        # Read-only: ROLLUPS folds new calls into every tenant's rollups, and
+        # 'rollup' tells how many changes are still waiting
+        rows, state = TENANT_DBS.read(business_id, lambda c: (
+            rollups.analytics(c, business_id, since.isoformat(), until.isoformat(), group_by),
+            rollups.state(c)
+        ), ([], None))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        'business_id': business_id,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'group_by': group_by,
+        'rows': rows,
+        'rollup': state
+    })
+
+@app.route('/api/customers/<phone>', methods=['GET'])
+def api_customer(phone):
+    """
+    A customer's calls (and profile) with one business_id, appointments and
+    SMS thread, by normalized phone
+    """
+    e164 = normalize_phone(phone)
+    if e164 is None:
+        return jsonify({"error": "invalid phone number"}), 400
+    business_id = request.args.get('business_id', queries.DEFAULT_BUSINESS_ID)
+    
+    try:
+        calls, profile = TENANT_DBS.read(business_id, lambda t: (
+            t.execute(f'''
+                SELECT {', '.join(API_CALL_FIELDS)} FROM calls
+                WHERE customer_phone_e164 = ? ORDER BY timestamp DESC LIMIT 100
+            ''', (e164,)).fetchall(),
+            customer_profiles.get_profile(t, e164)
+        ), ([], None))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Appointments and SMS are kept in the main database only
+    c = storage.get_connection(DB_PATH)
+    appointments = c.execute('''
+        SELECT * FROM appointments
+        WHERE customer_phone_e164 = ? ORDER BY created_at DESC LIMIT 100
+    ''', (e164,)).fetchall()
+    # Both directions of the thread, each side from its own index
+    sms = c.execute('''
+        SELECT * FROM (
+            SELECT * FROM sms_log WHERE from_number_e164 = ?
+            UNION
+            SELECT * FROM sms_log WHERE to_number_e164 = ?
+        ) ORDER BY timestamp DESC LIMIT 200
+    ''', (e164, e164)).fetchall()
+    
+    return jsonify({
+        'phone': e164,
+        'profile': profile,
+        'calls': [dict(r) for r in calls],
+        'appointments': [dict(r) for r in appointments],
+        'sms': [dict(r) for r in sms]
+    })
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Bulk import of historical Vapi call exports
+Streams exported payloads through the same parsing as vapi_webhook and writes
+them with executemany in large transactions, with secondary indexes dropped
+for the duration of the load. Progress is checkpointed in the database in the
+same transaction as the rows, so an interrupted import resumes where it
+stopped.
+
+Usage:
+    python backfill.py exports/*.json
+    python backfill.py exports/ --batch 20000
+    python backfill.py exports/ --keep-indexes   # server is taking traffic
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Sequence
+
+import storage
+
+_DECODER = json.JSONDecoder()
+
+
+def iter_json(path: Path, chunk_size: int = 1 << 20) -> Iterator:
+    """Stream values from a JSON array, JSON lines or concatenated objects"""
+    buffer, pos = '', 0
+    with open(path, encoding='utf-8') as f:
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,[]':
+                pos += 1
+            if pos >= len(buffer) - 1 and not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if pos >= len(buffer):
+                return
+            try:
+                value, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield value
+            pos = end
+
+
+def _parse_iso(value) -> float:
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def to_webhook(item: dict):
+    """
+    (payload, received_at) for one exported item.
+
+    Exports hold either webhook envelopes ({'message': ..., 'call': ...}) or
+    bare call objects from the Vapi calls API, which are wrapped into an
+    end-of-call report.
+    """
+    if 'message' in item:
+        call = item.get('call', {})
+        data = item
+    else:
+        call = item
+        transcript = item.get('transcript') or item.get('artifact', {}).get('transcript', '')
+        message = {'type': 'end-of-call-report', 'transcript': transcript}
+        if item.get('startedAt') and item.get('endedAt'):
+            message['duration'] = round(_parse_iso(item['endedAt']) - _parse_iso(item['startedAt']))
+        data = {'message': message, 'call': call}
+
+    for stamp in (call.get('endedAt'), call.get('createdAt')):
+        if stamp:
+            try:
+                return data, _parse_iso(stamp)
+            except ValueError:
+                pass
+    timestamp = data.get('message', {}).get('timestamp')
+    if isinstance(timestamp, (int, float)):
+        return data, timestamp / 1000 if timestamp > 1e11 else timestamp
+    return data, time.time()
+
+
+def export_files(paths: Iterable[str]) -> List[Path]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.suffix in ('.json', '.jsonl')))
+        else:
+            files.append(path)
+    return files
+
+
+def init_schema(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            path TEXT PRIMARY KEY,
+            items INTEGER,
+            done BOOLEAN,
+            updated_at TEXT
+        )
+    ''')
+    # Definitions of indexes dropped for a load, restored even after a crash
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_dropped_indexes (
+            name TEXT PRIMARY KEY,
+            sql TEXT
+        )
+    ''')
+
+
+def drop_indexes(db_path, tables: Sequence[str]) -> int:
+    """Drop the secondary indexes of tables, remembering how to rebuild them"""
+    with storage.transaction(db_path) as c:
+        rows = c.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL
+              AND tbl_name IN ({', '.join('?' * len(tables))})
+        ''', tuple(tables)).fetchall()
+        for name, sql in rows:
+            c.execute('INSERT OR REPLACE INTO backfill_dropped_indexes VALUES (?, ?)', (name, sql))
+            c.execute(f'DROP INDEX "{name}"')
+    return len(rows)
+
+
+def rebuild_indexes(db_path) -> int:
+    c = storage.get_connection(db_path)
+    rows = c.execute('SELECT name, sql FROM backfill_dropped_indexes').fetchall()
+    for name, sql in rows:
+        # One index per transaction keeps each rebuild's write lock short
+        with storage.transaction(db_path) as t:
+            t.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)
+                      .replace('CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX IF NOT EXISTS', 1))
+            t.execute('DELETE FROM backfill_dropped_indexes WHERE name = ?', (name,))
+    return len(rows)
+
+
+def _commit(db_path, write, key: str, pending: list, items: int, done: bool) -> int:
+    """Write a batch and advance the file's checkpoint in one transaction"""
+    with storage.transaction(db_path) as c:
+        if pending:
+            write(c, pending)
+        c.execute('''
+            INSERT OR REPLACE INTO backfill_checkpoints VALUES (?, ?, ?, datetime('now'))
+        ''', (key, items, done))
+    written = len(pending)
+    pending.clear()
+    return written
+
+
+def backfill(db_path, paths: Iterable[str], build: Callable, write: Callable,
+             batch_size: int = 10000, tables: Sequence[str] = ('calls',),
+             drop: bool = True, report_every: float = 5.0) -> dict:
+    """
+    Import every export file under paths.
+
+    build(data, received_at) returns a row (or None to skip it), write(conn,
+    rows) persists a batch; both are the ones vapi_webhook and replay.py use.
+    """
+    with storage.transaction(db_path) as c:
+        init_schema(c)
+    conn = storage.get_connection(db_path)
+    checkpoints = {path: (items, done) for path, items, done in
+                   conn.execute('SELECT path, items, done FROM backfill_checkpoints')}
+
+    stats = {'files': 0, 'read': 0, 'written': 0, 'skipped': 0, 'errors': 0, 'resumed': 0}
+    started = last_report = time.time()
+    stats['indexes_dropped'] = drop_indexes(db_path, tables) if drop else 0
+    try:
+        for path in export_files(paths):
+            key = str(path.resolve())
+            done_items, done = checkpoints.get(key, (0, False))
+            if done:
+                continue
+            stats['files'] += 1
+            stats['resumed'] += done_items
+            pending, items = [], 0
+            for item in iter_json(path):
+                items += 1
+                if items <= done_items:
+                    continue
+                stats['read'] += 1
+                try:
+                    row = build(*to_webhook(item))
+                except (AttributeError, TypeError, ValueError) as e:
+                    stats['errors'] += 1
+                    print(f"⚠️ {path.name} item {items}: {e}")
+                    continue
+                if row is None:
+                    stats['skipped'] += 1
+                    continue
+                pending.append(row)
+                if len(pending) >= batch_size:
+                    stats['written'] += _commit(db_path, write, key, pending, items, False)
+                    if time.time() - last_report >= report_every:
+                        last_report = time.time()
+                        print(f"   {stats['written']} rows, "
+                              f"{stats['written'] / (last_report - started):.0f} rows/s")
+            stats['written'] += _commit(db_path, write, key, pending, items, True)
+    finally:
+        stats['load_seconds'] = round(time.time() - started, 2)
+        rebuild_started = time.time()
+        stats['indexes_rebuilt'] = rebuild_indexes(db_path)
+        stats['index_seconds'] = round(time.time() - rebuild_started, 2)
+    stats['rows_per_sec'] = round(stats['written'] / max(stats['load_seconds'], 1e-6))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import historical Vapi call exports')
+    parser.add_argument('paths', nargs='+', help='Export files (.json/.jsonl) or directories')
+    parser.add_argument('--batch', type=int, default=10000, help='Rows per transaction')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='Do not drop secondary indexes during the load')
+    parser.add_argument('--restart', action='store_true', help='Forget checkpoints and import everything')
+    args = parser.parse_args()
+
+    # Imported here so `python backfill.py --help` does not open the database
+    from app import DB_PATH, INGESTORS
+
+    if args.restart:
+        with storage.transaction(DB_PATH) as c:
+            init_schema(c)
+            c.execute('DELETE FROM backfill_checkpoints')
+
+    _, build, write = INGESTORS['vapi']
+    stats = backfill(DB_PATH, args.paths, build, write, batch_size=args.batch,
+                     tables=('calls', 'call_payloads'), drop=not args.keep_indexes)
+
+    print(f"✅ Imported {stats['written']} calls in {stats['load_seconds']:.1f}s "
+          f"({stats['rows_per_sec']} rows/s), rebuilt {stats['indexes_rebuilt']} indexes "
+          f"in {stats['index_seconds']:.1f}s")
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ Revenue Rescue Campaign Runner
 Automated email campaign system with engagement tracking
 """
 
-import sqlite3
+import sys
 import csv
 import json
 import yaml
@@ -23,6 +23,9 @@ from typing import Dict, List, Optional
 import requests
 from jinja2 import Template
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+
 # Load configuration
 CONFIG_PATH = Path(__file__).parent / "config.yaml"
 with open(CONFIG_PATH) as f:
@@ -33,9 +36,13 @@ DB_PATH = Path(__file__).parent / CONFIG['database']['path']
 
 def init_database():
     """Initialize SQLite database with campaign tracking schema"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    with storage.transaction(DB_PATH) as conn:
+        _create_tables(conn.cursor())
+    print("✓ Database initialized")
+
+
+def _create_tables(cursor):
+    """Create campaign tracking tables on an open transaction"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS campaigns (
             id TEXT PRIMARY KEY,
@@ -103,10 +110,6 @@ def init_database():
             sentiment_negative INTEGER DEFAULT 0
         )
     ''')
-    
-    conn.commit()
-    conn.close()
-    print("✓ Database initialized")
 
 
 def generate_campaign_id(lead_email: str) -> str:
@@ -242,13 +245,10 @@ def send_campaign_email(lead: Dict, campaign_id: str, email_num: int) -> bool:
     
     if success and not CONFIG['campaign'].get('dry_run', True):
         # Update database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
         column = f"email_{email_num}_sent_at"
-        cursor.execute(f"UPDATE campaigns SET {column} = ? WHERE id = ?", 
-                      (datetime.now(), campaign_id))
-        conn.commit()
-        conn.close()
+        with storage.transaction(DB_PATH) as conn:
+            conn.execute(f"UPDATE campaigns SET {column} = ? WHERE id = ?", 
+                         (datetime.now(), campaign_id))
     
     return success
 
@@ -257,26 +257,23 @@ def import_leads(csv_path: str, limit: int = 50):
     """Import leads into campaign database"""
     leads = load_leads(csv_path, limit)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     imported = 0
-    for lead in leads:
-        campaign_id = generate_campaign_id(lead['email'])
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO campaigns 
-            (id, lead_email, lead_name, business_name, industry, city, state, phone, website, priority_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (campaign_id, lead['email'], lead['name'], lead['business_name'],
-              lead['industry'], lead['city'], lead['state'], lead['phone'],
-              lead['website'], lead['priority_score']))
-        
-        if cursor.rowcount > 0:
-            imported += 1
+    with storage.transaction(DB_PATH) as conn:
+        cursor = conn.cursor()
+        for lead in leads:
+            campaign_id = generate_campaign_id(lead['email'])
+            
+            cursor.execute('''
+                INSERT OR IGNORE INTO campaigns 
+                (id, lead_email, lead_name, business_name, industry, city, state, phone, website, priority_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (campaign_id, lead['email'], lead['name'], lead['business_name'],
+                  lead['industry'], lead['city'], lead['state'], lead['phone'],
+                  lead['website'], lead['priority_score']))
+            
+            if cursor.rowcount > 0:
+                imported += 1
     
-    conn.commit()
-    conn.close()
     print(f"✓ Imported {imported} leads into campaign database")
     return imported
 
@@ -296,8 +293,7 @@ def run_campaign(csv_path: str, dry_run: bool = True):
         print("No new leads to import. Checking for pending sends...")
     
     # Get leads ready for each email
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = storage.get_connection(DB_PATH).cursor()
     
     # Email 1: Not yet sent
     cursor.execute('''
@@ -335,8 +331,6 @@ def run_campaign(csv_path: str, dry_run: bool = True):
     
     email_3_ready = cursor.fetchall()
     
-    conn.close()
-    
     print(f"\n📧 Ready to send:")
     print(f"   Email 1 (Cold Intro): {len(email_1_ready)} leads")
     print(f"   Email 2 (Follow-up):  {len(email_2_ready)} leads")
@@ -382,8 +376,7 @@ def run_campaign(csv_path: str, dry_run: bool = True):
 
 def generate_report():
     """Generate campaign performance report"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = storage.get_connection(DB_PATH).cursor()
     
     # Overall stats
     cursor.execute('''
@@ -404,7 +397,6 @@ def generate_report():
     ''')
     
     stats = cursor.fetchone()
-    conn.close()
     
     print("\n" + "=" * 60)
     print("CAMPAIGN PERFORMANCE REPORT")
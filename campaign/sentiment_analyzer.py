@@ -4,13 +4,16 @@ Sentiment Analyzer for Email Replies
 Uses OpenAI to classify reply sentiment and extract buying signals
 """
 
-import sqlite3
+import sys
 import yaml
 import json
 from pathlib import Path
 from typing import Dict, Optional
 import requests
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+
 # Load configuration
 CONFIG_PATH = Path(__file__).parent / "config.yaml"
 with open(CONFIG_PATH) as f:
@@ -121,25 +124,20 @@ def update_campaign_sentiment(campaign_id: str, reply_content: str, subject: str
     
     analysis = analyze_sentiment(reply_content, subject)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE campaigns 
-        SET sentiment_label = ?,
-            sentiment_score = ?,
-            reply_content = ?,
-            updated_at = datetime('now')
-        WHERE id = ?
-    ''', (
-        analysis['sentiment_label'],
-        analysis['sentiment_score'],
-        reply_content,
-        campaign_id
-    ))
-    
-    conn.commit()
-    conn.close()
+    with storage.transaction(DB_PATH) as conn:
+        conn.execute('''
+            UPDATE campaigns 
+            SET sentiment_label = ?,
+                sentiment_score = ?,
+                reply_content = ?,
+                updated_at = datetime('now')
+            WHERE id = ?
+        ''', (
+            analysis['sentiment_label'],
+            analysis['sentiment_score'],
+            reply_content,
+            campaign_id
+        ))
     
     print(f"✓ Updated sentiment for {campaign_id}: {analysis['sentiment_label']} (signal: {analysis['buying_signal']}/10)")
     
@@ -149,8 +147,7 @@ def update_campaign_sentiment(campaign_id: str, reply_content: str, subject: str
 def get_high_priority_leads(min_signal: int = 7) -> list:
     """Get leads with high buying signals for immediate follow-up"""
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = storage.get_connection(DB_PATH).cursor()
     
     cursor.execute('''
         SELECT id, lead_email, lead_name, business_name, sentiment_label, sentiment_score
@@ -161,7 +158,6 @@ def get_high_priority_leads(min_signal: int = 7) -> list:
     ''', (min_signal / 10,))  # Convert 0-10 scale to -1 to 1 scale
     
     leads = cursor.fetchall()
-    conn.close()
     
     return leads
 
@@ -177,20 +173,14 @@ def process_reply(campaign_id: str, from_email: str, subject: str, body: str):
     
     # Check for unsubscribe
     if analysis['sentiment_label'] == 'unsubscribe':
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE campaigns SET status = 'unsubscribed' WHERE id = ?", (campaign_id,))
-        conn.commit()
-        conn.close()
+        with storage.transaction(DB_PATH) as conn:
+            conn.execute("UPDATE campaigns SET status = 'unsubscribed' WHERE id = ?", (campaign_id,))
         print(f"   ⚠️ Lead {campaign_id} marked as unsubscribed")
     
     # Check for conversion
     if analysis['sentiment_label'] == 'interested' and analysis['buying_signal'] >= 8:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE campaigns SET status = 'converted' WHERE id = ?", (campaign_id,))
-        conn.commit()
-        conn.close()
+        with storage.transaction(DB_PATH) as conn:
+            conn.execute("UPDATE campaigns SET status = 'converted' WHERE id = ?", (campaign_id,))
         print(f"   🎯 Lead {campaign_id} marked as converted!")
     
     return analysis
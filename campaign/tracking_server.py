@@ -5,13 +5,16 @@ Handles open pixels, click tracking, and webhook endpoints
 """
 
 from flask import Flask, request, redirect, send_file, Response
-import sqlite3
+import sys
 import yaml
 import base64
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import unquote
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+
 app = Flask(__name__)
 
 # Load configuration
@@ -28,51 +31,46 @@ PIXEL_GIF = base64.b64decode(
 
 
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this thread's persistent database connection"""
+    return storage.get_connection(DB_PATH)
 
 
 def log_event(campaign_id: str, event_type: str, email_number: int = None):
     """Log tracking event to database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Log event
-        cursor.execute('''
-            INSERT INTO tracking_events (campaign_id, event_type, email_number, ip_address, user_agent)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            campaign_id,
-            event_type,
-            email_number,
-            request.remote_addr,
-            request.headers.get('User-Agent', '')[:500]
-        ))
-        
-        # Update campaign stats
-        if event_type == 'open' and email_number:
-            column = f"email_{email_number}_opened"
-            time_col = f"email_{email_number}_opened_at"
-            cursor.execute(f'''
-                UPDATE campaigns 
-                SET {column} = 1, {time_col} = datetime('now')
-                WHERE id = ? AND {column} = 0
-            ''', (campaign_id,))
+        with storage.transaction(DB_PATH) as conn:
+            cursor = conn.cursor()
             
-        elif event_type == 'click' and email_number:
-            column = f"email_{email_number}_clicked"
-            time_col = f"email_{email_number}_clicked_at"
-            cursor.execute(f'''
-                UPDATE campaigns 
-                SET {column} = 1, {time_col} = datetime('now')
-                WHERE id = ?
-            ''', (campaign_id,))
-        
-        conn.commit()
-        conn.close()
+            # Log event
+            cursor.execute('''
+                INSERT INTO tracking_events (campaign_id, event_type, email_number, ip_address, user_agent)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                campaign_id,
+                event_type,
+                email_number,
+                request.remote_addr,
+                request.headers.get('User-Agent', '')[:500]
+            ))
+            
+            # Update campaign stats
+            if event_type == 'open' and email_number:
+                column = f"email_{email_number}_opened"
+                time_col = f"email_{email_number}_opened_at"
+                cursor.execute(f'''
+                    UPDATE campaigns 
+                    SET {column} = 1, {time_col} = datetime('now')
+                    WHERE id = ? AND {column} = 0
+                ''', (campaign_id,))
+                
+            elif event_type == 'click' and email_number:
+                column = f"email_{email_number}_clicked"
+                time_col = f"email_{email_number}_clicked_at"
+                cursor.execute(f'''
+                    UPDATE campaigns 
+                    SET {column} = 1, {time_col} = datetime('now')
+                    WHERE id = ?
+                ''', (campaign_id,))
         
     except Exception as e:
         print(f"Error logging event: {e}")
@@ -105,17 +103,12 @@ def track_click(campaign_id, email_number):
 def unsubscribe(campaign_id):
     """Handle unsubscribe requests"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE campaigns 
-            SET status = 'unsubscribed', updated_at = datetime('now')
-            WHERE id = ?
-        ''', (campaign_id,))
-        
-        conn.commit()
-        conn.close()
+        with storage.transaction(DB_PATH) as conn:
+            conn.execute('''
+                UPDATE campaigns 
+                SET status = 'unsubscribed', updated_at = datetime('now')
+                WHERE id = ?
+            ''', (campaign_id,))
         
         log_event(campaign_id, 'unsubscribe')
         
@@ -217,8 +210,6 @@ def api_stats():
         
         stats['top_leads'] = top_leads
         
-        conn.close()
-        
         return stats
         
     except Exception as e:
@@ -257,7 +248,6 @@ def api_leads():
                 'status': row[10]
             })
         
-        conn.close()
         return {'leads': leads}
         
     except Exception as e:
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Running totals for /health
+metrics_counters holds one row per (metric, business_id, day), kept current by
+triggers on calls and appointments, so totals are a handful of primary-key
+reads instead of COUNT(*) over the tables. business_id '*' and day '*' are the
+all-tenant and all-time buckets.
+
+Requirement: rows are rewritten with an upsert (storage.upsert_sql), which
+fires the UPDATE triggers, so retries and deferred-call rewrites stay exact on
+any connection. INSERT OR REPLACE only fires the DELETE triggers for the
+replaced row with recursive_triggers on; storage sets it on its connections,
+but a plain sqlite3 connection without it double-counts every replaced row.
+After writes from such a connection, run verify and then rebuild.
+
+Calls moved to a monthly partition leave a row in archived_calls
+(partitions.py), which is counted the same way, so archival moves a call
+between tables without changing any total.
+
+Usage:
+    python counters.py verify     # compare every bucket with a fresh count
+    python counters.py rebuild    # recount every bucket from the tables
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import storage
+
+ALL = '*'
+
+# (metric, table, tenant column, timestamp column, flag column the row must have set)
+COUNTED = (
+    ('calls', 'calls', 'business_id', 'timestamp', None),
+    ('emergencies', 'calls', 'business_id', 'timestamp', 'is_emergency'),
+    ('appointments', 'appointments', None, 'created_at', None),
+    ('calls', 'archived_calls', 'business_id', 'timestamp', None),
+    ('emergencies', 'archived_calls', 'business_id', 'timestamp', 'is_emergency'),
+)
+
+
+def _buckets(business_id: Optional[str], day: str):
+    """(business_id, day) expressions a row counts towards"""
+    tenants = (business_id, f"'{ALL}'") if business_id else (f"'{ALL}'",)
+    return [(tenant, d) for tenant in tenants for d in (day, f"'{ALL}'")]
+
+
+def _adjust(ref: str, delta: int, table: str) -> str:
+    """Trigger statements adding delta for the row ref (NEW or OLD) of table"""
+    statements = []
+    for metric, counted, business_id, column, condition in COUNTED:
+        if counted != table:
+            continue
+        tenant = f"COALESCE({ref}.{business_id}, '')" if business_id else None
+        day = f"COALESCE(substr({ref}.{column}, 1, 10), '')"
+        for tenant_expr, day_expr in _buckets(tenant, day):
+            # WHERE is required before ON CONFLICT in INSERT ... SELECT
+            statements.append(f'''
+                INSERT INTO metrics_counters (metric, business_id, day, value)
+                SELECT '{metric}', {tenant_expr}, {day_expr}, {delta}
+                WHERE {f'{ref}.{condition}' if condition else 1}
+                ON CONFLICT(metric, business_id, day) DO UPDATE SET value = value + {delta};''')
+    return ''.join(statements)
+
+
+def _tables(c):
+    """Counted tables that exist here (archived_calls only once partitions.py created it)"""
+    present = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [table for table in dict.fromkeys(spec[1] for spec in COUNTED) if table in present]
+
+
+def _triggers(tables):
+    for table in tables:
+        # Updates to other columns (status, notes, ...) cannot move a row between buckets
+        columns = ', '.join(dict.fromkeys(
+            c for _, counted, *watched in COUNTED if counted == table for c in watched if c
+        ))
+        yield f'trg_{table}_count_insert', f'AFTER INSERT ON {table}', _adjust('NEW', 1, table)
+        yield f'trg_{table}_count_delete', f'AFTER DELETE ON {table}', _adjust('OLD', -1, table)
+        yield (f'trg_{table}_count_update', f'AFTER UPDATE OF {columns} ON {table}',
+               _adjust('OLD', -1, table) + _adjust('NEW', 1, table))
+
+
+def init_schema(c) -> bool:
+    """Create metrics_counters and its triggers; True if the table is new"""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metrics_counters'"
+    ).fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_counters (
+            metric TEXT NOT NULL,
+            business_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, business_id, day)
+        ) WITHOUT ROWID
+    ''')
+    for name, event, body in _triggers(_tables(c)):
+        c.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} FOR EACH ROW BEGIN {body} END')
+    return exists is None
+
+
+def _recount(c, target: str) -> None:
+    """Fill target (shaped like metrics_counters) with counts from the tables"""
+    tables = _tables(c)
+    for metric, table, business_id, column, condition in COUNTED:
+        if table not in tables:
+            continue
+        tenant = f"COALESCE({business_id}, '')" if business_id else None
+        day = f"COALESCE(substr({column}, 1, 10), '')"
+        for tenant_expr, day_expr in _buckets(tenant, day):
+            c.execute(f'''
+                INSERT INTO {target} (metric, business_id, day, value)
+                SELECT '{metric}', {tenant_expr}, {day_expr}, COUNT(*)
+                FROM {table} WHERE {condition or 1}
+                GROUP BY 2, 3
+                ON CONFLICT(metric, business_id, day) DO UPDATE SET value = value + excluded.value
+            ''')
+
+
+def rebuild_counters(c) -> int:
+    """Recount every bucket from the counted tables (one-shot migration)"""
+    c.execute('DELETE FROM metrics_counters')
+    _recount(c, 'metrics_counters')
+    return c.execute('SELECT COUNT(*) FROM metrics_counters').fetchone()[0]
+
+
+def verify_counters(c) -> List[Tuple[str, str, str, int, int]]:
+    """(metric, business_id, day, stored, actual) of every bucket that drifted"""
+    c.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS metrics_recount (
+            metric TEXT NOT NULL,
+            business_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (metric, business_id, day)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('DELETE FROM metrics_recount')
+    _recount(c, 'metrics_recount')
+    # Both directions: buckets missing from either side count as 0
+    drifted = c.execute('''
+        SELECT metric, business_id, day, SUM(stored), SUM(actual) FROM (
+            SELECT metric, business_id, day, value AS stored, 0 AS actual FROM metrics_counters
+            UNION ALL
+            SELECT metric, business_id, day, 0, value FROM temp.metrics_recount
+        )
+        GROUP BY 1, 2, 3 HAVING SUM(stored) != SUM(actual)
+        ORDER BY 1, 2, 3
+    ''').fetchall()
+    c.execute('DELETE FROM metrics_recount')
+    return [tuple(r) for r in drifted]
+
+
+def read_counters(c, business_id: str = ALL, day: str = ALL) -> Dict[str, int]:
+    """{metric: value} of one bucket; metrics with no rows yet are 0"""
+    counts = {metric: 0 for metric, *_ in COUNTED}
+    counts.update(c.execute(
+        'SELECT metric, value FROM metrics_counters WHERE business_id = ? AND day = ?',
+        (business_id, day),
+    ).fetchall())
+    return counts
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in ("verify", "rebuild"):
+        from app import TENANT_DBS
+        drifted_total = 0
+        for business_id in TENANT_DBS.tenants():
+            with TENANT_DBS.transaction(business_id) as conn:
+                if command == "rebuild":
+                    print(f"✅ {business_id}: rebuilt {rebuild_counters(conn)} metric counters")
+                    continue
+                drifted = verify_counters(conn)
+            drifted_total += len(drifted)
+            for metric, tenant, day, stored, actual in drifted:
+                print(f"⚠️  {business_id}: {metric} [{tenant} {day}] is {stored}, tables say {actual}")
+            if not drifted:
+                print(f"✅ {business_id}: every counter matches")
+        if drifted_total:
+            print("Run: python counters.py rebuild")
+            sys.exit(1)
+    else:
+        print("Usage: python counters.py verify|rebuild")
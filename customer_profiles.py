@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Per-customer profiles for repeat callers
+One row per normalized phone, kept current by the ingest transaction that
+writes the calls, so "returning customer / prior emergency / open
+appointment" is a primary-key lookup at call time.
+
+Usage:
+    python customer_profiles.py rebuild    # recompute every profile from calls
+"""
+
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import storage
+
+# Appointment statuses that still need a visit
+OPEN_APPOINTMENT_STATUSES = ('pending', 'confirmed')
+
+
+def init_schema(c) -> bool:
+    """Create customer_profiles; True if it did not exist yet"""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_profiles'"
+    ).fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS customer_profiles (
+            phone TEXT PRIMARY KEY,
+            first_seen TEXT,
+            last_seen TEXT,
+            call_count INTEGER DEFAULT 0,
+            emergency_count INTEGER DEFAULT 0,
+            last_issue_type TEXT,
+            open_appointment_id TEXT
+        )
+    ''')
+    return exists is None
+
+
+def apply_calls(c, call_records: Iterable[dict]) -> None:
+    """
+    Fold a batch of calls rows into the profiles, before they are written.
+
+    Call ids that are already stored (replays, deferred calls being
+    processed, upsert rewrites) first have their old row's
+    contribution taken back, so counts stay exact.
+    """
+    latest = {r['id']: r for r in call_records}  # executemany keeps the last one
+    if not latest:
+        return
+    old_rows = c.execute(f'''
+        SELECT customer_phone_e164, is_emergency FROM calls
+        WHERE id IN ({', '.join('?' * len(latest))}) AND customer_phone_e164 IS NOT NULL
+    ''', tuple(latest)).fetchall()
+
+    calls, emergencies = defaultdict(int), defaultdict(int)
+    for phone, is_emergency in old_rows:
+        calls[phone] -= 1
+        emergencies[phone] -= 1 if is_emergency else 0
+    seen = {}
+    for record in latest.values():
+        phone = record.get('customer_phone_e164')
+        if not phone:
+            continue
+        calls[phone] += 1
+        emergencies[phone] += 1 if record.get('is_emergency') else 0
+        timestamp = record['timestamp']
+        if phone in seen:
+            first, last, issue = seen[phone]
+            if timestamp >= last:
+                issue = record.get('issue_type')
+            seen[phone] = (min(first, timestamp), max(last, timestamp), issue)
+        else:
+            seen[phone] = (timestamp, timestamp, record.get('issue_type'))
+
+    c.executemany('''
+        UPDATE customer_profiles
+        SET call_count = call_count + ?, emergency_count = emergency_count + ?
+        WHERE phone = ?
+    ''', [(calls[p], emergencies[p], p) for p in calls if p not in seen])
+    # In an upsert's SET clause, bare column names are the stored row's values
+    c.executemany('''
+        INSERT INTO customer_profiles
+            (phone, first_seen, last_seen, call_count, emergency_count, last_issue_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(phone) DO UPDATE SET
+            first_seen = MIN(COALESCE(first_seen, excluded.first_seen), excluded.first_seen),
+            last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen),
+            call_count = call_count + excluded.call_count,
+            emergency_count = emergency_count + excluded.emergency_count,
+            last_issue_type = CASE WHEN excluded.last_seen >= COALESCE(last_seen, '')
+                                   THEN excluded.last_issue_type ELSE last_issue_type END
+    ''', [(p, first, last, calls[p], emergencies[p], issue) for p, (first, last, issue) in seen.items()])
+
+
+def refresh_open_appointment(c, phone: Optional[str]) -> None:
+    """Point the profile at the customer's most recent open appointment"""
+    if not phone:
+        return
+    row = c.execute(f'''
+        SELECT id FROM appointments
+        WHERE customer_phone_e164 = ? AND status IN ({', '.join('?' * len(OPEN_APPOINTMENT_STATUSES))})
+        ORDER BY created_at DESC LIMIT 1
+    ''', (phone, *OPEN_APPOINTMENT_STATUSES)).fetchone()
+    c.execute('''
+        INSERT INTO customer_profiles (phone, open_appointment_id) VALUES (?, ?)
+        ON CONFLICT(phone) DO UPDATE SET open_appointment_id = excluded.open_appointment_id
+    ''', (phone, row[0] if row else None))
+
+
+def get_profile(c, phone: Optional[str]) -> Optional[dict]:
+    if not phone:
+        return None
+    row = c.execute('SELECT * FROM customer_profiles WHERE phone = ?', (phone,)).fetchone()
+    return dict(row) if row else None
+
+
+def rebuild_profiles(c) -> int:
+    """Recompute every profile from calls and appointments (one-shot migration)"""
+    c.execute('DELETE FROM customer_profiles')
+    c.execute('''
+        INSERT INTO customer_profiles
+            (phone, first_seen, last_seen, call_count, emergency_count, last_issue_type)
+        SELECT customer_phone_e164, MIN(timestamp), MAX(timestamp), COUNT(*),
+               SUM(CASE WHEN is_emergency THEN 1 ELSE 0 END),
+               (SELECT issue_type FROM calls l
+                WHERE l.customer_phone_e164 = calls.customer_phone_e164
+                ORDER BY timestamp DESC LIMIT 1)
+        FROM calls
+        WHERE customer_phone_e164 IS NOT NULL
+        GROUP BY customer_phone_e164
+    ''')
+    phones = [r[0] for r in c.execute(f'''
+        SELECT DISTINCT customer_phone_e164 FROM appointments
+        WHERE customer_phone_e164 IS NOT NULL
+          AND status IN ({', '.join('?' * len(OPEN_APPOINTMENT_STATUSES))})
+    ''', OPEN_APPOINTMENT_STATUSES)]
+    for phone in phones:
+        refresh_open_appointment(c, phone)
+    return c.execute('SELECT COUNT(*) FROM customer_profiles').fetchone()[0]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        from app import DB_PATH
+        with storage.transaction(DB_PATH) as conn:
+            print(f"✅ Rebuilt {rebuild_profiles(conn)} customer profiles")
+    else:
+        print("Usage: python customer_profiles.py rebuild")
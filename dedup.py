@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Idempotent webhook dedup cache
+Bounded TTL/LRU set of seen webhook keys with a persistent SQLite fallback,
+so Vapi retries are dropped before they reach classification or alerting
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import storage
+from write_queue import WriteBehindQueue
+
+
+def webhook_key(call_id: str, message_type: str, body: bytes) -> str:
+    """Key a webhook by call id, message type and payload hash"""
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return f'{call_id}:{message_type}:{digest}'
+
+
+class DedupCache:
+    """
+    In-memory LRU with per-entry TTL, backed by a webhook_dedup table.
+
+    claim(key) is the only hot-path call: a memory hit costs one dict
+    lookup; a miss checks the table (primary key lookup) so retries that
+    land on another worker or after a restart are still caught. New keys
+    are persisted through a write-behind queue, never on the request path.
+    """
+
+    def __init__(self, db_path, max_entries: int = 50000, ttl: float = 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'persistent_hits': 0, 'misses': 0}
+        self._entries: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._writer = WriteBehindQueue(db_path, self._persist, max_batch_size=500,
+                                        max_flush_delay=0.2, name='dedup-writer')
+        self._last_prune = 0.0
+        with storage.transaction(db_path) as c:
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_dedup (
+                    key TEXT PRIMARY KEY,
+                    seen_at REAL
+                ) WITHOUT ROWID
+            ''')
+
+    def _persist(self, c, entries):
+        c.executemany('INSERT OR IGNORE INTO webhook_dedup (key, seen_at) VALUES (?, ?)', entries)
+        now = time.time()
+        if now - self._last_prune > 600:
+            self._last_prune = now
+            c.execute('DELETE FROM webhook_dedup WHERE seen_at < ?', (now - self.ttl,))
+
+    def _remember(self, key: str, seen_at: float):
+        self._entries[key] = seen_at
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def claim(self, key: str) -> bool:
+        """True if key is new (caller should process), False for a duplicate"""
+        now = time.time()
+        with self._lock:
+            seen_at = self._entries.get(key)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return False
+
+            row = storage.get_connection(self.db_path).execute(
+                'SELECT seen_at FROM webhook_dedup WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and now - row[0] < self.ttl:
+                self._remember(key, row[0])
+                self.stats['persistent_hits'] += 1
+                return False
+
+            self._remember(key, now)
+            self.stats['misses'] += 1
+        self._writer.put((key, now))
+        return True
+
+    def release(self, key: str) -> None:
+        """Forget a claimed key whose processing failed, so a retry is accepted"""
+        with self._lock:
+            self._entries.pop(key, None)
+        self._writer.flush(timeout=5)
+        with storage.transaction(self.db_path) as c:
+            c.execute('DELETE FROM webhook_dedup WHERE key = ?', (key,))
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        self._writer.stop(timeout)
+
+    def metrics(self) -> dict:
+        return {'entries': len(self._entries), **self.stats}
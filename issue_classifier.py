@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Multi-label issue taxonomy classifier
+Hashed word uni/bigram features and a one-vs-rest logistic model in NumPy.
+One call scores in microseconds; a batch of transcripts scores as a single
+sparse x dense product.
+
+Usage:
+    python issue_classifier.py train --labels labels.csv   # call_id,labels (';'-separated)
+    python issue_classifier.py train --weak                # bootstrap from SEED_PHRASES
+    python issue_classifier.py score [--all]               # label calls stored before the model
+    python issue_classifier.py bench [words]
+"""
+
+import os
+import time
+import zlib
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import storage
+from transcript_analyzer import _PUNCTUATION, TokenAutomaton, tokenize
+
+LABELS = ('no_heat', 'no_cooling', 'leak', 'gas_co', 'electrical', 'maintenance')
+
+# How urgent each label is when present, for ranking severity
+SEVERITY = np.array([0.7, 0.6, 0.6, 1.0, 0.8, 0.0], dtype=np.float32)
+
+# Weak supervision for bootstrapping a model before anyone has labeled calls
+SEED_PHRASES = {
+    'no_heat': ['no heat', 'no heating', 'furnace is out', 'furnace not working', 'heater stopped',
+                'furnace stopped', 'freezing in here', 'blowing cold air', 'pilot light'],
+    'no_cooling': ['no ac', 'no air', 'ac not working', 'ac stopped', 'not cooling',
+                   'blowing warm air', 'blowing hot air', 'house is hot'],
+    'leak': ['leaking', 'leak', 'leaks', 'water on the floor', 'dripping', 'puddle', 'flooding'],
+    'gas_co': ['gas smell', 'smell gas', 'gas leak', 'carbon monoxide', 'co detector',
+               'co alarm', 'rotten eggs'],
+    'electrical': ['breaker', 'sparks', 'sparking', 'burning smell', 'smoke', 'tripping',
+                   'electrical', 'outlet'],
+    'maintenance': ['tune up', 'tune-up', 'maintenance', 'annual service', 'inspection',
+                    'filter change', 'check up', 'checkup', 'quote', 'estimate'],
+}
+
+MODEL_PATH = os.environ.get('ISSUE_MODEL_PATH', '/tmp/revenue_rescue_issue_model.npz')
+
+_MIX = 1000003
+
+# Byte-level tokenizer: same word boundaries as transcript_analyzer.tokenize
+# for ASCII, at twice the speed, and crc32 hashes the bytes directly
+_BYTE_TABLE = bytes(
+    32 if chr(b) in _PUNCTUATION or chr(b).isspace() else b for b in range(256)
+)
+
+
+def byte_tokens(text: Optional[str]) -> List[bytes]:
+    return (text or '').lower().encode('utf-8').translate(_BYTE_TABLE).split()
+
+
+class _HashCache(dict):
+    """token -> crc32, computed on first lookup; lookups stay in C"""
+
+    def __missing__(self, token: bytes) -> int:
+        if len(self) > 200000:
+            self.clear()
+        h = self[token] = zlib.crc32(token)
+        return h
+
+
+class Features:
+    """Hashes word unigrams and bigrams into a fixed number of buckets"""
+
+    def __init__(self, dim: int = 1 << 18):
+        assert dim & (dim - 1) == 0, 'dim must be a power of two'
+        self.dim = dim
+        self._cache = _HashCache()
+
+    def _hashes(self, tokens: List[bytes]) -> np.ndarray:
+        return np.fromiter(map(self._cache.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+    def indices(self, text: Optional[str]) -> np.ndarray:
+        """Feature bucket of every n-gram of one transcript (repeats count as term frequency)"""
+        tokens = byte_tokens(text)
+        if not tokens:
+            return np.empty(0, dtype=np.int64)
+        unigrams = self._hashes(tokens)
+        bigrams = (unigrams[:-1] * _MIX) ^ unigrams[1:]
+        return np.concatenate((unigrams, bigrams)) & (self.dim - 1)
+
+    def matrix(self, texts: Iterable[Optional[str]]):
+        """
+        (n, row ids, column ids, row norms) of a batch in coordinate form;
+        every entry of row i has value norms[i]. The whole batch is hashed in
+        one pass, not per text.
+        """
+        token_lists = [byte_tokens(text) for text in texts]
+        n = len(token_lists)
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=n)
+        unigrams = self._hashes(list(chain.from_iterable(token_lists)))
+        token_rows = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        # Bigrams never span two transcripts
+        same_text = token_rows[:-1] == token_rows[1:]
+        bigrams = ((unigrams[:-1] * _MIX) ^ unigrams[1:])[same_text]
+        rows = np.concatenate((token_rows, token_rows[:-1][same_text]))
+        cols = np.concatenate((unigrams, bigrams)) & (self.dim - 1)
+        norms = 1 / np.sqrt(np.maximum(np.bincount(rows, minlength=n), 1))
+        return n, rows, cols, norms
+
+
+class IssueClassifier:
+    """One-vs-rest logistic regression over hashed n-grams"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: Sequence[str] = LABELS,
+                 threshold: float = 0.5):
+        self.weights = weights.astype(np.float32)   # (dim, labels)
+        self.bias = bias.astype(np.float32)         # (labels,)
+        self.labels = tuple(labels)
+        self.threshold = threshold
+        self.features = Features(weights.shape[0])
+
+    def predict_proba(self, text: Optional[str]) -> np.ndarray:
+        """Per-label probabilities for one transcript"""
+        idx = self.features.indices(text)
+        z = self.bias.copy()
+        if len(idx):
+            z += self.weights[idx].sum(axis=0) / np.sqrt(len(idx))
+        return 1 / (1 + np.exp(-z))
+
+    def predict_batch(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        """(n, labels) probabilities; X @ W computed as one bincount per label"""
+        n, rows, cols, norms = self.features.matrix(texts)
+        return 1 / (1 + np.exp(-_sparse_dot(n, rows, cols, norms, self.weights, self.bias)))
+
+    def predict(self, text: Optional[str]) -> List[str]:
+        probs = self.predict_proba(text)
+        return [label for label, p in zip(self.labels, probs) if p >= self.threshold]
+
+    def severity(self, probs: np.ndarray) -> float:
+        """0 (routine) .. 1 (gas/CO) for ranking calls"""
+        return float((probs * SEVERITY[:len(probs)]).max()) if len(probs) else 0.0
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            labels=np.array(self.labels), threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'IssueClassifier':
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], [str(l) for l in data['labels']],
+                       float(data['threshold']))
+
+    @classmethod
+    def fit(cls, texts: Sequence[Optional[str]], targets: np.ndarray, dim: int = 1 << 18,
+            epochs: int = 150, lr: float = 0.1, l2: float = 1e-6) -> 'IssueClassifier':
+        """Full-batch Adam on the logistic loss; targets is an (n, labels) 0/1 matrix"""
+        n, rows, cols, norms = Features(dim).matrix(texts)
+        values = norms[rows]
+        targets = np.asarray(targets, dtype=np.float32)
+        labels = targets.shape[1]
+        weights = np.zeros((dim, labels), dtype=np.float32)
+        bias = np.zeros(labels, dtype=np.float32)
+        m_w, v_w = np.zeros_like(weights), np.zeros_like(weights)
+        m_b, v_b = np.zeros_like(bias), np.zeros_like(bias)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            probs = 1 / (1 + np.exp(-_sparse_dot(n, rows, cols, norms, weights, bias)))
+            error = (probs - targets) / n
+            grad_w = np.stack([
+                np.bincount(cols, weights=values * error[rows, k], minlength=dim)
+                for k in range(labels)
+            ], axis=1).astype(np.float32) + l2 * weights
+            grad_b = error.sum(axis=0)
+            for param, grad, m, v in ((weights, grad_w, m_w, v_w), (bias, grad_b, m_b, v_b)):
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad * grad
+                param -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+        return cls(weights, bias)
+
+
+def _sparse_dot(n, rows, cols, norms, weights, bias) -> np.ndarray:
+    """Logits of a coordinate-form batch against (dim, labels) weights"""
+    by_label = np.ascontiguousarray(weights.T)  # contiguous gathers per label
+    out = np.stack([
+        np.bincount(rows, weights=by_label[k][cols], minlength=n)
+        for k in range(weights.shape[1])
+    ], axis=1)
+    return (out * norms[:, None] + bias).astype(np.float32)
+
+
+_SEEDS = TokenAutomaton((phrase, label) for label, phrases in SEED_PHRASES.items() for phrase in phrases)
+
+
+def weak_labels(text: Optional[str]) -> np.ndarray:
+    """0/1 label vector from SEED_PHRASES, for bootstrapping"""
+    target = np.zeros(len(LABELS), dtype=np.float32)
+    state = 0
+    for token in tokenize((text or '').lower()):
+        state = _SEEDS.step(state, token)
+        for _, _, label in _SEEDS.out[state]:
+            target[LABELS.index(label)] = 1
+    return target
+
+
+def init_schema(c) -> None:
+    """Predicted labels and severity live next to issue_type on calls"""
+    existing = {row[1] for row in c.execute('PRAGMA table_info(calls)')}
+    for column, kind in (('issue_labels', 'TEXT'), ('severity', 'REAL')):
+        if column not in existing:
+            c.execute(f'ALTER TABLE calls ADD COLUMN {column} {kind}')
+
+
+def score_calls(db_path, model: IssueClassifier, batch_size: int = 2000, rescore: bool = False) -> int:
+    """
+    Write issue_labels and severity for calls in db_path that have none (every
+    call with rescore), batch_size rows per predict_batch and per transaction
+    """
+    scored, last = 0, 0
+    while True:
+        rows = storage.get_connection(db_path).execute('''
+            SELECT rowid, transcript FROM calls
+            WHERE rowid > ? AND (? OR issue_labels IS NULL)
+            ORDER BY rowid LIMIT ?
+        ''', (last, rescore, batch_size)).fetchall()
+        if not rows:
+            return scored
+        probs = model.predict_batch(row[1] for row in rows)
+        hits = probs >= model.threshold
+        severities = (probs * SEVERITY[:probs.shape[1]]).max(axis=1)  # severity() of every row
+        with storage.transaction(db_path) as c:
+            c.executemany('UPDATE calls SET issue_labels = ?, severity = ? WHERE rowid = ?', [
+                (','.join(label for label, hit in zip(model.labels, row_hits) if hit),
+                 round(float(severity), 3), row[0])
+                for row, row_hits, severity in zip(rows, hits, severities)
+            ])
+        scored += len(rows)
+        last = rows[-1][0]
+
+
+def load_model(path: str = MODEL_PATH) -> Optional[IssueClassifier]:
+    """The trained model, or None if none has been trained yet"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return IssueClassifier.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"⚠️ Issue model at {path} unreadable: {e}")
+        return None
+
+
+def read_label_file(path: str) -> Dict[str, np.ndarray]:
+    """call_id,labels CSV; labels are ';'-separated LABELS names"""
+    import csv
+    targets = {}
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0] == 'call_id':
+                continue
+            target = np.zeros(len(LABELS), dtype=np.float32)
+            for label in filter(None, (l.strip() for l in (row[1] if len(row) > 1 else '').split(';'))):
+                target[LABELS.index(label)] = 1
+            targets[row[0]] = target
+    return targets
+
+
+def benchmark(words: int = 300, runs: int = 2000, batch: int = 5000):
+    """Single-call latency and batch throughput against the keyword scan"""
+    import random
+    from transcript_analyzer import EMERGENCY_KEYWORDS, analyze_transcript
+
+    rng = random.Random(7)
+    vocabulary = ('the unit is making a noise and the thermostat says cool but the house '
+                  'stays warm can you check the filter tomorrow morning thanks').split()
+    texts = [' '.join(rng.choice(vocabulary) for _ in range(words)) for _ in range(64)]
+    seeds = [p for phrases in SEED_PHRASES.values() for p in phrases]
+    train = [f'{t} {rng.choice(seeds)}' for t in texts * 4]
+    model = IssueClassifier.fit(train, np.stack([weak_labels(t) for t in train]), epochs=30)
+
+    def per_call(fn):
+        fn(texts[0])
+        started = time.perf_counter()
+        for i in range(runs):
+            fn(texts[i % len(texts)])
+        return (time.perf_counter() - started) / runs
+
+    results = {
+        'substring scan': per_call(lambda t: any(k in t.lower() for k in EMERGENCY_KEYWORDS)),
+        'token analyzer': per_call(analyze_transcript),
+        'classifier': per_call(model.predict_proba),
+    }
+    history = [texts[i % len(texts)] for i in range(batch)]
+    started = time.perf_counter()
+    model.predict_batch(history)
+    batch_seconds = time.perf_counter() - started
+
+    print(f"Transcripts of {words} words")
+    for name, seconds in results.items():
+        print(f"  {name:<15} {seconds * 1e6:8.1f} us/call")
+    print(f"  batch of {batch}: {batch_seconds * 1000:.0f} ms ({batch / batch_seconds:,.0f} calls/s)")
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Issue taxonomy classifier')
+    sub = parser.add_subparsers(dest='command', required=True)
+    train = sub.add_parser('train', help='Train on labeled calls.transcript rows')
+    train.add_argument('--labels', help='CSV of call_id,labels')
+    train.add_argument('--weak', action='store_true', help='Label unlabeled calls from SEED_PHRASES')
+    train.add_argument('--epochs', type=int, default=150)
+    train.add_argument('--out', default=MODEL_PATH)
+    score = sub.add_parser('score', help='Write issue_labels and severity for stored calls')
+    score.add_argument('--all', action='store_true', help='Rescore calls that already have labels')
+    score.add_argument('--model', default=MODEL_PATH)
+    score.add_argument('--batch-size', type=int, default=2000)
+    bench = sub.add_parser('bench', help='Compare against the keyword scan')
+    bench.add_argument('words', nargs='?', type=int, default=300)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.words)
+        return
+    if args.command == 'score':
+        model = load_model(args.model)
+        if model is None:
+            parser.error(f'no model at {args.model}; run train first')
+        from app import TENANT_DBS
+        started = time.time()
+        for business_id in TENANT_DBS.tenants():
+            path = TENANT_DBS.path(business_id)
+            scored = score_calls(path, model, args.batch_size, rescore=args.all)
+            storage.close_connection(path)
+            print(f"✅ {business_id}: scored {scored} calls")
+        print(f"✅ Done in {time.time() - started:.1f}s")
+        return
+    if not args.labels and not args.weak:
+        parser.error('train needs --labels and/or --weak')
+
+    # Imported here so `python issue_classifier.py bench` does not open the database
+    from app import DB_PATH
+
+    labeled = read_label_file(args.labels) if args.labels else {}
+    texts, targets = [], []
+    for call_id, transcript in storage.get_connection(DB_PATH).execute(
+            "SELECT id, transcript FROM calls WHERE transcript IS NOT NULL AND transcript != ''"):
+        if call_id in labeled:
+            targets.append(labeled[call_id])
+        elif args.weak:
+            targets.append(weak_labels(transcript))
+        else:
+            continue
+        texts.append(transcript)
+    if not texts:
+        print("⚠️ No labeled transcripts to train on")
+        return
+
+    started = time.time()
+    model = IssueClassifier.fit(texts, np.stack(targets), epochs=args.epochs)
+    predicted = model.predict_batch(texts) >= model.threshold
+    accuracy = (predicted == np.stack(targets).astype(bool)).mean(axis=0)
+    model.save(args.out)
+    print(f"✅ Trained on {len(texts)} calls in {time.time() - started:.1f}s -> {args.out}")
+    for label, acc in zip(LABELS, accuracy):
+        print(f"   {label:<12} train accuracy {acc:.3f}")
+
+
+if __name__ == "__main__":
+    main()
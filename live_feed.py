@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+In-process pub/sub for the live dashboard
+The ingest path publishes each call and appointment change after its
+transaction commits, and every /api/calls/stream subscriber gets it as a
+Server-Sent Event. A short history lets reconnecting clients resume from
+Last-Event-ID without missing anything.
+
+Only events committed by this process are seen: run a single gunicorn worker
+with threads (DEPLOY.md) so every stream shares the ingest path's process.
+"""
+
+import itertools
+import json
+import queue
+import threading
+from collections import deque
+from typing import Callable, Iterator, Optional
+
+
+class Subscription:
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, max_queue: int):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+
+class LiveFeed:
+    """
+    Fan-out of (id, event, data) to bounded per-subscriber queues.
+
+    A subscriber that falls max_queue events behind is dropped rather than
+    blocking publishers (the ingest writers); its stream ends once drained
+    and the browser's EventSource reconnects, replaying from history.
+    """
+
+    def __init__(self, max_queue: int = 1000, history: int = 1000, keepalive: float = 15):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self.stats = {'published': 0, 'dropped_subscribers': 0}
+        self._history = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def publish(self, event: str, data: dict) -> int:
+        """Send data to every subscriber; call only after the write committed"""
+        with self._lock:
+            item = (next(self._ids), event, data)
+            self._history.append(item)
+            self.stats['published'] += 1
+            for sub in list(self._subscribers):
+                try:
+                    sub.queue.put_nowait(item)
+                except queue.Full:
+                    sub.overflowed = True
+                    self._subscribers.discard(sub)
+                    self.stats['dropped_subscribers'] += 1
+        return item[0]
+
+    @property
+    def last_event_id(self) -> int:
+        """Id of the newest published event (0 before the first)"""
+        with self._lock:
+            return self._history[-1][0] if self._history else 0
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """New subscription, primed with the history after last_event_id"""
+        sub = Subscription(self.max_queue)
+        with self._lock:
+            if last_event_id is not None:
+                for item in self._history:
+                    if item[0] > last_event_id and not sub.queue.full():
+                        sub.queue.put_nowait(item)
+            if self._closed:
+                sub.queue.put_nowait(None)
+            else:
+                self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self, last_event_id: Optional[int] = None,
+               accept: Callable[[str, dict], bool] = lambda event, data: True) -> Iterator[str]:
+        """text/event-stream body; comments keep idle proxies from closing it"""
+        sub = self.subscribe(last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    item = sub.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if item is None:
+                    return
+                event_id, event, data = item
+                if accept(event, data):
+                    yield f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+                if sub.overflowed and sub.queue.empty():
+                    return
+        finally:
+            self.unsubscribe(sub)
+
+    def close(self) -> None:
+        """End every open stream (shutdown)"""
+        with self._lock:
+            self._closed = True
+            for sub in self._subscribers:
+                try:
+                    sub.queue.put_nowait(None)
+                except queue.Full:
+                    sub.overflowed = True
+            self._subscribers.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'subscribers': len(self._subscribers)}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Early emergency detection on live transcripts
+Keeps a small ring buffer and incremental matcher state per active call so
+each transcript fragment is scanned exactly once, and fires a callback the
+moment a high-severity phrase shows up
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+from transcript_analyzer import ANALYZER, HIGH_SEVERITY_KEYWORDS, tokenize
+
+
+class LiveCall:
+    """Per-call matcher state and recent fragments"""
+
+    __slots__ = ('call_id', 'state', 'tokens', 'fragments', 'matches', 'alerted', 'last_seen')
+
+    def __init__(self, call_id: str, buffer_size: int):
+        self.call_id = call_id
+        self.state = 0
+        self.tokens = 0
+        self.fragments = deque(maxlen=buffer_size)
+        self.matches = []
+        self.alerted = False
+        self.last_seen = time.time()
+
+
+class LiveTranscriptTracker:
+    """
+    Bounded set of active calls, evicted LRU-first and after idle_ttl.
+
+    on_emergency(call, phrase, data) is called once per call, from the
+    request thread, when a HIGH_SEVERITY_KEYWORDS phrase is first matched.
+    """
+
+    def __init__(self, on_emergency: Callable, max_calls: int = 500,
+                 idle_ttl: float = 1800, buffer_size: int = 20):
+        self.on_emergency = on_emergency
+        self.max_calls = max_calls
+        self.idle_ttl = idle_ttl
+        self.buffer_size = buffer_size
+        self.stats = {'fragments': 0, 'alerts': 0, 'evicted': 0}
+        self._calls: 'OrderedDict[str, LiveCall]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _sweep(self, now: float):
+        """Drop calls that went quiet without an end-of-call report"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        while self._calls:
+            oldest = next(iter(self._calls.values()))
+            if now - oldest.last_seen < self.idle_ttl:
+                break
+            self._calls.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def feed(self, call_id: str, fragment: str, data: Optional[dict] = None) -> Optional[str]:
+        """Scan one final transcript fragment; returns the phrase if an alert fired"""
+        if not fragment:
+            return None
+        now = time.time()
+        lowered = tokenize(fragment.lower())
+
+        with self._lock:
+            call = self._calls.get(call_id)
+            if call is None:
+                call = LiveCall(call_id, self.buffer_size)
+                self._calls[call_id] = call
+                while len(self._calls) > self.max_calls:
+                    self._calls.popitem(last=False)
+                    self.stats['evicted'] += 1
+            else:
+                self._calls.move_to_end(call_id)
+            self._sweep(now)
+
+            hits, call.state = ANALYZER.scan(lowered, call.state, call.tokens)
+            call.tokens += len(lowered)
+            call.fragments.append(fragment)
+            call.last_seen = now
+            self.stats['fragments'] += 1
+
+            phrase = None
+            for start, end, matched, label in hits:
+                if label != 'emergency':
+                    continue
+                call.matches.append((start, end, matched))
+                if not call.alerted and matched in HIGH_SEVERITY_KEYWORDS:
+                    call.alerted = True
+                    phrase = matched
+
+        if phrase is not None:
+            self.stats['alerts'] += 1
+            self.on_emergency(call, phrase, data or {})
+        return phrase
+
+    def finish(self, call_id: str) -> Optional[LiveCall]:
+        """Forget a call at end-of-call; returns its live state if tracked"""
+        with self._lock:
+            return self._calls.pop(call_id, None)
+
+    def metrics(self) -> dict:
+        return {'active_calls': len(self._calls), **self.stats}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Rendered-page cache keyed by the database's data_version
+PRAGMA data_version changes whenever another connection commits, and reading
+it touches no table pages. It only moves for *other* connections' commits and
+its values mean nothing across connections, so it is read from one
+dedicated connection that never writes. ETags are content hashes, so they
+agree across workers and processes.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+import storage
+
+
+class VersionedPageCache:
+    def __init__(self, db_path, max_entries: int = 256):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._conn = None
+        self._pid = None
+        self._conn_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pages: Dict[Hashable, Tuple[tuple, str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> int:
+        """Current data_version; changes after any commit to the database"""
+        with self._conn_lock:
+            if self._pid != os.getpid():
+                # A forked worker gets its own connection, and the parent's
+                # pages were keyed by the parent's connection's versions
+                self._conn, self._pid = storage.open_connection(self.db_path), os.getpid()
+                with self._lock:
+                    self._pages.clear()
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, key: Hashable, render: Callable[[], str], tag: Hashable = None) -> Tuple[str, str]:
+        """
+        (etag, body) for key, calling render() only if the database changed
+        or tag did (in-memory state the page is also built from)
+        """
+        version = (self.version(), tag)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1], cached[2]
+            self.misses += 1
+
+        body = render()
+        etag = hashlib.blake2b(body.encode(), digest_size=12).hexdigest()
+        with self._lock:
+            if key not in self._pages and len(self._pages) >= self.max_entries:
+                self._pages.pop(next(iter(self._pages)))  # oldest key (yesterday's pages)
+            self._pages[key] = (version, etag, body)
+        return etag, body
+
+    def close(self) -> None:
+        with self._conn_lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = self._pid = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._pages),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Monthly call partitions
+The newest HOT_MONTHS months of calls stay in the main database; older months
+move to one SQLite file each (calls_YYYY-MM.db in the partition directory)
+holding that month's calls, call_payloads and calls_fts, so main's tables,
+indexes and VACUUMs stay the size of the hot window. Every tenant database
+(tenants.py) is partitioned the same way, into a directory of its own.
+
+Readers ATTACH the months a query's time range overlaps and read calls_all, a
+TEMP view that is a UNION ALL of main.calls and each month's calls. Ordered
+by (timestamp, id) SQLite merges the branches' index scans instead of
+sorting. A month's copy of a call is hidden while main still has that id, so
+a move in progress (or interrupted) never shows a call twice.
+
+Moving is batched: each batch is committed to the month file first and then
+deleted from main in one transaction that also records the calls in
+archived_calls, which counters.py and rollups.py aggregate alongside calls.
+A crash in between leaves the calls in main and the next run replaces the
+month's copies. Month files are compacted (FTS merge + VACUUM) once filled,
+and past the retention period their payloads are dropped.
+
+Usage:
+    python partitions.py archive    # move, compact and apply retention now, every tenant
+    python partitions.py status     # partitions and their sizes, every tenant
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import queries
+import rollups
+import storage
+import transcript_search
+
+MONTH = re.compile(r'\d{4}-\d{2}')
+
+# SQLite's default SQLITE_MAX_ATTACHED; months beyond it are read in batches
+MAX_ATTACHED = 10
+
+# Everything counters.py and rollups.py aggregate, kept for archived calls
+LEDGER_COLUMNS = rollups.ROLLED_UP_COLUMNS
+
+# Columns calls_all always exposes, so any queries.CALL_FILTERS can apply
+VIEW_COLUMNS = ('id', 'timestamp', 'business_id', 'issue_type', 'is_emergency')
+
+
+def init_schema(c) -> None:
+    """archived_calls (call -> month ledger) and call_partitions (one row per month file)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archived_calls (
+            id TEXT PRIMARY KEY,
+            month TEXT NOT NULL,
+            business_id TEXT,
+            timestamp TEXT,
+            issue_type TEXT,
+            is_emergency BOOLEAN,
+            booking_requested BOOLEAN,
+            call_duration INTEGER
+        ) WITHOUT ROWID
+    ''')
+    # Rollup buckets are recomputed per tenant and hour
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_archived_calls_business_time
+                 ON archived_calls(business_id, timestamp)''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS call_partitions (
+            month TEXT PRIMARY KEY,
+            calls INTEGER,
+            archived_at TEXT,
+            compacted_at TEXT,
+            payloads_dropped_at TEXT
+        )
+    ''')
+
+
+def month_start(month: str) -> str:
+    return f'{month}-01'
+
+
+def next_month(month: str) -> str:
+    year, number = map(int, month.split('-'))
+    return f'{year + number // 12:04d}-{number % 12 + 1:02d}'
+
+
+def months_back(today: date, months: int) -> str:
+    """The month `months` before today's ('YYYY-MM')"""
+    index = today.year * 12 + today.month - 1 - months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def schema_name(month: str) -> str:
+    return 'p_' + month.replace('-', '_')
+
+
+def _columns(c, schema: str = 'main', table: str = 'calls') -> List[str]:
+    return [r['name'] for r in c.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def select_list(c, schema: str, columns: Iterable[str]) -> str:
+    """columns of schema.calls, NULL for any a partition archived before it existed"""
+    present = set(_columns(c, schema))
+    return ', '.join(col if col in present else f'NULL AS {col}' for col in columns)
+
+
+class Partitions:
+    """Month files of one database: reads across them, archival and retention"""
+
+    def __init__(self, db_path, directory=None, hot_months: int = 1, payload_months: int = 12):
+        self.db_path = db_path
+        self.directory = Path(directory) if directory else \
+            Path(db_path).with_name(Path(db_path).stem + '_partitions')
+        self.hot_months = max(1, hot_months)
+        self.payload_months = payload_months  # 0 keeps payloads forever
+
+    def path(self, month: str) -> Path:
+        return self.directory / f'calls_{month}.db'
+
+    def months(self, c, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+        """Archived months overlapping [since, until), newest first"""
+        rows = c.execute('SELECT month FROM call_partitions ORDER BY month DESC').fetchall()
+        return [
+            month for (month,) in rows
+            if (since is None or month_start(next_month(month)) > since)
+            and (until is None or month_start(month) < until)
+            and self.path(month).exists()
+        ]
+
+    def cutoff(self, today: Optional[date] = None) -> str:
+        """Calls older than this are cold"""
+        return month_start(months_back(today or date.today(), self.hot_months - 1))
+
+    # -- reads -------------------------------------------------------------
+
+    @contextmanager
+    def attached(self, c, months: List[str], columns: Iterable[str] = (),
+                 main: bool = True) -> Iterator[List[str]]:
+        """
+        ATTACH months (at most MAX_ATTACHED) to c and create the calls_all view
+        over them (and main.calls unless main=False) with VIEW_COLUMNS plus
+        columns. Yields the attached schema names. Read-only use: cursors must
+        be drained before the block ends so the months can be detached.
+        """
+        columns = list(dict.fromkeys([*VIEW_COLUMNS, *columns]))
+        names = []
+        try:
+            for month in months:
+                name = schema_name(month)
+                c.execute(f'ATTACH DATABASE ? AS {name}', (str(self.path(month)),))
+                names.append(name)
+            branches = [f"SELECT {', '.join(columns)} FROM main.calls"] if main else []
+            branches += [f'''
+                SELECT {select_list(c, name, columns)} FROM {name}.calls AS p
+                WHERE NOT EXISTS (SELECT 1 FROM main.calls m WHERE m.id = p.id)
+            ''' for name in names]
+            c.execute('DROP VIEW IF EXISTS temp.calls_all')
+            c.execute(f"CREATE TEMP VIEW calls_all AS {' UNION ALL '.join(branches)}")
+            yield names
+        finally:
+            c.execute('DROP VIEW IF EXISTS temp.calls_all')
+            for name in names:
+                c.execute(f'DETACH DATABASE {name}')
+
+    def page(self, c, columns: Iterable[str], filters: Dict[str, object],
+             after: Optional[Tuple[str, str]] = None, limit: int = 100) -> List[dict]:
+        """queries.calls_page across main and every month it can reach"""
+        columns = list(columns)
+        months = self.months(c, filters.get('since'), filters.get('until'))
+        if not months:
+            return [dict(r) for r in queries.calls_page(c, columns, filters, after, limit)]
+        rows: List[dict] = []
+        for i in range(0, len(months), MAX_ATTACHED):
+            batch = months[i:i + MAX_ATTACHED]
+            if len(rows) == limit and (rows[-1]['timestamp'] or '') >= month_start(next_month(batch[0])):
+                break  # the page is full of calls newer than anything left
+            with self.attached(c, batch, columns, main=i == 0):
+                rows += [dict(r) for r in queries.calls_page(c, columns, filters, after, limit, 'calls_all')]
+            # Each batch is already in order; merging them is a sort of two runs
+            rows.sort(key=lambda r: (r['timestamp'] or '', r['id']), reverse=True)
+            del rows[limit:]
+        return rows
+
+    def iter_calls(self, c, columns: Iterable[str], filters: Dict[str, object],
+                   after: Optional[Tuple[str, str]] = None, batch_size: int = 500) -> Iterator[dict]:
+        """Every matching call across partitions, one keyset page at a time"""
+        columns = list(columns)
+        while True:
+            rows = self.page(c, columns, filters, after, batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]['timestamp'], rows[-1]['id']
+
+    def search(self, c, q: str, filters: Dict[str, object], limit: int = 20) -> List[dict]:
+        """transcript_search.search over main and the months in range, best rank first"""
+        results = transcript_search.search(c, q, filters, limit)
+        months = self.months(c, filters.get('since'), filters.get('until'))
+        for i in range(0, len(months), MAX_ATTACHED):
+            with self.attached(c, months[i:i + MAX_ATTACHED]) as names:
+                for name in names:
+                    results += transcript_search.search(c, q, filters, limit, name)
+        # bm25 is scored per index, so ranks from different months are close, not equal, measures
+        results.sort(key=lambda r: r['rank'], reverse=True)
+        return results[:limit]
+
+    @contextmanager
+    def locate(self, c, call_id: str) -> Iterator[str]:
+        """Schema holding call_id: 'main', or its month attached for the block"""
+        row = None
+        if c.execute('SELECT 1 FROM calls WHERE id = ?', (call_id,)).fetchone() is None:
+            row = c.execute('SELECT month FROM archived_calls WHERE id = ?', (call_id,)).fetchone()
+        if row is None or not self.path(row['month']).exists():
+            yield 'main'
+            return
+        with self.attached(c, [row['month']]) as (name,):
+            yield name
+
+    # -- archival ----------------------------------------------------------
+
+    def _create_partition(self, month: str) -> None:
+        """Month file with main's calls and call_payloads tables, indexes and FTS"""
+        main = storage.get_connection(self.db_path)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with storage.transaction(self.path(month)) as p:
+            for table in ('calls', 'call_payloads'):
+                existing = _columns(p, table=table)
+                if not existing:
+                    sql = main.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                       (table,)).fetchone()[0]
+                    p.execute(sql)
+                    continue
+                # Columns main gained since this month was first archived
+                for column in main.execute(f'PRAGMA table_info({table})').fetchall():
+                    if column['name'] not in existing:
+                        p.execute(f"ALTER TABLE {table} ADD COLUMN {column['name']} {column['type']}")
+            for sql in queries.CALL_INDEXES:
+                p.execute(sql)
+            if transcript_search.init_schema(p):
+                transcript_search.rebuild(p)
+
+    def archive_month(self, month: str, batch_size: int = 500) -> int:
+        """Move one month's calls out of main; returns how many moved"""
+        self._create_partition(month)
+        columns = _columns(storage.get_connection(self.db_path))
+        moved = 0
+        while True:
+            with storage.transaction(self.db_path) as c:
+                rows = c.execute(f'''
+                    SELECT {', '.join(columns)} FROM calls
+                    WHERE timestamp >= ? AND timestamp < ?
+                    LIMIT ?
+                ''', (month_start(month), month_start(next_month(month)), batch_size)).fetchall()
+                if not rows:
+                    break
+                ids = [row['id'] for row in rows]
+                marks = ', '.join('?' * len(ids))
+                payloads = c.execute(f'SELECT * FROM call_payloads WHERE call_id IN ({marks})', ids).fetchall()
+
+                # A replayed call archived earlier under another month leaves that copy behind
+                previous = c.execute(f'''
+                    SELECT month, id FROM archived_calls WHERE id IN ({marks}) AND month != ?
+                    ORDER BY month
+                ''', (*ids, month)).fetchall()
+                for old_month, group in groupby(previous, key=lambda r: r['month']):
+                    if self.path(old_month).exists():
+                        old_ids = [(r['id'],) for r in group]
+                        with storage.transaction(self.path(old_month)) as p:
+                            p.executemany('DELETE FROM call_payloads WHERE call_id = ?', old_ids)
+                            p.executemany('DELETE FROM calls WHERE id = ?', old_ids)
+
+                # The month file commits first; main lets go of the calls after
+                with storage.transaction(self.path(month)) as p:
+                    p.executemany(storage.upsert_sql('calls', columns), rows)
+                    if payloads:
+                        names = payloads[0].keys()
+                        p.executemany(f'''
+                            INSERT OR REPLACE INTO call_payloads ({', '.join(names)})
+                            VALUES ({', '.join('?' * len(names))})
+                        ''', payloads)
+
+                archived = ('id', 'month', *LEDGER_COLUMNS)
+                c.execute(storage.upsert_sql('archived_calls', archived, source=f'''
+                    SELECT id, ?, {', '.join(LEDGER_COLUMNS)} FROM calls WHERE id IN ({marks})
+                '''), (month, *ids))
+                c.execute(f'DELETE FROM call_payloads WHERE call_id IN ({marks})', ids)
+                c.execute(f'DELETE FROM calls WHERE id IN ({marks})', ids)
+                c.execute('''
+                    INSERT INTO call_partitions (month, archived_at) VALUES (?, ?)
+                    ON CONFLICT(month) DO UPDATE SET archived_at = excluded.archived_at
+                ''', (month, datetime.now().isoformat()))
+                moved += len(rows)
+        storage.close_connection(self.path(month))
+        return moved
+
+    def compact(self, month: str) -> int:
+        """Merge the month's FTS segments and VACUUM its file; returns its calls"""
+        path = self.path(month)
+        try:
+            with storage.transaction(path) as p:
+                transcript_search.optimize(p)
+                calls = p.execute('SELECT COUNT(*) FROM calls').fetchone()[0]
+            storage.get_connection(path).execute('VACUUM')
+        finally:
+            storage.close_connection(path)
+        with storage.transaction(self.db_path) as c:
+            c.execute('UPDATE call_partitions SET calls = ?, compacted_at = ? WHERE month = ?',
+                      (calls, datetime.now().isoformat(), month))
+        return calls
+
+    def drop_payloads(self, today: Optional[date] = None) -> List[str]:
+        """Delete the raw payloads of months past the retention period; returns the months"""
+        if self.payload_months <= 0:
+            return []
+        oldest_kept = months_back(today or date.today(), self.payload_months)
+        c = storage.get_connection(self.db_path)
+        expired = [r[0] for r in c.execute('''
+            SELECT month FROM call_partitions
+            WHERE month < ? AND payloads_dropped_at IS NULL
+        ''', (oldest_kept,))]
+        for month in expired:
+            path = self.path(month)
+            if path.exists():
+                try:
+                    with storage.transaction(path) as p:
+                        p.execute('DELETE FROM call_payloads')
+                    storage.get_connection(path).execute('VACUUM')
+                finally:
+                    storage.close_connection(path)
+            with storage.transaction(self.db_path) as c:
+                c.execute('UPDATE call_partitions SET payloads_dropped_at = ? WHERE month = ?',
+                          (datetime.now().isoformat(), month))
+        return expired
+
+    def archive(self, today: Optional[date] = None) -> dict:
+        """Move every cold month out of main, compact what moved, apply retention"""
+        c = storage.get_connection(self.db_path)
+        cold = [r[0] for r in c.execute(
+            'SELECT DISTINCT substr(timestamp, 1, 7) FROM calls WHERE timestamp < ?', (self.cutoff(today),)
+        ).fetchall() if r[0] and MONTH.fullmatch(r[0])]
+        stats = {'months': [], 'calls': 0}
+        for month in cold:
+            moved = self.archive_month(month)
+            if moved:
+                self.compact(month)
+                stats['months'].append(month)
+                stats['calls'] += moved
+        stats['payloads_dropped'] = self.drop_payloads(today)
+        return stats
+
+    def status(self) -> List[dict]:
+        c = storage.get_connection(self.db_path)
+        partitions = []
+        for row in c.execute('SELECT * FROM call_partitions ORDER BY month DESC').fetchall():
+            path = self.path(row['month'])
+            partitions.append({**dict(row), 'bytes': path.stat().st_size if path.exists() else None})
+        return partitions
+
+
+class Archiver:
+    """
+    Background Partitions.archive() every `interval` seconds, once per
+    process, of every database databases() returns as {name: Partitions}
+    (one per tenant); on_archived(name, partitions, stats) runs after calls
+    of a database were moved
+    """
+
+    def __init__(self, databases: Callable[[], Dict[str, Partitions]], interval: float = 86400,
+                 on_archived: Optional[Callable[[str, Partitions, dict], None]] = None):
+        self.databases = databases
+        self.interval = interval
+        self.on_archived = on_archived
+        self.stats = {'runs': 0, 'calls': 0, 'errors': 0, 'last_run': None}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='partition-archiver', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._pid = None
+
+    def run_once(self) -> dict:
+        """archive() every database; months come back as 'name:YYYY-MM'"""
+        total = {'months': [], 'calls': 0, 'payloads_dropped': []}
+        for name, store in self.databases().items():
+            try:
+                stats = store.archive()
+            except Exception as e:
+                # One broken tenant must not hold back everyone else's archival
+                self.stats['errors'] += 1
+                print(f"❌ Partition archival of {name}: {e}")
+                continue
+            finally:
+                storage.close_connection(store.db_path)
+            if stats['calls'] and self.on_archived is not None:
+                self.on_archived(name, store, stats)
+            total['calls'] += stats['calls']
+            total['months'] += [f'{name}:{month}' for month in stats['months']]
+            total['payloads_dropped'] += [f'{name}:{month}' for month in stats['payloads_dropped']]
+        self.stats['runs'] += 1
+        self.stats['calls'] += total['calls']
+        self.stats['last_run'] = datetime.now().isoformat()
+        if total['calls'] or total['payloads_dropped']:
+            print(f"✅ Archived {total['calls']} calls from {', '.join(total['months']) or 'no months'}; "
+                  f"payloads dropped for {', '.join(total['payloads_dropped']) or 'no months'}")
+        return total
+
+    def _run(self) -> None:
+        # First pass soon after startup, then on the interval
+        wait = min(60, self.interval)
+        while not self._stop.wait(wait):
+            wait = self.interval
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"❌ Partition archival: {e}")
+
+    def metrics(self) -> dict:
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in ("archive", "status"):
+        from app import ARCHIVER
+        if command == "archive":
+            stats = ARCHIVER.run_once()
+            print(f"✅ Archived {stats['calls']} calls ({', '.join(stats['months']) or 'nothing cold'}), "
+                  f"dropped payloads of {', '.join(stats['payloads_dropped']) or 'no months'}")
+        else:
+            for name, store in ARCHIVER.databases().items():
+                for partition in store.status():
+                    print(f"{name} {partition['month']}: {partition['calls']} calls, {partition['bytes']} bytes, "
+                          f"payloads {'dropped' if partition['payloads_dropped_at'] else 'kept'}")
+    else:
+        print("Usage: python partitions.py archive|status")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Compressed out-of-row storage for raw webhook payloads
+Payloads live in call_payloads, zlib-compressed against a shared preset
+dictionary trained on stored Vapi payloads, so scans of the calls table never
+page through them. The transcript is elided when it equals calls.transcript.
+
+Usage:
+    python payload_store.py migrate [--vacuum]   # move calls.raw_data over
+    python payload_store.py train                # retrain the dictionary
+    python payload_store.py show <call_id>
+"""
+
+import json
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+import storage
+
+# Built-in dictionary (id 0) used until one is trained on real traffic.
+# Rows compressed with it must stay readable: never edit, train a new one
+DEFAULT_SAMPLE = {
+    'message': {
+        'type': 'end-of-call-report', 'endedReason': 'customer-ended-call',
+        'timestamp': 0, 'duration': 0, 'cost': 0, 'summary': '', 'transcript': '',
+        'recordingUrl': 'https://storage.vapi.ai/', 'stereoRecordingUrl': 'https://storage.vapi.ai/',
+        'analysis': {'summary': '', 'successEvaluation': 'true'},
+        'artifact': {'messages': [{'role': 'assistant', 'message': '', 'time': 0,
+                                   'endTime': 0, 'secondsFromStart': 0, 'duration': 0}],
+                     'transcript': 'AI: User: '},
+    },
+    'call': {
+        'id': '', 'orgId': '', 'createdAt': '', 'updatedAt': '', 'type': 'inboundPhoneCall',
+        'status': 'ended', 'phoneNumberId': '', 'assistantId': '',
+        'customer': {'number': '+1'}, 'phoneCallProvider': 'twilio',
+        'phoneCallTransport': 'pstn', 'phoneCallProviderId': '',
+    },
+}
+
+_FRAGMENT = re.compile(r'"(?:[^"\\]|\\.){1,48}":?|[{}\[\],]+')
+
+
+def encode(data) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 16384, min_share: float = 0.2) -> bytes:
+    """
+    Build a zlib preset dictionary from encoded payloads.
+
+    Keeps the JSON keys and short string values that appear in at least
+    min_share of the samples; the most common go last, where zlib reaches
+    them with the shortest back-references.
+    """
+    counts = Counter()
+    total = 0
+    for sample in samples:
+        total += 1
+        counts.update(set(_FRAGMENT.findall(sample.decode('utf-8', 'replace'))))
+    threshold = max(1, int(total * min_share))
+    fragments = sorted(
+        (f for f, n in counts.items() if n >= threshold),
+        key=lambda f: (counts[f], len(f), f)
+    )
+    chosen, used = [], 0
+    for fragment in reversed(fragments):
+        encoded = fragment.encode('utf-8')
+        if used + len(encoded) > size:
+            break
+        chosen.append(encoded)
+        used += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+DEFAULT_DICTIONARY = train_dictionary([encode(DEFAULT_SAMPLE)])
+
+
+class PayloadStore:
+    """call_payloads table plus the dictionaries its rows were compressed with"""
+
+    def __init__(self, db_path, level: int = 6):
+        self.db_path = db_path
+        self.level = level
+        self._dictionaries: Dict[int, bytes] = {0: DEFAULT_DICTIONARY}
+        self._active: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def init_schema(self, c) -> None:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS call_payloads (
+                call_id TEXT PRIMARY KEY,
+                codec TEXT,
+                dict_id INTEGER,
+                transcript_elided BOOLEAN,
+                raw_size INTEGER,
+                payload BLOB
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS payload_dictionaries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT,
+                samples INTEGER,
+                dictionary BLOB
+            )
+        ''')
+
+    def _dictionary(self, c, dict_id: int) -> bytes:
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None:
+            row = c.execute('SELECT dictionary FROM payload_dictionaries WHERE id = ?',
+                            (dict_id,)).fetchone()
+            if row is None:
+                raise KeyError(f'payload dictionary {dict_id} is missing')
+            dictionary = self._dictionaries[dict_id] = bytes(row[0])
+        return dictionary
+
+    def _active_dictionary(self, c) -> Tuple[int, bytes]:
+        if self._active is None:
+            row = c.execute('SELECT MAX(id) FROM payload_dictionaries').fetchone()
+            self._active = row[0] or 0
+        return self._active, self._dictionary(c, self._active)
+
+    def compress(self, c, data) -> Tuple[int, int, bytes]:
+        """(dict_id, raw size, compressed bytes) for one payload"""
+        dict_id, dictionary = self._active_dictionary(c)
+        raw = encode(data)
+        compressor = zlib.compressobj(self.level, zdict=dictionary)
+        return dict_id, len(raw), compressor.compress(raw) + compressor.flush()
+
+    def store_many(self, c, rows: Iterable[Tuple[str, dict, Optional[str]]]) -> None:
+        """Write (call_id, payload, transcript) rows on the caller's transaction"""
+        values = []
+        for call_id, data, transcript in rows:
+            if data is None:
+                continue
+            message = data.get('message')
+            elided = bool(transcript) and isinstance(message, dict) \
+                and message.get('transcript') == transcript
+            if elided:
+                data = {**data, 'message': {k: v for k, v in message.items() if k != 'transcript'}}
+            dict_id, raw_size, blob = self.compress(c, data)
+            values.append((call_id, 'zlib', dict_id, elided, raw_size, blob))
+        c.executemany('''
+            INSERT OR REPLACE INTO call_payloads
+            (call_id, codec, dict_id, transcript_elided, raw_size, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', values)
+
+    def load(self, call_id: str, c=None, schema: str = 'main') -> Optional[dict]:
+        """
+        Decompress one call's payload, restoring an elided transcript. schema
+        is an attached month partition for archived calls; their dictionaries
+        stay in the main database.
+        """
+        c = c or storage.get_connection(self.db_path)
+        row = c.execute(f'''
+            SELECT p.codec, p.dict_id, p.transcript_elided, p.payload, calls.transcript
+            FROM {schema}.call_payloads p LEFT JOIN {schema}.calls ON calls.id = p.call_id
+            WHERE p.call_id = ?
+        ''', (call_id,)).fetchone()
+        if row is None:
+            return None
+        if row['codec'] != 'zlib':
+            raise ValueError(f"unknown payload codec '{row['codec']}'")
+        decompressor = zlib.decompressobj(zdict=self._dictionary(c, row['dict_id']))
+        data = json.loads(decompressor.decompress(bytes(row['payload'])) + decompressor.flush())
+        if row['transcript_elided']:
+            data['message']['transcript'] = row['transcript']
+        return data
+
+    def train(self, sample_size: int = 2000, size: int = 16384) -> Optional[int]:
+        """Train a dictionary on recent payloads; new writes use it from now on"""
+        c = storage.get_connection(self.db_path)
+        ids = [r[0] for r in c.execute(
+            'SELECT call_id FROM call_payloads ORDER BY rowid DESC LIMIT ?', (sample_size,)
+        )]
+        samples = [encode(self.load(call_id, c)) for call_id in ids]
+        # Rows not migrated yet are the best sample on a legacy database
+        samples += [r[0].encode('utf-8') for r in c.execute(
+            'SELECT raw_data FROM calls WHERE raw_data IS NOT NULL LIMIT ?',
+            (max(0, sample_size - len(samples)),)
+        )]
+        if len(samples) < 20:
+            return None
+        dictionary = train_dictionary(samples, size)
+        with storage.transaction(self.db_path) as t:
+            dict_id = t.execute('''
+                INSERT INTO payload_dictionaries (created_at, samples, dictionary)
+                VALUES (datetime('now'), ?, ?)
+            ''', (len(samples), dictionary)).lastrowid
+        with self._lock:
+            self._dictionaries[dict_id] = dictionary
+            self._active = dict_id
+        return dict_id
+
+    def migrate(self, batch_size: int = 500) -> dict:
+        """Move calls.raw_data into call_payloads, one transaction per batch"""
+        stats = {'migrated': 0, 'unreadable': 0, 'bytes_before': 0, 'bytes_after': 0}
+        while True:
+            with storage.transaction(self.db_path) as c:
+                rows = c.execute('''
+                    SELECT id, transcript, raw_data FROM calls
+                    WHERE raw_data IS NOT NULL LIMIT ?
+                ''', (batch_size,)).fetchall()
+                if not rows:
+                    break
+                batch = []
+                for row in rows:
+                    stats['bytes_before'] += len(row['raw_data'])
+                    try:
+                        batch.append((row['id'], json.loads(row['raw_data']), row['transcript']))
+                    except ValueError:
+                        stats['unreadable'] += 1
+                        batch.append((row['id'], {'raw': row['raw_data']}, None))
+                self.store_many(c, batch)
+                c.executemany('UPDATE calls SET raw_data = NULL WHERE id = ?',
+                              [(row['id'],) for row in rows])
+                stats['migrated'] += len(rows)
+                stats['bytes_after'] += c.execute(f'''
+                    SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM call_payloads
+                    WHERE call_id IN ({', '.join('?' * len(rows))})
+                ''', [row['id'] for row in rows]).fetchone()[0]
+        return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compressed call payload storage')
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help='Move calls.raw_data into call_payloads')
+    migrate.add_argument('--batch', type=int, default=500)
+    migrate.add_argument('--no-train', action='store_true', help='Keep the current dictionary')
+    migrate.add_argument('--vacuum', action='store_true', help='Reclaim the freed pages afterwards')
+    sub.add_parser('train', help='Train a new dictionary on stored payloads')
+    show = sub.add_parser('show', help='Print one call payload')
+    show.add_argument('call_id')
+    args = parser.parse_args()
+
+    # Imported here so `python payload_store.py --help` does not open the database
+    from app import DB_PATH, PAYLOADS
+
+    if args.command == 'show':
+        print(json.dumps(PAYLOADS.load(args.call_id), indent=2))
+    elif args.command == 'train':
+        dict_id = PAYLOADS.train()
+        print(f"✅ Trained dictionary {dict_id}" if dict_id else "⚠️ Not enough payloads to train on")
+    else:
+        if not args.no_train:
+            dict_id = PAYLOADS.train()
+            if dict_id:
+                print(f"✅ Trained dictionary {dict_id}")
+        started = time.time()
+        stats = PAYLOADS.migrate(args.batch)
+        print(f"✅ Migrated {stats['migrated']} payloads in {time.time() - started:.1f}s: "
+              f"{stats['bytes_before'] / 1e6:.1f} MB -> {stats['bytes_after'] / 1e6:.1f} MB")
+        if args.vacuum:
+            storage.get_connection(DB_PATH).execute('VACUUM')
+            print("✅ Vacuumed")
+        print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Phone number normalization
+Vapi and Twilio send numbers as '+15551234567', '(555) 123-4567',
+'tel:+1-555-123-4567' and so on; everything we look up by is stored in E.164
+next to the raw value, in an indexed *_e164 column.
+
+Usage:
+    python phone.py backfill    # fill *_e164 for rows written before normalization
+"""
+
+import os
+import re
+from typing import Optional
+
+import storage
+
+DEFAULT_COUNTRY_CODE = os.environ.get('DEFAULT_COUNTRY_CODE', '1')
+
+# (table, raw column, normalized column, index columns after the phone)
+PHONE_COLUMNS = (
+    ('calls', 'customer_phone', 'customer_phone_e164', ('timestamp',)),
+    ('appointments', 'customer_phone', 'customer_phone_e164', ('created_at',)),
+    ('sms_log', 'from_number', 'from_number_e164', ('timestamp',)),
+    ('sms_log', 'to_number', 'to_number_e164', ('timestamp',)),
+)
+
+_NOT_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(raw, country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """E.164 form of raw ('+15551234567'), or None if it is not a phone number"""
+    if not raw:
+        return None
+    text = str(raw).strip()
+    for prefix in ('tel:', 'sip:'):
+        if text.lower().startswith(prefix):
+            text = text[len(prefix):].split('@', 1)[0]
+    international = text.startswith('+') or text.startswith('00')
+    digits = _NOT_DIGITS.sub('', text)
+    if text.startswith('00'):
+        digits = digits[2:]
+
+    if not international:
+        if country_code == '1':
+            # National NANP numbers, with or without the trunk 1
+            if len(digits) == 11 and digits.startswith('1'):
+                digits = digits[1:]
+            if len(digits) != 10:
+                return None
+        else:
+            digits = digits.lstrip('0')
+        digits = country_code + digits
+
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return '+' + digits
+
+
+def add_phone_columns(c) -> bool:
+    """Add missing *_e164 columns and their indexes; True if any column was added"""
+    added = False
+    for table, _, column, rest in PHONE_COLUMNS:
+        existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+        if column not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+            added = True
+        c.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_{column}
+            ON {table}({', '.join((column,) + rest)})
+        ''')
+    return added
+
+
+def backfill_phone_columns(db_path, batch_size: int = 5000) -> int:
+    """Normalize raw phone columns of existing rows, one transaction per batch"""
+    updated = 0
+    for table, raw, column, _ in PHONE_COLUMNS:
+        last = 0
+        while True:
+            with storage.transaction(db_path) as c:
+                rows = c.execute(f'''
+                    SELECT rowid, {raw} FROM {table}
+                    WHERE rowid > ? AND {column} IS NULL AND {raw} IS NOT NULL
+                    ORDER BY rowid LIMIT ?
+                ''', (last, batch_size)).fetchall()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                values = [(normalize_phone(phone), rowid) for rowid, phone in rows]
+                values = [v for v in values if v[0] is not None]
+                c.executemany(f'UPDATE {table} SET {column} = ? WHERE rowid = ?', values)
+                updated += len(values)
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        from app import DB_PATH
+        print(f"✅ Normalized {backfill_phone_columns(DB_PATH)} phone numbers")
+    else:
+        print("Usage: python phone.py backfill")
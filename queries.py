@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Dashboard and /api/calls queries
+Every filter is an equality or a timestamp range on an indexed column, never
+a function of a column (date(timestamp) cannot use an index), so the planner
+seeks instead of scanning calls. tests/test_query_plans.py pins the plans.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_BUSINESS_ID = 'demo'
+
+# Trailing id makes (timestamp, id) keyset pages a single index range, no sort
+CALL_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_calls_time_id ON calls(timestamp, id)',
+    'CREATE INDEX IF NOT EXISTS idx_calls_business_time_id ON calls(business_id, timestamp, id)',
+    '''CREATE INDEX IF NOT EXISTS idx_calls_business_emergency_time_id
+       ON calls(business_id, is_emergency, timestamp, id)''',
+)
+
+INDEXES = CALL_INDEXES + (
+    'CREATE INDEX IF NOT EXISTS idx_appointments_status_created ON appointments(status, created_at)',
+)
+
+# Superseded by the *_id indexes above
+OBSOLETE_INDEXES = ('idx_calls_business_time', 'idx_calls_business_emergency_time')
+
+# /api/calls filters: query parameter -> WHERE clause
+CALL_FILTERS = {
+    'business_id': 'business_id = ?',
+    'since': 'timestamp >= ?',
+    'until': 'timestamp < ?',
+    'issue_type': 'issue_type = ?',
+    'is_emergency': 'is_emergency = ?',
+}
+
+RECENT_CALLS = '''
+    SELECT id, timestamp, customer_phone, customer_name, is_emergency, booking_requested, status
+    FROM calls
+    WHERE business_id = ? AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp DESC
+    LIMIT 20
+'''
+
+COUNT_CALLS = '''
+    SELECT COUNT(*) FROM calls
+    WHERE business_id = ? AND timestamp >= ? AND timestamp < ?
+'''
+
+COUNT_EMERGENCIES = '''
+    SELECT COUNT(*) FROM calls
+    WHERE business_id = ? AND is_emergency = 1 AND timestamp >= ? AND timestamp < ?
+'''
+
+PENDING_APPOINTMENTS = '''
+    SELECT * FROM appointments
+    WHERE status = 'pending'
+    ORDER BY created_at DESC
+    LIMIT 10
+'''
+
+COUNT_PENDING_APPOINTMENTS = "SELECT COUNT(*) FROM appointments WHERE status = 'pending'"
+
+
+def create_indexes(c) -> None:
+    for sql in INDEXES:
+        c.execute(sql)
+    for name in OBSOLETE_INDEXES:
+        c.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def encode_cursor(row) -> str:
+    """Opaque cursor pointing just after row (needs its timestamp and id)"""
+    key = json.dumps([row['timestamp'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(timestamp, id) from encode_cursor(); ValueError if it was tampered with"""
+    try:
+        timestamp, call_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'invalid cursor: {cursor!r}') from e
+    if not isinstance(timestamp, str) or not isinstance(call_id, str):
+        raise ValueError(f'invalid cursor: {cursor!r}')
+    return timestamp, call_id
+
+
+def page_query(columns: Iterable[str], filters: Dict[str, object],
+               after: Optional[Tuple[str, str]] = None, limit: int = 100,
+               table: str = 'calls') -> Tuple[str, tuple]:
+    """(sql, params) of calls_page, newest first on (timestamp, id)"""
+    where = [CALL_FILTERS[name] for name in filters]
+    params = list(filters.values())
+    if after is not None:
+        where.append('(timestamp, id) < (?, ?)')
+        params.extend(after)
+    columns = list(dict.fromkeys([*columns, 'timestamp', 'id']))
+    return f'''
+        SELECT {', '.join(columns)} FROM {table}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (*params, limit)
+
+
+def calls_page(c, columns: Iterable[str], filters: Dict[str, object],
+               after: Optional[Tuple[str, str]] = None, limit: int = 100,
+               table: str = 'calls') -> list:
+    """
+    Calls matching filters (CALL_FILTERS keys) strictly older than the
+    (timestamp, id) key after. Seeks straight to the page whatever its depth,
+    unlike OFFSET. table may be a view with the same columns (partitions.py).
+    """
+    return c.execute(*page_query(columns, filters, after, limit, table)).fetchall()
+
+
+def iter_calls(c, columns: Iterable[str], filters: Dict[str, object],
+               after: Optional[Tuple[str, str]] = None, batch_size: int = 500) -> Iterator:
+    """Every matching call, one keyset page at a time (exports)"""
+    columns = list(columns)
+    while True:
+        rows = calls_page(c, columns, filters, after, batch_size)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]['timestamp'], rows[-1]['id']
+
+
+def day_range(day: Optional[datetime] = None) -> Tuple[str, str]:
+    """[start, end) of a local day as ISO strings, comparable with calls.timestamp"""
+    start = (day or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.isoformat(), (start + timedelta(days=1)).isoformat()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Per-tenant ring buffer of the most recent calls
+Holds the newest `size` call summaries of each business, warmed from the
+database at startup and updated after every committed call write. A read is
+served from memory only when the buffer provably holds every matching row:
+either it found `limit` of them, or the requested range starts after the
+oldest call the buffer may be missing. Anything else returns None and the
+caller queries SQLite. Calls archived to monthly partitions (partitions.py)
+count as missing: warm() starts the window above the newest archived call and
+forget() moves it up when the archiver takes calls out of the database.
+
+Other processes (backfill.py, replay.py, payload_store.py migrate, partitions.py
+archive) write calls without telling the buffer. Triggers count every calls
+write in calls_version; a tenant remembers the version its contents reflect,
+writes made here move it along (tracking()), and sync() re-warms the tenant
+from SQLite whenever the database has moved past it. sync() only reads
+calls_version once the connection reports a commit since its last check.
+"""
+
+import bisect
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import queries
+
+Key = Tuple[str, str]  # (timestamp, id), the /api/calls keyset order
+
+
+def init_schema(c) -> None:
+    """calls_version, bumped by triggers on every calls write, whoever makes it"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS calls_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO calls_version VALUES (0, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS calls_version_{event.lower()} AFTER {event} ON calls
+            BEGIN UPDATE calls_version SET version = version + 1; END
+        ''')
+
+
+def data_version(c) -> int:
+    """Calls writes committed to c's database so far (0 without calls_version)"""
+    try:
+        row = c.execute('SELECT version FROM calls_version WHERE id = 0').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+class TenantCalls:
+    """Sorted summaries of one business, complete for keys above `boundary`"""
+
+    __slots__ = ('keys', 'rows', 'boundary', 'version', 'checked')
+
+    def __init__(self):
+        self.keys: List[Key] = []  # ascending
+        self.rows: Dict[str, dict] = {}
+        self.boundary: Optional[Key] = None  # None: every call of the tenant is here
+        self.version: Optional[int] = None  # data_version() reflected; None: unknown
+        self.checked: Optional[tuple] = None  # (connection, change token) of the last sync()
+
+    def remove(self, call_id: str) -> None:
+        row = self.rows.pop(call_id, None)
+        if row is not None:
+            del self.keys[bisect.bisect_left(self.keys, (row['timestamp'], call_id))]
+
+    def covers(self, since: Optional[str]) -> bool:
+        """True if every call with timestamp >= since is in the buffer"""
+        return self.boundary is None or (since is not None and since > self.boundary[0])
+
+
+class RecentCalls:
+    def __init__(self, fields: Iterable[str], size: int = 500):
+        self.fields = tuple(dict.fromkeys(['id', 'timestamp', 'business_id', *fields]))
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.resyncs = 0
+        self.generation = 0  # bumped on every change, for caches built from reads
+        self._tenants: Dict[str, TenantCalls] = {}
+        self._tenant_of: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()  # versions tracked by this thread's last writes
+
+    def warm(self, c, business_id: Optional[str] = None) -> int:
+        """
+        Load the newest `size` calls of business_id, or of every business in
+        c, from c (startup; one call per tenant database). A business warmed
+        without calls is known to have none; one never warmed is not.
+        """
+        snapshot = not c.in_transaction
+        if snapshot:
+            c.execute('BEGIN')  # the rows and their version from one read
+        try:
+            version = data_version(c)
+            archived = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_calls'"
+            ).fetchone() is not None
+            if business_id is not None:
+                business_ids = [business_id]
+            else:
+                sql = 'SELECT business_id FROM calls'
+                if archived:
+                    sql += ' UNION SELECT business_id FROM archived_calls'
+                business_ids = [r[0] for r in c.execute(f'SELECT * FROM ({sql}) WHERE business_id IS NOT NULL')]
+            tenants = {b: self._load(c, b, archived) for b in business_ids}
+        finally:
+            if snapshot:
+                c.execute('COMMIT')
+        with self._lock:
+            for business_id, tenant in tenants.items():
+                old = self._tenants.get(business_id)
+                if old is not None and old.version is not None and old.version > version:
+                    continue  # writes committed after our read are folded in already
+                tenant.version = version
+                for call_id in old.rows if old is not None else ():
+                    self._tenant_of.pop(call_id, None)
+                self._tenants[business_id] = tenant
+                self._tenant_of.update((call_id, business_id) for call_id in tenant.rows)
+            self.generation += 1
+        return sum(len(t.rows) for t in tenants.values())
+
+    def sync(self, c, business_id: str) -> bool:
+        """
+        Re-warm business_id from c, its database, if calls were written there
+        since the buffer last saw it (or it never did); True if it re-warmed
+        """
+        # PRAGMA data_version moves when another connection commits and
+        # total_changes when this one writes: unchanged, nothing is to be read
+        token = (c.execute('PRAGMA data_version').fetchone()[0], c.total_changes)
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is not None and tenant.checked is not None and \
+                    tenant.checked[0] is c and tenant.checked[1] == token:
+                return False
+        version = data_version(c)
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is not None and tenant.version == version:
+                tenant.checked = (c, token)
+                return False
+            self.resyncs += 1
+        self.warm(c, business_id)
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is not None:
+                tenant.checked = (c, token)  # older than the rows warm() read, never newer
+        return True
+
+    @contextmanager
+    def tracking(self, c, business_id: str):
+        """
+        Wrap writes to business_id's database inside its open transaction c;
+        the next add() on this thread, after the commit, moves the tenant's
+        version past them
+        """
+        versions = self._local.__dict__.setdefault('versions', {})
+        versions.pop(business_id, None)
+        before = data_version(c)
+        yield
+        versions[business_id] = (before, data_version(c))
+
+    def _load(self, c, business_id: str, archived: bool) -> TenantCalls:
+        rows = queries.calls_page(c, self.fields, {'business_id': business_id}, limit=self.size)
+        tenant = TenantCalls()
+        for row in reversed(rows):
+            tenant.keys.append((row['timestamp'], row['id']))
+            tenant.rows[row['id']] = dict(row)
+        if len(rows) == self.size:
+            # Older calls exist; equal timestamps below this key may too
+            tenant.boundary = tenant.keys[0]
+        newest_archived = c.execute('''
+            SELECT timestamp, id FROM archived_calls
+            WHERE business_id = ? AND timestamp IS NOT NULL
+            ORDER BY timestamp DESC, id DESC LIMIT 1
+        ''', (business_id,)).fetchone() if archived else None
+        if newest_archived is not None:
+            # Every archived call is older than the window
+            key = tuple(newest_archived)
+            tenant.boundary = max(tenant.boundary or key, key)
+        return tenant
+
+    def add(self, call_records: Iterable[dict], default_business_id: str) -> None:
+        """
+        Fold committed calls rows in (INSERT OR REPLACE semantics), with the
+        versions this thread's tracking() saw them commit
+        """
+        versions = self._local.__dict__.pop('versions', {})
+        with self._lock:
+            self.generation += 1
+            for record in call_records:
+                row = {f: record.get(f) for f in self.fields}
+                row['business_id'] = row['business_id'] or default_business_id
+                # Booleans come back from SQLite as integers
+                row.update({f: int(v) for f, v in row.items() if isinstance(v, bool)})
+                self._remove(row['id'])
+                if row['timestamp'] is None:
+                    continue
+                key = (row['timestamp'], row['id'])
+                tenant = self._tenants.get(row['business_id'])
+                if tenant is None:
+                    # Never warmed: its database may hold older calls, only newer ones are known
+                    tenant = self._tenants[row['business_id']] = TenantCalls()
+                    tenant.boundary = key
+                if tenant.boundary is not None and key <= tenant.boundary:
+                    continue  # older than the window, SQLite serves it
+                bisect.insort(tenant.keys, key)
+                tenant.rows[row['id']] = row
+                self._tenant_of[row['id']] = row['business_id']
+                while len(tenant.keys) > self.size:
+                    oldest = tenant.keys[0]
+                    self._remove(oldest[1])
+                    tenant.boundary = max(tenant.boundary or oldest, oldest)
+            for business_id, (before, after) in versions.items():
+                tenant = self._tenants.get(business_id)
+                if tenant is None or tenant.version is None:
+                    continue
+                if tenant.version == before:
+                    tenant.version = after
+                elif tenant.version < after:
+                    tenant.version = None  # someone else wrote in between: sync() re-warms
+
+    def forget(self, before: str, business_id: Optional[str] = None) -> None:
+        """
+        Drop calls older than timestamp `before` of business_id (every
+        business if None), which the archiver moved out of the database
+        """
+        floor = (before, '')
+        with self._lock:
+            self.generation += 1
+            tenants = self._tenants.values() if business_id is None else \
+                [self._tenants[business_id]] if business_id in self._tenants else []
+            for tenant in tenants:
+                while tenant.keys and tenant.keys[0] < floor:
+                    self._remove(tenant.keys[0][1])
+                tenant.boundary = max(tenant.boundary or floor, floor)
+
+    def update(self, call_id: str, **fields) -> None:
+        """Apply an UPDATE of non-key columns (status, ...) to a buffered call"""
+        with self._lock:
+            business_id = self._tenant_of.get(call_id)
+            if business_id is not None:
+                self._tenants[business_id].rows[call_id].update(fields)
+                self.generation += 1
+
+    def _remove(self, call_id: str) -> None:
+        business_id = self._tenant_of.pop(call_id, None)
+        if business_id is not None:
+            self._tenants[business_id].remove(call_id)
+
+    def _matching(self, tenant: TenantCalls, filters: Dict[str, object], after: Optional[Key]):
+        """Buffered rows matching filters, newest first, strictly below after"""
+        since, until = filters.get('since'), filters.get('until')
+        end = bisect.bisect_left(tenant.keys, after) if after is not None else len(tenant.keys)
+        for i in range(end - 1, -1, -1):
+            key = tenant.keys[i]
+            if tenant.boundary is not None and key <= tenant.boundary:
+                return
+            if until is not None and key[0] >= until:
+                continue
+            if since is not None and key[0] < since:
+                return
+            row = tenant.rows[key[1]]
+            if all(row[name] == value for name, value in filters.items()
+                   if name not in ('business_id', 'since', 'until')):
+                yield row
+
+    def page(self, filters: Dict[str, object], after: Optional[Key] = None,
+             limit: int = 100) -> Optional[List[dict]]:
+        """queries.calls_page for one business_id, or None if SQLite must answer"""
+        with self._lock:
+            tenant = self._tenants.get(filters.get('business_id'))
+            if tenant is None:
+                self.misses += 1
+                return None
+            rows = []
+            for row in self._matching(tenant, filters, after):
+                rows.append(dict(row))
+                if len(rows) == limit:
+                    break
+            if len(rows) < limit and not tenant.covers(filters.get('since')):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return rows
+
+    def count(self, filters: Dict[str, object]) -> Optional[int]:
+        """Number of calls matching filters, or None if SQLite must answer"""
+        with self._lock:
+            tenant = self._tenants.get(filters.get('business_id'))
+            if tenant is None or not tenant.covers(filters.get('since')):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return sum(1 for _ in self._matching(tenant, filters, None))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'tenants': len(self._tenants),
+                'calls': len(self._tenant_of),
+                'hits': self.hits,
+                'misses': self.misses,
+                'resyncs': self.resyncs,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Hourly analytics rollups
+call_rollups_hourly keeps one row per (business_id, hour, issue_type,
+is_emergency, booking_requested) with call counts and duration sums, so any
+range/grouping is an aggregate over at most 24 rows a day per combination
+instead of a scan of calls.
+
+Triggers on calls append the hour buckets every write touches to
+rollup_changes. refresh() recomputes just those buckets from calls (each an
+index seek on business_id + one hour of timestamps) and advances the
+watermark past the changes it consumed, in one transaction, so it is exact
+across replays, rewrites and deletes and safe to run at any time.
+
+Calls without a business_id or timestamp are not rolled up. Calls moved to a
+monthly partition keep their rolled-up columns in archived_calls
+(partitions.py), which has the same triggers and is aggregated with calls,
+so buckets stay whole when their calls leave the main database.
+
+Every tenant database has its own rollups; RollupRefresher folds in the
+changes of each of them, so reads never write.
+
+Usage:
+    python rollups.py refresh    # fold in changes since the watermark, every tenant
+    python rollups.py rebuild    # recompute every bucket from calls, every tenant
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import storage
+
+HOUR = "substr({ref}timestamp, 1, 13) || ':00:00'"
+
+# Columns whose change can move a call between buckets or change its sums
+ROLLED_UP_COLUMNS = ('business_id', 'timestamp', 'issue_type', 'is_emergency',
+                     'booking_requested', 'call_duration')
+
+# /api/analytics group_by name -> expression over call_rollups_hourly
+DIMENSIONS = {
+    'hour': 'hour',
+    'day': 'substr(hour, 1, 10)',
+    'weekday': "CAST(strftime('%w', hour) AS INTEGER)",  # 0 = Sunday
+    'hour_of_day': 'CAST(substr(hour, 12, 2) AS INTEGER)',
+    'issue_type': 'issue_type',
+    'is_emergency': 'is_emergency',
+    'booking_requested': 'booking_requested',
+}
+
+# Tables whose rows are rolled up; archived_calls exists once partitions.py created it
+SOURCES = ('calls', 'archived_calls')
+
+
+def _aggregate(table: str) -> str:
+    """Bucket aggregation of a source table's rows, shared by refresh() and rebuild()"""
+    return f'''
+        SELECT business_id, {HOUR.format(ref='')}, COALESCE(issue_type, 'unknown'),
+               COALESCE(is_emergency, 0) != 0, COALESCE(booking_requested, 0) != 0,
+               COUNT(*), COALESCE(SUM(call_duration), 0), COUNT(call_duration)
+        FROM {table}
+    '''
+
+
+_AGGREGATE = _aggregate('calls')
+
+# A bucket spread over several sources adds up
+_ADD = '''
+    ON CONFLICT(business_id, hour, issue_type, is_emergency, booking_requested) DO UPDATE SET
+        calls = calls + excluded.calls,
+        duration_sum = duration_sum + excluded.duration_sum,
+        duration_count = duration_count + excluded.duration_count
+'''
+
+
+def _log_bucket(ref: str) -> str:
+    return f'''
+        INSERT INTO rollup_changes (business_id, hour)
+        SELECT {ref}.business_id, {HOUR.format(ref=ref + '.')}
+        WHERE {ref}.business_id IS NOT NULL AND {ref}.timestamp IS NOT NULL;'''
+
+
+def _triggers(table: str):
+    yield f'trg_{table}_rollup_insert', f"AFTER INSERT ON {table} BEGIN {_log_bucket('NEW')} END"
+    yield f'trg_{table}_rollup_delete', f"AFTER DELETE ON {table} BEGIN {_log_bucket('OLD')} END"
+    yield f'trg_{table}_rollup_update', f'''AFTER UPDATE OF {', '.join(ROLLED_UP_COLUMNS)} ON {table}
+        BEGIN {_log_bucket('OLD')} {_log_bucket('NEW')} END'''
+
+
+def _sources(c) -> list:
+    present = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [table for table in SOURCES if table in present]
+
+
+def init_schema(c) -> bool:
+    """Create the rollup tables and triggers; True if the rollups are new"""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'call_rollups_hourly'"
+    ).fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS call_rollups_hourly (
+            business_id TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            issue_type TEXT NOT NULL,
+            is_emergency INTEGER NOT NULL,
+            booking_requested INTEGER NOT NULL,
+            calls INTEGER NOT NULL,
+            duration_sum INTEGER NOT NULL,
+            duration_count INTEGER NOT NULL,
+            PRIMARY KEY (business_id, hour, issue_type, is_emergency, booking_requested)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_id TEXT NOT NULL,
+            hour TEXT NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            watermark INTEGER NOT NULL,
+            refreshed_at TEXT
+        )
+    ''')
+    for table in _sources(c):
+        for name, body in _triggers(table):
+            c.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    return exists is None
+
+
+def _next_hour(hour: str) -> str:
+    return (datetime.fromisoformat(hour) + timedelta(hours=1)).isoformat()
+
+
+def refresh(c) -> int:
+    """Recompute the buckets touched since the watermark; returns how many"""
+    row = c.execute("SELECT watermark FROM rollup_state WHERE name = 'hourly'").fetchone()
+    watermark = row[0] if row else 0
+    high = c.execute('SELECT MAX(seq) FROM rollup_changes').fetchone()[0]
+    if high is None or high <= watermark:
+        return 0
+    buckets = c.execute('''
+        SELECT DISTINCT business_id, hour FROM rollup_changes WHERE seq > ? AND seq <= ?
+    ''', (watermark, high)).fetchall()
+    sources = _sources(c)
+    for business_id, hour in buckets:
+        c.execute('DELETE FROM call_rollups_hourly WHERE business_id = ? AND hour = ?', (business_id, hour))
+        for table in sources:
+            c.execute(f'''
+                INSERT INTO call_rollups_hourly
+                {_aggregate(table)}
+                WHERE business_id = ? AND timestamp >= ? AND timestamp < ?
+                GROUP BY 3, 4, 5
+                {_ADD}
+            ''', (business_id, hour, _next_hour(hour)))
+    _advance(c, high)
+    return len(buckets)
+
+
+def rebuild(c) -> int:
+    """Recompute every bucket from calls and archived_calls (one-shot migration)"""
+    c.execute('DELETE FROM call_rollups_hourly')
+    for table in _sources(c):
+        c.execute(f'''
+            INSERT INTO call_rollups_hourly
+            {_aggregate(table)}
+            WHERE business_id IS NOT NULL AND timestamp IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+            {_ADD}
+        ''')
+    high = c.execute('SELECT MAX(seq) FROM rollup_changes').fetchone()[0]
+    _advance(c, high or 0)
+    return c.execute('SELECT COUNT(*) FROM call_rollups_hourly').fetchone()[0]
+
+
+def _advance(c, high: int) -> None:
+    """Move the watermark to high and drop the consumed change log"""
+    c.execute('''
+        INSERT INTO rollup_state (name, watermark, refreshed_at) VALUES ('hourly', ?, ?)
+        ON CONFLICT(name) DO UPDATE SET watermark = excluded.watermark, refreshed_at = excluded.refreshed_at
+    ''', (high, datetime.now().isoformat()))
+    c.execute('DELETE FROM rollup_changes WHERE seq <= ?', (high,))
+
+
+def analytics(c, business_id: str, since: str, until: str,
+              group_by: Iterable[str] = ('day',)) -> List[dict]:
+    """
+    Volume, emergency share, booking-request rate and average duration over
+    [since, until) grouped by DIMENSIONS names; ValueError on unknown ones
+    """
+    group_by = list(dict.fromkeys(group_by))
+    unknown = [g for g in group_by if g not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"group_by must be among {', '.join(DIMENSIONS)}, not {', '.join(unknown)}")
+    columns = [f'{DIMENSIONS[g]} AS {g}' for g in group_by]
+    # Buckets are whole hours: a range starting mid-hour includes that hour
+    rows = c.execute(f'''
+        SELECT {', '.join(columns + [''])}
+               SUM(calls) AS calls,
+               SUM(calls * is_emergency) AS emergencies,
+               SUM(calls * booking_requested) AS booking_requests,
+               SUM(duration_sum) AS duration_sum,
+               SUM(duration_count) AS duration_count
+        FROM call_rollups_hourly
+        WHERE business_id = ? AND hour >= ? AND hour < ?
+        {'GROUP BY ' + ', '.join(group_by) if group_by else ''}
+        {'ORDER BY ' + ', '.join(group_by) if group_by else ''}
+    ''', (business_id, since[:13], until)).fetchall()
+    results = []
+    for row in rows:
+        result = {g: row[g] for g in group_by}
+        calls = row['calls'] or 0
+        result.update({
+            'calls': calls,
+            'emergencies': row['emergencies'] or 0,
+            'emergency_share': round(row['emergencies'] / calls, 4) if calls else None,
+            'booking_requests': row['booking_requests'] or 0,
+            'booking_rate': round(row['booking_requests'] / calls, 4) if calls else None,
+            'avg_duration': round(row['duration_sum'] / row['duration_count'], 1) if row['duration_count'] else None,
+        })
+        results.append(result)
+    return results
+
+
+def state(c) -> Dict[str, object]:
+    row = c.execute("SELECT watermark, refreshed_at FROM rollup_state WHERE name = 'hourly'").fetchone()
+    pending = c.execute('SELECT COUNT(*) FROM rollup_changes').fetchone()[0]
+    return {'watermark': row[0] if row else 0, 'refreshed_at': row[1] if row else None,
+            'pending_changes': pending}
+
+
+class RollupRefresher:
+    """
+    Background refresh() of every database databases() returns ({name:
+    path}) every `interval` seconds, once per process
+    """
+
+    def __init__(self, databases: Callable[[], Dict[str, object]], interval: float = 60):
+        self.databases = databases
+        self.interval = interval
+        self.stats = {'runs': 0, 'buckets': 0, 'errors': 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='rollup-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._pid = None
+
+    def run_once(self) -> int:
+        """Refresh each database in its own transaction; one broken tenant does not hold back the rest"""
+        buckets = 0
+        for name, path in self.databases().items():
+            try:
+                with storage.transaction(path) as c:
+                    buckets += refresh(c)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"❌ Rollup refresh of {name}: {e}")
+            finally:
+                storage.close_connection(path)
+        self.stats['runs'] += 1
+        self.stats['buckets'] += buckets
+        return buckets
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"❌ Rollup refresh: {e}")
+
+    def metrics(self) -> dict:
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in ("refresh", "rebuild"):
+        from app import TENANT_DBS
+        for business_id in TENANT_DBS.tenants():
+            with TENANT_DBS.transaction(business_id) as conn:
+                if command == "refresh":
+                    print(f"✅ {business_id}: refreshed {refresh(conn)} hourly buckets")
+                else:
+                    print(f"✅ {business_id}: rebuilt {rebuild(conn)} hourly rollup rows")
+    else:
+        print("Usage: python rollups.py refresh|rebuild")
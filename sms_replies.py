@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+SMS replies to appointment reminders
+Parses CONFIRM / CANCEL / reschedule replies and applies them to the sender's
+appointment, found through the (customer_phone_e164, status, scheduled_date,
+scheduled_time) index rather than a scan of every pending appointment.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import customer_profiles
+
+# Only a reply that is, or starts with, one of these keywords is acted on;
+# anything else ("please do not cancel", "not ok, the AC died") goes to a human.
+# STOP/UNSUBSCRIBE are Twilio opt-outs, not cancels
+INTENT_KEYWORDS = (
+    ('reschedule', {'reschedule', 'resched', 'postpone'}),
+    ('cancel', {'cancel', 'cancelled', 'canceled'}),
+    ('confirm', {'confirm', 'confirmed', 'yes', 'y', 'c', 'ok', 'okay', 'yep'}),
+)
+
+# Intent -> (statuses it applies to, in lookup order, new status)
+TRANSITIONS = {
+    'confirm': (('pending',), 'confirmed'),
+    'cancel': (('pending', 'confirmed'), 'cancelled'),
+    'reschedule': (('pending', 'confirmed'), 'reschedule_requested'),
+}
+
+REPLIES = {
+    'confirm': "You're confirmed for {when}. See you then!",
+    'cancel': "Your appointment on {when} has been cancelled. Reply or call us to book again.",
+    'reschedule': "Got it - our team will reach out to find a new time.",
+    None: "Thanks for your message. Our team will follow up shortly.",
+}
+
+_WORD = re.compile(r"[a-z']+")
+
+
+@dataclass
+class ReplyOutcome:
+    intent: Optional[str] = None
+    appointment_id: Optional[str] = None
+    status: Optional[str] = None
+    reply: str = REPLIES[None]
+
+
+def parse_intent(body: Optional[str]) -> Optional[str]:
+    """'confirm', 'cancel', 'reschedule' or None for free text"""
+    words = _WORD.findall((body or '').lower())
+    if not words:
+        return None
+    intent = next((i for i, keywords in INTENT_KEYWORDS if words[0] in keywords), None)
+    if intent is None or (len(words[0]) == 1 and len(words) > 1):
+        return None  # single letters only count as a whole reply ("C", "Y")
+    others = {k for i, keywords in INTENT_KEYWORDS if i != intent for k in keywords if len(k) > 1}
+    if others & set(words[1:]):
+        return None  # "yes, cancel it": mixed, let a person read it
+    return intent
+
+
+def init_schema(c) -> None:
+    # Replaces idx_appointments_reply, which could not order by time of day
+    c.execute('DROP INDEX IF EXISTS idx_appointments_reply')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_reply_next
+        ON appointments(customer_phone_e164, status, scheduled_date, scheduled_time)
+    ''')
+
+
+def find_appointment(c, phone: str, status: str, today: Optional[str] = None):
+    """
+    The customer's next appointment in this status, from today on; with none
+    upcoming, the latest past one (a late reply to a reminder). Each is one
+    index seek.
+    """
+    today = today or date.today().isoformat()
+    upcoming = c.execute('''
+        SELECT id, scheduled_date, scheduled_time FROM appointments
+        WHERE customer_phone_e164 = ? AND status = ? AND scheduled_date >= ?
+        ORDER BY scheduled_date, scheduled_time LIMIT 1
+    ''', (phone, status, today)).fetchone()
+    if upcoming is not None:
+        return upcoming
+    return c.execute('''
+        SELECT id, scheduled_date, scheduled_time FROM appointments
+        WHERE customer_phone_e164 = ? AND status = ?
+        ORDER BY scheduled_date DESC, scheduled_time DESC LIMIT 1
+    ''', (phone, status)).fetchone()
+
+
+def apply_reply(c, phone: Optional[str], body: Optional[str]) -> ReplyOutcome:
+    """Apply an inbound SMS on the caller's open transaction (the sms_log insert's)"""
+    outcome = ReplyOutcome(intent=parse_intent(body))
+    if outcome.intent is None or not phone:
+        return outcome
+
+    statuses, new_status = TRANSITIONS[outcome.intent]
+    for status in statuses:
+        appointment = find_appointment(c, phone, status)
+        if appointment is not None:
+            break
+    else:
+        outcome.reply = "We couldn't find an open appointment for this number. Our team will follow up shortly."
+        return outcome
+
+    c.execute('UPDATE appointments SET status = ? WHERE id = ?', (new_status, appointment['id']))
+    customer_profiles.refresh_open_appointment(c, phone)
+    outcome.appointment_id, outcome.status = appointment['id'], new_status
+    when = ' '.join(filter(None, (appointment['scheduled_date'], appointment['scheduled_time'])))
+    outcome.reply = REPLIES[outcome.intent].format(when=when or 'your scheduled day')
+    return outcome
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Durable raw webhook spool
+Segmented append-only log of every webhook body, framed with a length
+prefix and CRC so ingestion can be replayed over any time range
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime, time as day_time
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+# Record frame: body length, CRC32 of (received_at + source + body), received_at
+HEADER = struct.Struct('<IId')
+SOURCE_LEN = struct.Struct('<B')
+SEGMENT_SUFFIX = '.seg'
+
+
+class SpoolRecord(NamedTuple):
+    received_at: float
+    source: str
+    body: bytes
+    segment: str
+    offset: int
+
+
+def _segment_start(path: Path) -> float:
+    """Segments are named <epoch-ms of first record>-<writer pid>"""
+    return int(path.stem.split('-')[0]) / 1000
+
+
+def _segment_writer(path: Path) -> str:
+    return path.stem.split('-')[1]
+
+
+class Spool:
+    """Append-only, segment-rotated spool of raw webhook payloads"""
+
+    def __init__(self, directory, segment_bytes: int = 64 * 1024 * 1024, fsync: bool = False):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def segments(self):
+        """Segment files in write order"""
+        return sorted(self.directory.glob(f'*{SEGMENT_SUFFIX}'), key=_segment_start)
+
+    def _open_segment(self, received_at: float):
+        if self._file is not None:
+            self._file.close()
+        # Each process writes its own segments so gunicorn workers never interleave
+        self._pid = os.getpid()
+        start_ms = int(received_at * 1000)
+        path = self.directory / f'{start_ms:013d}-{self._pid}{SEGMENT_SUFFIX}'
+        while path.exists():
+            start_ms += 1
+            path = self.directory / f'{start_ms:013d}-{self._pid}{SEGMENT_SUFFIX}'
+        self._file = open(path, 'ab')
+
+    def append(self, source: str, body: bytes, received_at: Optional[float] = None) -> float:
+        """Append one raw body; returns its received_at timestamp"""
+        received_at = received_at or time.time()
+        source_bytes = source.encode('utf-8')
+        payload = SOURCE_LEN.pack(len(source_bytes)) + source_bytes + body
+        stamp = struct.pack('<d', received_at)
+        crc = zlib.crc32(payload, zlib.crc32(stamp))
+        frame = HEADER.pack(len(payload), crc, received_at) + payload
+
+        with self._lock:
+            if (self._file is None or self._pid != os.getpid()
+                    or self._file.tell() >= self.segment_bytes):
+                self._open_segment(received_at)
+            self._file.write(frame)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        return received_at
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def read(self, since: Optional[float] = None, until: Optional[float] = None,
+             sources=None) -> Iterator[SpoolRecord]:
+        """Yield records received in [since, until], segment by segment"""
+        segments = self.segments()
+        # Each writer rotates sequentially, so a segment is entirely older
+        # than `since` when the same writer's next segment starts before it
+        next_start = {}
+        skip = set()
+        for path in reversed(segments):
+            writer = _segment_writer(path)
+            if since is not None and next_start.get(writer, float('inf')) <= since:
+                skip.add(path)
+            next_start[writer] = _segment_start(path)
+
+        for path in segments:
+            if path in skip:
+                continue
+            if until is not None and _segment_start(path) > until:
+                continue
+            for record in self._read_segment(path):
+                if since is not None and record.received_at < since:
+                    continue
+                if until is not None and record.received_at > until:
+                    continue
+                if sources and record.source not in sources:
+                    continue
+                yield record
+
+    def _read_segment(self, path: Path) -> Iterator[SpoolRecord]:
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            length, crc, received_at = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length:
+                print(f"⚠️ Spool: truncated record at {path.name}:{offset}")
+                return
+            stamp = struct.pack('<d', received_at)
+            if zlib.crc32(payload, zlib.crc32(stamp)) != crc:
+                print(f"⚠️ Spool: CRC mismatch at {path.name}:{offset}, skipping rest of segment")
+                return
+            source_len = payload[0]
+            source = payload[1:1 + source_len].decode('utf-8')
+            yield SpoolRecord(received_at, source, payload[1 + source_len:], path.name, offset)
+            offset = start + length
+
+
+def parse_time(value: Optional[str], end_of_day: bool = False) -> Optional[float]:
+    """
+    Parse an ISO date/datetime (local time) into an epoch timestamp.
+    A bare date is its midnight, or its last microsecond with end_of_day, so
+    an inclusive upper bound of 2026-03-31 covers all of that day.
+    """
+    if not value:
+        return None
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    return datetime.combine(day, day_time.max if end_of_day else day_time.min).timestamp()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Shared SQLite access layer
+Persistent per-thread connections, WAL tuning and context-managed transactions.
+A thread's connections are closed when the thread ends, so servers that run
+every request on a new thread (Flask's threaded dev server) don't leak them.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+# Applied once when a connection is opened, never per request
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+    ('cache_size', int(os.environ.get('SQLITE_CACHE_KB', 16000)) * -1),
+    ('busy_timeout', int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+    ('temp_store', 'MEMORY'),
+    # Safety net for INSERT OR REPLACE into trigger-maintained tables; the
+    # writers here use upsert_sql, which does not depend on it
+    ('recursive_triggers', 'ON'),
+]
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+
+
+class _ThreadConnections:
+    """
+    One thread's connections. Only the thread's local storage refers to it,
+    so it is collected, and the connections closed, when the thread ends.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, sqlite3.Connection] = {}
+        weakref.finalize(self, _close_connections, self.connections, os.getpid())
+
+
+def _close_connections(connections: Dict[str, sqlite3.Connection], pid: int) -> None:
+    if os.getpid() != pid:
+        return  # the parent process still uses these
+    for conn in list(connections.values()):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    connections.clear()
+
+
+# Every live thread's connections, for close_all()
+_registry: 'weakref.WeakSet[_ThreadConnections]' = weakref.WeakSet()
+
+
+def _thread_connections() -> Dict[str, sqlite3.Connection]:
+    """Connections owned by the current thread, reset after a fork"""
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        # gunicorn forks workers; never reuse a connection from the parent
+        _local.pid = pid
+        _local.owner = _ThreadConnections()
+        with _registry_lock:
+            _registry.add(_local.owner)
+    return _local.owner.connections
+
+
+def open_connection(path) -> sqlite3.Connection:
+    """Open a new tuned connection (callers own its lifetime)"""
+    conn = sqlite3.connect(
+        str(path),
+        isolation_level=None,  # transactions are explicit, see transaction()
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def get_connection(path) -> sqlite3.Connection:
+    """Return this thread's persistent connection to the database at path"""
+    key = str(Path(path))
+    connections = _thread_connections()
+    conn = connections.get(key)
+    if conn is None:
+        conn = open_connection(key)
+        connections[key] = conn
+    return conn
+
+
+@contextmanager
+def transaction(path, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+    """
+    Run a block inside one transaction on this thread's connection.
+
+    Takes the write lock up front (BEGIN IMMEDIATE) so concurrent writers
+    wait on busy_timeout instead of failing with "database is locked" when
+    upgrading. Nested use becomes a savepoint on the outer transaction.
+    """
+    conn = get_connection(path)
+
+    if conn.in_transaction:
+        depth = getattr(_local, 'savepoint_depth', 0) + 1
+        _local.savepoint_depth = depth
+        name = f'sp_{depth}'
+        conn.execute(f'SAVEPOINT {name}')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f'ROLLBACK TO {name}')
+            conn.execute(f'RELEASE {name}')
+            raise
+        else:
+            conn.execute(f'RELEASE {name}')
+        finally:
+            _local.savepoint_depth = depth - 1
+        return
+
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+
+
+def upsert_sql(table: str, columns, key: str = 'id', source: str = None,
+               merge: Dict[str, str] = None) -> str:
+    """INSERT ... ON CONFLICT(key) DO UPDATE of columns into table
+
+    Unlike INSERT OR REPLACE, a rewrite is an UPDATE of the existing row, so the
+    triggers that keep derived tables in step (counters, FTS, rollups) see it
+    whether or not recursive_triggers is on. source is a SELECT to insert from
+    instead of one row of ? placeholders; it needs a WHERE clause, or SQLite
+    reads ON CONFLICT as part of a join. merge maps a column to the expression
+    it is updated to instead of excluded.<column> (the bare column is the
+    stored value).
+    """
+    names = ', '.join(columns)
+    rows = source or f"VALUES ({', '.join('?' * len(columns))})"
+    merge = merge or {}
+    updates = ', '.join(f"{col} = {merge.get(col, f'excluded.{col}')}" for col in columns if col != key)
+    return f'''
+        INSERT INTO {table} ({names}) {rows}
+        ON CONFLICT({key}) DO UPDATE SET {updates}
+    '''
+
+
+def close_connection(path) -> None:
+    """Close the current thread's connection to path, if any"""
+    key = str(Path(path))
+    conn = _thread_connections().pop(key, None)
+    if conn is not None:
+        conn.close()
+
+
+def close_all() -> None:
+    """Close every connection opened through this module (shutdown hook)"""
+    with _registry_lock:
+        owners = list(_registry)
+    for owner in owners:
+        _close_connections(owner.connections, os.getpid())
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Per-tenant databases
+Each business gets its own SQLite file (<business_id>.db in the tenant
+directory) with the full calls schema, created on first use, so one shop's
+write bursts never hold the writer lock for the others. The default business
+keeps living in the main database with everything written before sharding.
+
+Connections to tenant files are pooled per business: a thread checks one
+out for the duration of a read or transaction (nested use on the same thread
+gets the same one) and returns it, so the next request, on whatever thread,
+reuses it. Concurrent users each hold their own, so WAL readers never queue
+behind each other or behind a write. Idle connections beyond max_open, or
+unused for idle_timeout seconds, are closed, least recently used first;
+connections in use are never closed, so max_open bounds the idle pool plus
+whatever is checked out at the time.
+TenantDirectory maps the number a caller dialled to its business.
+
+Usage:
+    python tenants.py list                        # tenants with a database
+    python tenants.py report "SELECT COUNT(*) AS calls FROM calls"
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import storage
+from phone import normalize_phone
+
+# business_id becomes a file name: nothing that could leave the directory
+BUSINESS_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+
+class TenantDirectory:
+    """Called number -> business_id, from the companies config file"""
+
+    def __init__(self, path, default_business_id: str):
+        self.path = Path(path)
+        self.default_business_id = default_business_id
+        self._numbers: Dict[str, str] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return {}
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    numbers = {}
+                    with open(self.path) as f:
+                        for company in json.load(f).get('companies', []):
+                            if not company.get('active', True) or not company.get('company_id'):
+                                continue
+                            for field in ('twilio_phone_number', 'phone'):
+                                e164 = normalize_phone(company.get(field))
+                                if e164:
+                                    numbers.setdefault(e164, company['company_id'])
+                    self._numbers, self._mtime = numbers, mtime
+        return self._numbers
+
+    def resolve(self, called_number: Optional[str]) -> str:
+        """business_id owning called_number, the default business if none does"""
+        e164 = normalize_phone(called_number)
+        return self._load().get(e164, self.default_business_id) if e164 else self.default_business_id
+
+
+class _Entry:
+    def __init__(self, business_id: str, conn: sqlite3.Connection):
+        self.business_id = business_id
+        self.conn = conn
+        self.users = 0  # nested checkouts by the thread holding it
+        self.last_used = time.monotonic()
+
+
+class TenantDatabases:
+    """One database per business_id behind a bounded pool of connections per business"""
+
+    def __init__(self, db_path, directory, default_business_id: str,
+                 init: Optional[Callable] = None, max_open: int = 64, idle_timeout: float = 300):
+        self.db_path = db_path
+        self.directory = Path(directory)
+        self.default_business_id = default_business_id
+        self.init = init
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.stats = {'hits': 0, 'opened': 0, 'created': 0, 'evicted': 0}
+        self._idle: 'OrderedDict[int, _Entry]' = OrderedDict()  # id(entry), least recently used first
+        self._in_use = 0
+        self._initialized = set()
+        self._init_locks: Dict[str, threading.Lock] = {}
+        self._held = threading.local()  # business_id -> _Entry checked out by this thread
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def path(self, business_id: str) -> Path:
+        """Database file of business_id; ValueError if it cannot be a file name"""
+        if business_id == self.default_business_id:
+            return Path(self.db_path)
+        if not isinstance(business_id, str) or not BUSINESS_ID.fullmatch(business_id):
+            raise ValueError(f'invalid business_id: {business_id!r}')
+        return self.directory / f'{business_id}.db'
+
+    def exists(self, business_id: str) -> bool:
+        return business_id == self.default_business_id or self.path(business_id).exists()
+
+    def tenants(self) -> List[str]:
+        """The default business, then every business with a database file"""
+        files = sorted(p.stem for p in self.directory.glob('*.db')) if self.directory.is_dir() else []
+        return [self.default_business_id] + [b for b in files if b != self.default_business_id]
+
+    def _pool(self) -> 'OrderedDict[int, _Entry]':
+        """Idle connections (caller holds _lock)"""
+        if self._pid != os.getpid():
+            # Never share a parent's connections with a forked worker
+            self._pid = os.getpid()
+            self._idle = OrderedDict()
+            self._in_use = 0
+            self._held = threading.local()
+        return self._idle
+
+    def _held_entries(self) -> Dict[str, _Entry]:
+        return self._held.__dict__.setdefault('entries', {})
+
+    def _checkout(self, business_id: str) -> _Entry:
+        path = self.path(business_id)
+        held = self._held_entries()
+        entry = held.get(business_id)
+        if entry is not None:
+            entry.users += 1  # nested use: a transaction inside a read, a savepoint
+            return entry
+        with self._lock:
+            idle = self._pool()
+            # Most recently used first: its pages are the likeliest to be cached
+            key = next((k for k in reversed(idle) if idle[k].business_id == business_id), None)
+            if key is not None:
+                entry = idle.pop(key)
+                self._in_use += 1
+                self.stats['hits'] += 1
+        if entry is None:
+            entry = self._open(business_id, path)
+        entry.users = 1
+        held[business_id] = entry
+        return entry
+
+    def _open(self, business_id: str, path: Path) -> _Entry:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        created = not path.exists()
+        conn = storage.open_connection(path)
+        try:
+            self._init(business_id, conn)
+        except BaseException:
+            conn.close()
+            raise
+        with self._lock:
+            self._pool()
+            self._in_use += 1
+            self.stats['opened'] += 1
+            self.stats['created'] += created
+        if created:
+            print(f"✅ Created database for tenant {business_id}")
+        return _Entry(business_id, conn)
+
+    def _init(self, business_id: str, conn: sqlite3.Connection) -> None:
+        """Run init once per process per tenant, not just on creation: files made by older code get new tables too"""
+        if self.init is None:
+            return
+        with self._lock:
+            if business_id in self._initialized:
+                return
+            init_lock = self._init_locks.setdefault(business_id, threading.Lock())
+        with init_lock:
+            if business_id in self._initialized:
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.init(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            with self._lock:
+                self._initialized.add(business_id)
+
+    def _release(self, entry: _Entry) -> None:
+        entry.users -= 1
+        if entry.users:
+            return
+        del self._held_entries()[entry.business_id]
+        if entry.conn.in_transaction:
+            entry.conn.execute('ROLLBACK')  # never hand a half-done transaction to the next user
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            entry.last_used = time.monotonic()
+            self._pool()[id(entry)] = entry
+            self._evict()
+
+    def _evict(self) -> None:
+        """Close idle connections, oldest first, beyond max_open or idle_timeout (holding _lock)"""
+        idle = self._pool()
+        now = time.monotonic()
+        for key, entry in list(idle.items()):
+            if len(idle) + self._in_use > self.max_open or now - entry.last_used > self.idle_timeout:
+                del idle[key]
+                entry.conn.close()
+                self.stats['evicted'] += 1
+
+    @contextmanager
+    def connection(self, business_id: str) -> Iterator[sqlite3.Connection]:
+        """A connection to business_id's database, this thread's until the block ends"""
+        if business_id == self.default_business_id:
+            yield storage.get_connection(self.db_path)
+            return
+        entry = self._checkout(business_id)
+        try:
+            yield entry.conn
+        finally:
+            self._release(entry)
+
+    @contextmanager
+    def transaction(self, business_id: str) -> Iterator[sqlite3.Connection]:
+        """storage.transaction() on business_id's database"""
+        if business_id == self.default_business_id:
+            with storage.transaction(self.db_path) as conn:
+                yield conn
+            return
+        with self.connection(business_id) as conn:
+            if conn.in_transaction:
+                conn.execute('SAVEPOINT tenant')
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute('ROLLBACK TO tenant')
+                    conn.execute('RELEASE tenant')
+                    raise
+                conn.execute('RELEASE tenant')
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def read(self, business_id: str, fn: Callable, default=None):
+        """fn(connection) on business_id's database, default if it has none yet (reads never create one)"""
+        if not self.exists(business_id):
+            return default
+        with self.connection(business_id) as conn:
+            return fn(conn)
+
+    def map(self, fn: Callable, tenants: Optional[List[str]] = None) -> Dict[str, object]:
+        """{business_id: fn(connection)} over every tenant (or the given ones)"""
+        results = {}
+        for business_id in tenants or self.tenants():
+            with self.connection(business_id) as conn:
+                results[business_id] = fn(conn)
+        return results
+
+    def aggregate(self, sql: str, params=(), tenants: Optional[List[str]] = None) -> List[dict]:
+        """
+        Run one read-only query in every tenant's database (internal
+        reporting); each row comes back as a dict tagged with its business_id
+        """
+        rows = []
+        for business_id, result in self.map(lambda c: c.execute(sql, params).fetchall(), tenants).items():
+            rows.extend({'business_id': business_id, **dict(row)} for row in result)
+        return rows
+
+    def evict_idle(self) -> None:
+        with self._lock:
+            self._evict()
+
+    def close(self) -> None:
+        """Close every idle connection (shutdown hook)"""
+        with self._lock:
+            idle = self._pool()
+            for entry in idle.values():
+                entry.conn.close()
+            idle.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'open': len(self._pool()) + self._in_use}
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "list":
+        from app import TENANT_DBS
+        for business_id in TENANT_DBS.tenants():
+            print(f"{business_id}: {TENANT_DBS.path(business_id)}")
+    elif command == "report" and len(sys.argv) > 2:
+        from app import TENANT_DBS
+        for row in TENANT_DBS.aggregate(sys.argv[2]):
+            print(json.dumps(row, default=str))
+    else:
+        print("Usage: python tenants.py list|report <sql>")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for webhook admission control
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from admission import AdmissionController
+
+
+def test_sheds_past_in_flight_limit_and_recovers():
+    recovered = threading.Event()
+    controller = AdmissionController(max_in_flight=1, max_queue_depth=100)
+    controller.on_recover(recovered.set)
+
+    with controller.admit() as first:
+        with controller.admit() as second:
+            assert first and not second
+            assert controller.metrics()['shedding']
+    assert not controller.shedding
+    assert recovered.wait(1)
+    assert controller.stats == {'admitted': 1, 'shed': 1, 'shed_episodes': 1}
+
+
+def test_sheds_on_queue_depth_with_hysteresis():
+    depth = [0]
+    controller = AdmissionController(max_in_flight=100, max_queue_depth=10,
+                                     queue_depth=lambda: depth[0])
+    depth[0] = 11
+    with controller.admit() as full:
+        assert not full
+    depth[0] = 8  # below the limit but above the recovery mark
+    with controller.admit() as full:
+        assert not full
+    depth[0] = 5
+    with controller.admit() as full:
+        assert full
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable alert outbox
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import alert_outbox
+from alert_outbox import AlertOutbox
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    yield tmp_path / 'outbox.db'
+    storage.close_all()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_delivers_in_order_and_dedups(db_path):
+    delivered = []
+    outbox = AlertOutbox(db_path, {'email': lambda to, p: delivered.append((to, p['n']))},
+                         poll_interval=0.05)
+    with storage.transaction(db_path) as c:
+        for n in range(5):
+            outbox.enqueue(c, 'email', 'tech@example.com', {'n': n}, dedup_key=f'call-{n}')
+        assert not outbox.enqueue(c, 'email', 'tech@example.com', {'n': 0}, dedup_key='call-0')
+    outbox.notify()
+
+    assert wait_for(lambda: len(delivered) == 5)
+    assert [n for _, n in delivered] == [0, 1, 2, 3, 4]
+    outbox.stop()
+
+
+def test_failed_head_blocks_recipient_then_dead_letters(db_path):
+    delivered = []
+
+    def flaky(to, payload):
+        if payload['n'] == 0:
+            raise ConnectionError('smtp down')
+        delivered.append(payload['n'])
+
+    outbox = AlertOutbox(db_path, {'email': flaky}, max_attempts=3,
+                         base_delay=0.01, max_delay=0.05, poll_interval=0.02)
+    with storage.transaction(db_path) as c:
+        outbox.enqueue(c, 'email', 'a@example.com', {'n': 0})
+        outbox.enqueue(c, 'email', 'a@example.com', {'n': 1})
+    outbox.notify()
+
+    assert wait_for(lambda: delivered == [1])
+    assert outbox.stats['dead'] == 1 and outbox.stats['retried'] == 2
+    assert outbox.metrics()['backlog'] == {'dead': 1}
+    outbox.stop()
+
+
+def test_backlog_seeks_the_index_and_sent_rows_are_purged(db_path):
+    delivered = []
+    outbox = AlertOutbox(db_path, {'email': lambda to, p: delivered.append(p['n'])},
+                         poll_interval=0.02, sent_retention=3600)
+    conn = storage.get_connection(db_path)
+    plan = ' | '.join(r[-1] for r in conn.execute('EXPLAIN QUERY PLAN ' + alert_outbox.BACKLOG))
+    assert 'SEARCH' in plan and 'idx_outbox_status' in plan, plan
+
+    with storage.transaction(db_path) as c:
+        for n in range(3):
+            outbox.enqueue(c, 'email', 'tech@example.com', {'n': n}, dedup_key=f'call-{n}')
+    outbox.notify()
+    assert wait_for(lambda: len(delivered) == 3)
+    outbox.stop()
+    assert outbox.metrics()['backlog'] == {}
+
+    assert outbox.purge() == 0  # within retention
+    assert outbox.purge(time.time() + 3601, batch_size=2) == 3
+    assert conn.execute('SELECT COUNT(*) FROM alert_outbox').fetchone()[0] == 0
+    assert outbox.metrics()['purged'] == 3
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+End-to-end tests of the Flask app's call reads: whatever serves a page (the
+recent-calls buffer, main, archived months), /api/calls must list every call.
+Other processes' writes (backfill.py, replay.py) must show up too. Also the
+startup work a restarted worker owes calls deferred before it
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(tempfile.mkdtemp(prefix='revenue_rescue_app_'))
+(ROOT / 'companies.json').write_text(json.dumps({'companies': [
+    {'company_id': 'acme', 'twilio_phone_number': '+13125550100', 'active': True},
+    {'company_id': 'globex', 'twilio_phone_number': '+13125550101', 'active': True},
+    {'company_id': 'initech', 'twilio_phone_number': '+13125550102', 'active': True},
+]}))
+os.environ.update({
+    'DATABASE_PATH': str(ROOT / 'calls.db'),
+    'TENANTS_FILE': str(ROOT / 'companies.json'),
+    'SPOOL_DIR': str(ROOT / 'spool'),
+})
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import app
+import recent_calls
+import replay
+import storage
+from recent_calls import RecentCalls
+from spool import Spool, parse_time
+
+
+@pytest.fixture(scope='module')
+def client():
+    yield app.app.test_client()
+    app.CALL_WRITER.stop()
+    storage.close_all()
+
+
+def end_of_call(call_id, when, number=None):
+    """What /webhook/vapi queues for an end-of-call report received at `when`"""
+    call = {'id': call_id, 'customer': {'number': '+13125550199'}}
+    if number:
+        call['phoneNumber'] = {'number': number}
+    record = app.build_call_record({
+        'message': {'type': 'end-of-call-report', 'transcript': 'Can someone tune up the furnace next week?'},
+        'call': call,
+    }, when.timestamp())
+    record['alert'] = False
+    app.CALL_WRITER.put(record)
+    assert app.CALL_WRITER.flush(5)
+
+
+def listed(client, query, limit=1):
+    """Every id /api/calls returns for query, following the cursor"""
+    ids, url = [], f'/api/calls?{query}&limit={limit}'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        ids += [call['id'] for call in response.get_json()]
+        url = response.headers.get('Link', '').partition('<')[2].partition('>')[0]
+    return ids
+
+
+def test_archived_months_stay_listed_per_business(client):
+    end_of_call('jan-1', datetime(2026, 1, 5, 9))
+    end_of_call('now-1', datetime.now())
+    assert listed(client, 'business_id=demo') == ['now-1', 'jan-1']
+
+    assert app.ARCHIVER.run_once()['calls'] == 1
+    assert listed(client, 'business_id=demo') == ['now-1', 'jan-1']
+    assert listed(client, 'business_id=demo', limit=20) == ['now-1', 'jan-1']
+
+    # After a restart the buffer is warmed from main, which no longer has January
+    app.warm_recent_calls()
+    assert listed(client, 'business_id=demo', limit=20) == ['now-1', 'jan-1']
+    assert listed(client, 'business_id=demo&since=2026-01-01&until=2026-02-01') == ['jan-1']
+
+
+@pytest.mark.parametrize('business_id, number, warm', [
+    ('acme', '(312) 555-0100', True),
+    ('globex', '(312) 555-0101', False),
+])
+def test_tenant_calls_survive_a_restart(client, monkeypatch, business_id, number, warm):
+    end_of_call(f'{business_id}-1', datetime(2026, 10, 1, 9), number=number)
+    assert listed(client, f'business_id={business_id}') == [f'{business_id}-1']
+
+    monkeypatch.setattr(app, 'HOT_CALLS', RecentCalls(app.HOT_CALLS.fields, app.HOT_CALLS.size))
+    if warm:
+        assert app.warm_recent_calls() >= 1
+    end_of_call(f'{business_id}-2', datetime(2026, 10, 2, 9), number=number)
+    assert listed(client, f'business_id={business_id}') == [f'{business_id}-2', f'{business_id}-1']
+    assert listed(client, f'business_id={business_id}', limit=20) == [f'{business_id}-2', f'{business_id}-1']
+    assert listed(client, f'business_id={business_id}&since=2026-10-02') == [f'{business_id}-2']
+
+
+def test_tenant_databases_are_archived_too(client):
+    end_of_call('initech-jan', datetime(2026, 1, 5, 9), number='(312) 555-0102')
+    end_of_call('initech-now', datetime.now(), number='(312) 555-0102')
+
+    assert 'initech:2026-01' in app.ARCHIVER.run_once()['months']
+    store = app.tenant_partitions('initech')
+    assert store.path('2026-01').exists() and store.directory != app.PARTITIONS.directory
+    with app.TENANT_DBS.connection('initech') as c:
+        assert [r[0] for r in c.execute('SELECT id FROM calls')] == ['initech-now']
+
+    assert listed(client, 'business_id=initech') == ['initech-now', 'initech-jan']
+    assert listed(client, 'business_id=initech', limit=20) == ['initech-now', 'initech-jan']
+    call = client.get('/api/calls/initech-jan?business_id=initech').get_json()
+    assert call['business_id'] == 'initech' and call['raw_data']['call']['id'] == 'initech-jan'
+    found = client.get('/api/calls/search?q=furnace&business_id=initech').get_json()['results']
+    assert sorted(r['id'] for r in found) == ['initech-jan', 'initech-now']
+
+
+def test_calls_deferred_before_a_restart_are_processed(client):
+    app.CALL_WRITER.put(app.build_deferred_record({
+        'message': {'type': 'end-of-call-report', 'transcript': 'The furnace is making a noise'},
+        'call': {'id': 'deferred-1', 'customer': {'number': '+13125550199'}},
+    }, 'vapi', datetime(2026, 10, 3, 9).timestamp()))
+    assert app.CALL_WRITER.flush(5)
+
+    # A fresh worker: no shedding episode will end to trigger on_recover
+    app._deferred_pid = None
+    assert client.get('/health').status_code == 200
+    for thread in threading.enumerate():
+        if thread.name == 'deferred-resume':
+            thread.join(10)
+    call = client.get('/api/calls/deferred-1').get_json()
+    assert not call['status'].startswith('deferred')
+
+
+@pytest.mark.parametrize('business_id, number', [('demo', None), ('acme', '(312) 555-0100')])
+def test_other_processes_writes_are_listed(client, business_id, number):
+    end_of_call(f'{business_id}-ours', datetime(2026, 10, 10, 9), number=number)
+    assert listed(client, f'business_id={business_id}&since=2026-10-10&until=2026-10-11') == [f'{business_id}-ours']
+    resyncs = app.HOT_CALLS.resyncs
+    end_of_call(f'{business_id}-ours-2', datetime(2026, 10, 10, 10), number=number)
+    assert listed(client, f'business_id={business_id}&since=2026-10-10&until=2026-10-11', limit=20) == \
+        [f'{business_id}-ours-2', f'{business_id}-ours']
+    assert app.HOT_CALLS.resyncs == resyncs  # our own writes keep the buffer current
+
+    # What a backfill or a status fix from a shell does: a plain connection, another process
+    path = app.DB_PATH if business_id == 'demo' else app.TENANT_DBS.path(business_id)
+    other = sqlite3.connect(path)
+    with other:
+        other.execute("INSERT INTO calls (id, timestamp, business_id, status) VALUES (?, ?, ?, 'open')",
+                      (f'{business_id}-theirs', '2026-10-10T11:00:00', business_id))
+        other.execute("UPDATE calls SET status = 'closed' WHERE id = ?", (f'{business_id}-ours',))
+    other.close()
+
+    found = client.get(f'/api/calls?business_id={business_id}&since=2026-10-10&until=2026-10-11&limit=20').get_json()
+    assert [(c['id'], c['status']) for c in found] == [
+        (f'{business_id}-theirs', 'open'), (f'{business_id}-ours-2', 'open'), (f'{business_id}-ours', 'closed')
+    ]
+    assert app.HOT_CALLS.page({'business_id': business_id, 'since': '2026-10-10', 'until': '2026-10-11'}, limit=20) is not None
+
+
+
+def test_replay_until_a_date_keeps_that_day_and_sent_alerts(client, tmp_path):
+    body = json.dumps({
+        'message': {'type': 'end-of-call-report', 'transcript': 'No heat at all, the furnace died'},
+        'call': {'id': 'replayed-1', 'customer': {'number': '+13125550199'}},
+    }).encode()
+    spool = Spool(tmp_path)
+    spool.append('vapi', body, received_at=datetime(2026, 10, 12, 15).timestamp())
+    spool.close()
+    with storage.transaction(app.DB_PATH) as c:
+        c.execute("INSERT INTO calls (id, timestamp, business_id, technician_notified, status) "
+                  "VALUES ('replayed-1', '2026-10-12T15:00:00', 'demo', 1, 'open')")
+
+    stats = replay.replay(spool, since=parse_time('2026-10-12'),
+                          until=parse_time('2026-10-12', end_of_day=True))
+    assert stats['written'] == 1
+    row = storage.get_connection(app.DB_PATH).execute(
+        "SELECT transcript, technician_notified FROM calls WHERE id = 'replayed-1'").fetchone()
+    assert row['transcript'] == 'No heat at all, the furnace died'
+    assert row['technician_notified'] == 1
+
+
+def test_dashboard_refresh_syncs_only_after_a_commit(client, monkeypatch):
+    end_of_call('dash-1', datetime.now(), number='(312) 555-0100')
+    first = client.get('/dashboard?business_id=acme')
+    assert first.status_code == 200
+    reads = []
+    real = recent_calls.data_version
+    monkeypatch.setattr(recent_calls, 'data_version', lambda c: reads.append(1) or real(c))
+    again = client.get('/dashboard?business_id=acme', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and reads == []
+
+    other = sqlite3.connect(app.TENANT_DBS.path('acme'))
+    with other:
+        other.execute("INSERT INTO calls (id, timestamp, business_id, status) VALUES ('dash-2', ?, 'acme', 'open')",
+                      (datetime.now().isoformat(),))
+    other.close()
+    changed = client.get('/dashboard?business_id=acme', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and reads and b'dash-2' in changed.data
+
+
+def test_dashboard_renders_a_call_without_timestamp():
+    html = app.DASHBOARD_TEMPLATE.render(
+        business_id='demo', day='2026-10-17', last_event_id=0, pending_appointments=[],
+        today_calls=[{'id': 'no-time', 'timestamp': None, 'status': 'open'}],
+        calls_today=1, emergencies_today=0, pending_count=0)
+    assert 'data-id="no-time"' in html
+
+def outbox(call_id):
+    return storage.get_connection(app.DB_PATH).execute(
+        'SELECT COUNT(*) FROM alert_outbox WHERE dedup_key = ?', (f'{call_id}:emergency',)).fetchone()[0]
+
+
+def pending_alerts(business_id):
+    return app.TENANT_DBS.read(business_id, lambda c: [
+        r[0] for r in c.execute('SELECT call_id FROM pending_alerts')
+    ])
+
+
+def test_tenant_alerts_survive_a_lost_main_transaction(client):
+    record = app.build_call_record({
+        'message': {'type': 'end-of-call-report', 'transcript': 'I smell gas in the basement'},
+        'call': {'id': 'globex-gas', 'customer': {'number': '+13125550199'},
+                 'phoneNumber': {'number': '+13125550101'}},
+    }, datetime(2026, 10, 4, 9).timestamp())
+    record['alert'] = True
+
+    # The tenant commit happened, then the process died before the main one
+    app.write_sharded_calls([record])
+    assert pending_alerts('globex') == ['globex-gas'] and outbox('globex-gas') == 0
+
+    assert app.resume_pending_alerts() == 1
+    assert outbox('globex-gas') == len(app.ALERT_RECIPIENTS)
+    assert pending_alerts('globex') == []
+
+    # The normal path leaves no marker behind
+    app.CALL_WRITER.put({**record, 'id': 'globex-gas-2'})
+    assert app.CALL_WRITER.flush(5)
+    assert outbox('globex-gas-2') == len(app.ALERT_RECIPIENTS) and pending_alerts('globex') == []
+
+
+def test_deferred_call_is_listed_once_while_moving(client):
+    placeholder = app.build_deferred_record({
+        'message': {'type': 'end-of-call-report', 'transcript': 'Furnace is making a noise'},
+        'call': {'id': 'moving-1', 'customer': {'number': '+13125550199'},
+                 'phoneNumber': {'number': '+13125550102'}},
+    }, 'vapi', datetime(2026, 10, 5, 9).timestamp())
+    app.CALL_WRITER.put(placeholder)
+    assert app.CALL_WRITER.flush(5)
+    record = app.build_call_record(placeholder['payload'], datetime(2026, 10, 5, 9).timestamp())
+    app.write_sharded_calls([record])  # the main transaction has not deleted the placeholder yet
+
+    assert listed(client, 'since=2026-10-05&until=2026-10-06', limit=20) == ['moving-1']
+    assert listed(client, 'since=2026-10-05&until=2026-10-06') == ['moving-1']
+
+
+def test_bare_health_counts_every_business(client):
+    end_of_call('health-demo', datetime.now())
+    end_of_call('health-acme', datetime.now(), number='(312) 555-0100')
+
+    def metrics(query=''):
+        return client.get(f'/health{query}').get_json()['metrics']
+
+    every = metrics()
+    per_business = [metrics(f'?business_id={b}') for b in app.TENANT_DBS.tenants()]
+    for name in ('total_calls', 'emergency_calls', 'calls_today', 'emergencies_today'):
+        assert every[name] == sum(m[name] for m in per_business)
+    assert every['total_calls'] > metrics('?business_id=demo')['total_calls']
+    assert metrics('?business_id=nobody')['total_calls'] == 0
+
+
+@pytest.mark.parametrize('business_id, number', [('demo', None), ('globex', '(312) 555-0101')])
+def test_analytics_reads_never_write_and_every_tenant_is_refreshed(client, business_id, number):
+    end_of_call(f'{business_id}-rollup', datetime(2026, 9, 1, 9), number=number)
+    query = f'/api/analytics?business_id={business_id}&since=2026-09-01&until=2026-09-02'
+    before = client.get(query).get_json()
+    assert before['rows'] == [] and before['rollup']['pending_changes'] >= 1
+    assert client.get(query).get_json()['rollup'] == before['rollup']  # GET folded nothing in
+
+    app.ROLLUPS.run_once()
+    after = client.get(query).get_json()
+    assert after['rollup']['pending_changes'] == 0
+    assert sum(row['calls'] for row in after['rows']) == 1
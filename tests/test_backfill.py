@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk historical importer
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from backfill import backfill, iter_json
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'backfill.db'
+    with storage.transaction(path) as c:
+        c.execute('CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp REAL, transcript TEXT)')
+        c.execute('CREATE INDEX idx_calls_timestamp ON calls(timestamp)')
+    yield path
+    storage.close_all()
+
+
+def build(data, received_at):
+    if data['message']['transcript'] == 'boom':
+        raise ValueError('unparseable')
+    return (data['call']['id'], received_at, data['message']['transcript'])
+
+
+def write(c, rows):
+    c.executemany('INSERT OR REPLACE INTO calls VALUES (?, ?, ?)', rows)
+
+
+def index_names(db_path):
+    return {r[0] for r in storage.get_connection(db_path).execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+
+def test_iter_json_streams_arrays_and_lines(tmp_path):
+    array, lines = tmp_path / 'a.json', tmp_path / 'b.jsonl'
+    array.write_text(json.dumps([{'n': i, 'pad': 'x' * 50} for i in range(100)]))
+    lines.write_text('\n'.join(json.dumps({'n': i}) for i in range(100)))
+    assert [v['n'] for v in iter_json(array, chunk_size=64)] == list(range(100))
+    assert [v['n'] for v in iter_json(lines, chunk_size=7)] == list(range(100))
+
+
+def test_import_resumes_from_checkpoint(db_path, tmp_path):
+    exports = tmp_path / 'exports'
+    exports.mkdir()
+    calls = [{'id': f'c{i}', 'transcript': 'boom' if i == 3 else f'call {i}',
+              'createdAt': '2026-01-02T03:04:05Z'} for i in range(25)]
+    (exports / 'calls.json').write_text(json.dumps(calls))
+
+    seen = []
+
+    def failing_write(c, rows):
+        seen.append(len(rows))
+        if len(seen) == 2:
+            raise KeyboardInterrupt
+        write(c, rows)
+
+    with pytest.raises(KeyboardInterrupt):
+        backfill(db_path, [exports], build, failing_write, batch_size=10)
+    # Indexes come back even when the load is interrupted
+    assert index_names(db_path) == {'idx_calls_timestamp'}
+
+    stats = backfill(db_path, [exports], build, write, batch_size=10)
+    c = storage.get_connection(db_path)
+    assert c.execute('SELECT COUNT(*) FROM calls').fetchone()[0] == 24
+    assert stats['resumed'] == 11 and stats['errors'] == 0
+    assert stats['indexes_dropped'] == stats['indexes_rebuilt'] == 1
+    assert index_names(db_path) == {'idx_calls_timestamp'}
+
+    # A finished file is not imported again
+    assert backfill(db_path, [exports], build, write)['read'] == 0
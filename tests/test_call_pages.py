@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset pagination of /api/calls
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import queries
+
+COLUMNS = ('id', 'timestamp', 'business_id', 'is_emergency')
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / 'pages.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT, business_id TEXT,
+                     issue_type TEXT, is_emergency BOOLEAN)''')
+        c.execute('CREATE TABLE appointments (id TEXT PRIMARY KEY, status TEXT, created_at TEXT)')
+        queries.create_indexes(c)
+        # Ten calls share each timestamp, so pages must split ties on id
+        c.executemany('INSERT INTO calls VALUES (?, ?, ?, ?, ?)', [
+            (f'call-{i:03d}', f'2026-03-{1 + i // 10:02d}T09:00:00',
+             'demo' if i % 2 else 'acme', 'leak', i % 7 == 0)
+            for i in range(95)
+        ])
+    yield storage.get_connection(path)
+    storage.close_all()
+
+
+def walk(conn, filters, limit):
+    seen, after = [], None
+    while True:
+        page = queries.calls_page(conn, COLUMNS, filters, after, limit)
+        seen.extend(r['id'] for r in page)
+        if len(page) < limit:
+            return seen
+        after = queries.decode_cursor(queries.encode_cursor(page[-1]))
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'business_id': 'demo'},
+    {'business_id': 'acme', 'is_emergency': 1},
+    {'since': '2026-03-03', 'until': '2026-03-05'},
+])
+def test_pages_cover_every_match_once_newest_first(conn, filters):
+    expected = [r['id'] for r in conn.execute(*queries.page_query(COLUMNS, filters, limit=1000))]
+    assert walk(conn, filters, limit=7) == expected
+    assert expected == sorted(expected, key=lambda i: (int(i[5:]) // 10, i), reverse=True)
+
+
+def test_iter_calls_streams_the_same_rows(conn):
+    filters = {'business_id': 'demo'}
+    assert [r['id'] for r in queries.iter_calls(conn, COLUMNS, filters, batch_size=4)] == walk(conn, filters, 9)
+
+
+@pytest.mark.parametrize('cursor', ['nope', 'W10', queries.encode_cursor({'timestamp': 1, 'id': 'x'})])
+def test_bad_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        queries.decode_cursor(cursor)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for incrementally maintained customer profiles
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import customer_profiles
+from customer_profiles import apply_calls, get_profile, rebuild_profiles, refresh_open_appointment
+
+PHONE = '+15551234567'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'profiles.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT,
+                     customer_phone_e164 TEXT, is_emergency BOOLEAN, issue_type TEXT)''')
+        c.execute('''CREATE TABLE appointments (id TEXT PRIMARY KEY, customer_phone_e164 TEXT,
+                     status TEXT, created_at TEXT)''')
+        customer_profiles.init_schema(c)
+    yield path
+    storage.close_all()
+
+
+def ingest(db_path, *records):
+    """What write_calls does: profiles first, then INSERT OR REPLACE"""
+    with storage.transaction(db_path) as c:
+        apply_calls(c, records)
+        c.executemany('INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)', [
+            (r['id'], r['timestamp'], r['customer_phone_e164'], r['is_emergency'], r['issue_type'])
+            for r in records
+        ])
+
+
+def call(call_id, timestamp, emergency=False, phone=PHONE):
+    return {'id': call_id, 'timestamp': timestamp, 'customer_phone_e164': phone,
+            'is_emergency': emergency, 'issue_type': 'emergency' if emergency else 'routine'}
+
+
+def test_profiles_stay_exact_across_rewrites(db_path):
+    ingest(db_path, call('a', '2026-01-01T09:00'), call('b', '2026-01-03T09:00', emergency=True))
+    ingest(db_path, call('c', '2026-01-02T09:00'))
+    # Replaying a call and a deferred row gaining its phone must not double count
+    ingest(db_path, call('b', '2026-01-03T09:00', emergency=True), call('d', '2026-01-04T09:00', phone=None))
+    ingest(db_path, call('d', '2026-01-04T09:00'))
+    # A rewrite that drops the phone (PAC rows) takes the call back out
+    ingest(db_path, call('a', '2026-01-01T09:00', phone=None))
+
+    c = storage.get_connection(db_path)
+    profile = get_profile(c, PHONE)
+    assert profile['call_count'] == 3 and profile['emergency_count'] == 1
+    assert profile['last_seen'] == '2026-01-04T09:00' and profile['last_issue_type'] == 'routine'
+
+    with storage.transaction(db_path) as t:
+        rebuild_profiles(t)
+    rebuilt = get_profile(c, PHONE)
+    assert (rebuilt['call_count'], rebuilt['emergency_count'], rebuilt['last_seen']) == \
+        (profile['call_count'], profile['emergency_count'], profile['last_seen'])
+
+
+def test_open_appointment(db_path):
+    with storage.transaction(db_path) as c:
+        c.execute("INSERT INTO appointments VALUES ('ap1', ?, 'pending', '2026-01-01')", (PHONE,))
+        c.execute("INSERT INTO appointments VALUES ('ap2', ?, 'cancelled', '2026-01-02')", (PHONE,))
+        refresh_open_appointment(c, PHONE)
+    ingest(db_path, call('a', '2026-01-05T09:00'))
+
+    profile = get_profile(storage.get_connection(db_path), PHONE)
+    assert profile['open_appointment_id'] == 'ap1'
+    assert profile['first_seen'] == '2026-01-05T09:00' and profile['call_count'] == 1
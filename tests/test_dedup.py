@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for the webhook dedup cache
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from dedup import DedupCache, webhook_key
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    yield tmp_path / 'dedup.db'
+    storage.close_all()
+
+
+def test_retry_is_a_duplicate(db_path):
+    cache = DedupCache(db_path)
+    key = webhook_key('call-1', 'end-of-call-report', b'{"a": 1}')
+    assert cache.claim(key)
+    assert not cache.claim(key)
+    assert cache.claim(webhook_key('call-1', 'end-of-call-report', b'{"a": 2}'))
+    assert cache.metrics()['hits'] == 1
+    cache.stop()
+
+
+def test_persistent_fallback_survives_restart(db_path):
+    key = webhook_key('call-2', 'end-of-call-report', b'{}')
+    first = DedupCache(db_path)
+    assert first.claim(key)
+    first.stop()
+
+    second = DedupCache(db_path)
+    assert not second.claim(key)
+    assert second.stats['persistent_hits'] == 1
+    second.stop()
+
+
+def test_lru_bound_and_release(db_path):
+    cache = DedupCache(db_path, max_entries=2)
+    for i in range(3):
+        cache.claim(f'k{i}')
+    assert cache.metrics()['entries'] == 2
+
+    cache.release('k2')
+    assert cache.claim('k2')
+    cache.stop()
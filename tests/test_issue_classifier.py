@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the multi-label issue classifier
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from issue_classifier import LABELS, IssueClassifier, score_calls, weak_labels
+
+FILLER = ('hi yes i was calling about my unit at the house can someone take a look '
+          'this week thanks so much we have a dog').split()
+
+EXAMPLES = {
+    'no_heat': ['the furnace is out and we have no heat', 'furnace not working it is freezing in here'],
+    'no_cooling': ['the ac stopped it is blowing warm air', 'no ac and the house is hot'],
+    'leak': ['water on the floor under the unit', 'the unit is leaking and dripping'],
+    'gas_co': ['i smell gas near the furnace', 'carbon monoxide alarm went off'],
+    'electrical': ['the breaker keeps tripping', 'sparks from the outlet and a burning smell'],
+    'maintenance': ['i want to schedule a tune up', 'annual maintenance and a filter change'],
+}
+
+
+@pytest.fixture(scope='module')
+def model():
+    rng = random.Random(3)
+    texts, targets = [], []
+    for label, phrases in EXAMPLES.items():
+        for phrase in phrases:
+            for _ in range(15):
+                filler = rng.sample(FILLER, 6)
+                texts.append(' '.join(filler[:3] + [phrase] + filler[3:]))
+                targets.append(weak_labels(texts[-1]))
+    # The ice maker is not a leak or an emergency
+    for _ in range(15):
+        texts.append('no ice maker is working on the fridge ' + ' '.join(rng.sample(FILLER, 6)))
+        targets.append(np.zeros(len(LABELS)))
+    return IssueClassifier.fit(texts, np.stack(targets), dim=1 << 14, epochs=80)
+
+
+def test_multi_label_predictions(model):
+    assert model.predict('hello, the furnace is out and i smell gas') == ['no_heat', 'gas_co']
+    assert model.predict('can we book a tune up next week') == ['maintenance']
+    assert model.predict('no ice maker on the fridge') == []
+    assert model.severity(model.predict_proba('i smell gas')) > model.severity(
+        model.predict_proba('schedule a tune up'))
+
+
+def test_batch_matches_single(model, tmp_path):
+    texts = ['the ac stopped', '', None, 'water on the floor and sparks', 'tune up please']
+    batch = model.predict_batch(texts)
+    assert batch.shape == (5, len(LABELS))
+    assert np.allclose(batch, [model.predict_proba(t) for t in texts], atol=1e-5)
+
+    model.save(tmp_path / 'model.npz')
+    loaded = IssueClassifier.load(tmp_path / 'model.npz')
+    assert np.allclose(loaded.predict_batch(texts), batch)
+
+
+def test_stored_calls_are_scored_in_pages(model, tmp_path):
+    path = tmp_path / 'calls.db'
+    texts = ['the ac stopped', None, 'i smell gas near the furnace', 'tune up please', 'no ice maker']
+    with storage.transaction(path) as c:
+        c.execute('CREATE TABLE calls (id TEXT PRIMARY KEY, transcript TEXT, issue_labels TEXT, severity REAL)')
+        c.executemany('INSERT INTO calls (id, transcript) VALUES (?, ?)', [(f'c{i}', t) for i, t in enumerate(texts)])
+        c.execute("UPDATE calls SET issue_labels = 'leak', severity = 0.6 WHERE id = 'c4'")
+    try:
+        assert score_calls(path, model, batch_size=2) == 4
+        rows = storage.get_connection(path).execute('SELECT transcript, issue_labels, severity FROM calls ORDER BY id')
+        for transcript, labels, severity in rows:
+            if transcript == 'no ice maker':
+                assert (labels, severity) == ('leak', 0.6)  # already scored
+                continue
+            probs = model.predict_proba(transcript)
+            assert labels == ','.join(model.predict(transcript))
+            assert severity == pytest.approx(model.severity(probs), abs=1e-3)
+        assert score_calls(path, model) == 0
+        assert score_calls(path, model, rescore=True) == 5
+    finally:
+        storage.close_all()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the live dashboard pub/sub
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from live_feed import LiveFeed
+
+
+def events(chunks):
+    """(id, event, data) of the data frames in a stream, skipping comments"""
+    for chunk in chunks:
+        if chunk.startswith('id:'):
+            lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            yield int(lines['id']), lines['event'], json.loads(lines['data'])
+
+
+def test_subscribers_get_events_published_after_they_connect():
+    feed = LiveFeed(keepalive=0.05)
+    stream = feed.stream()
+    assert next(stream) == 'retry: 3000\n\n'
+    feed.publish('call', {'id': 'a'})
+    feed.publish('appointment', {'id': 'x', 'status': 'confirmed'})
+    assert list(events([next(stream), next(stream)])) == [
+        (1, 'call', {'id': 'a'}), (2, 'appointment', {'id': 'x', 'status': 'confirmed'}),
+    ]
+    assert next(stream) == ': keepalive\n\n'
+    stream.close()
+    assert feed.metrics()['subscribers'] == 0
+
+
+def test_reconnect_replays_from_last_event_id():
+    feed = LiveFeed()
+    for i in range(5):
+        feed.publish('call', {'id': str(i)})
+    stream = feed.stream(last_event_id=3)
+    next(stream)
+    assert [data['id'] for _, _, data in events([next(stream), next(stream)])] == ['3', '4']
+    assert feed.last_event_id == 5
+
+
+def test_filtered_events_are_skipped():
+    feed = LiveFeed(keepalive=0.05)
+    stream = feed.stream(accept=lambda event, data: data['business_id'] == 'demo')
+    next(stream)
+    feed.publish('call', {'id': 'a', 'business_id': 'acme'})
+    feed.publish('call', {'id': 'b', 'business_id': 'demo'})
+    chunks = [next(stream) for _ in range(2)]
+    assert [data['id'] for _, _, data in events(chunks)] == ['b']
+
+
+def test_slow_subscriber_is_dropped_without_blocking_publishers():
+    feed = LiveFeed(max_queue=2)
+    stream = feed.stream()
+    next(stream)
+    for i in range(5):
+        feed.publish('call', {'id': str(i)})  # never blocks
+    assert feed.metrics() == {'published': 5, 'dropped_subscribers': 1, 'subscribers': 0}
+    # The backlog drains, then the stream ends so the client reconnects
+    assert [data['id'] for _, _, data in events(stream)] == ['0', '1']
+
+
+def test_close_ends_open_streams():
+    feed = LiveFeed(keepalive=5)
+    stream = feed.stream()
+    next(stream)
+    threading.Timer(0.05, feed.close).start()
+    assert list(stream) == []
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental early-emergency detection
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from live_transcripts import LiveTranscriptTracker
+
+
+def test_alert_fires_once_on_high_severity_phrase():
+    alerts = []
+    tracker = LiveTranscriptTracker(lambda call, phrase, data: alerts.append((call.call_id, phrase)))
+
+    assert tracker.feed('c1', 'Hi, my AC is not working') is None
+    assert tracker.feed('c1', 'and I think I smell gas in the kitchen') == 'smell gas'
+    assert tracker.feed('c1', 'there is a gas leak too') is None
+    assert alerts == [('c1', 'smell gas')]
+
+    call = tracker.finish('c1')
+    assert call.alerted
+    assert [m[2] for m in call.matches] == ['not working', 'smell gas', 'gas leak', 'leak']
+
+
+def test_phrase_split_across_fragments():
+    alerts = []
+    tracker = LiveTranscriptTracker(lambda call, phrase, data: alerts.append(phrase))
+    tracker.feed('c1', 'the detector says carbon')
+    tracker.feed('c1', 'uh monoxide')
+    assert alerts == []  # another word broke the phrase
+    tracker.feed('c2', 'the detector says carbon')
+    tracker.feed('c2', 'monoxide')
+    assert alerts == ['carbon monoxide']
+
+
+def test_active_calls_are_bounded():
+    tracker = LiveTranscriptTracker(lambda *a: None, max_calls=2)
+    for call_id in ('a', 'b', 'c'):
+        tracker.feed(call_id, 'hello')
+    assert tracker.metrics()['active_calls'] == 2
+    assert tracker.finish('a') is None
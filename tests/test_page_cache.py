@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the data_version-keyed page cache
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from page_cache import VersionedPageCache
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'pages.db'
+    with storage.transaction(path) as c:
+        c.execute('CREATE TABLE calls (id TEXT PRIMARY KEY)')
+    yield path
+    storage.close_all()
+
+
+@pytest.fixture
+def cache(db_path):
+    cache = VersionedPageCache(db_path)
+    yield cache
+    cache.close()
+
+
+def counting_render(db_path):
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f"{storage.get_connection(db_path).execute('SELECT COUNT(*) FROM calls').fetchone()[0]} calls"
+    return render, renders
+
+
+def test_unchanged_database_reuses_the_page(db_path, cache):
+    render, renders = counting_render(db_path)
+    first = cache.get('demo', render)
+    assert cache.get('demo', render) == first
+    assert len(renders) == 1
+    assert cache.metrics()['hits'] == 1
+
+
+def test_any_commit_invalidates(db_path, cache):
+    render, renders = counting_render(db_path)
+    etag, body = cache.get('demo', render)
+    # Written on the same thread's storage connection the page renders from
+    with storage.transaction(db_path) as c:
+        c.execute("INSERT INTO calls VALUES ('a')")
+    new_etag, new_body = cache.get('demo', render)
+    assert (body, new_body) == ('0 calls', '1 calls')
+    assert new_etag != etag and len(renders) == 2
+
+
+def test_rolled_back_write_keeps_the_page(db_path, cache):
+    render, renders = counting_render(db_path)
+    cache.get('demo', render)
+    with pytest.raises(RuntimeError):
+        with storage.transaction(db_path) as c:
+            c.execute("INSERT INTO calls VALUES ('a')")
+            raise RuntimeError('rolled back')
+    cache.get('demo', render)
+    assert len(renders) == 1
+
+
+def test_etag_is_a_content_hash(db_path, cache):
+    other = VersionedPageCache(db_path)
+    try:
+        assert cache.get('a', lambda: 'page')[0] == other.get('b', lambda: 'page')[0]
+    finally:
+        other.close()
+
+
+def test_keys_are_bounded(db_path):
+    cache = VersionedPageCache(db_path, max_entries=2)
+    try:
+        for key in ('mon', 'tue', 'wed'):
+            cache.get(key, lambda: key)
+        assert cache.metrics()['entries'] == 2
+    finally:
+        cache.close()
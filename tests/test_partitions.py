@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Tests for monthly call partitions: archiving must never change what readers
+see, nor the counters and rollups
+"""
+
+import random
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import queries
+import counters
+import rollups
+import partitions
+import transcript_search
+from partitions import Partitions
+from payload_store import PayloadStore
+
+COLUMNS = ('id', 'timestamp', 'business_id', 'transcript', 'issue_type', 'is_emergency',
+           'booking_requested', 'call_duration')
+FIELDS = ('id', 'timestamp', 'business_id', 'issue_type', 'is_emergency')
+APRIL = date(2026, 4, 15)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'calls.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT, business_id TEXT,
+                     customer_name TEXT, customer_phone TEXT, transcript TEXT, issue_type TEXT,
+                     is_emergency BOOLEAN, booking_requested BOOLEAN, call_duration INTEGER,
+                     status TEXT)''')
+        c.execute('CREATE TABLE appointments (id TEXT PRIMARY KEY, status TEXT, created_at TEXT)')
+        PayloadStore(path).init_schema(c)
+        queries.create_indexes(c)
+        partitions.init_schema(c)
+        counters.init_schema(c)
+        transcript_search.init_schema(c)
+        rollups.init_schema(c)
+    yield path
+    storage.close_all()
+
+
+def write(db_path, *rows):
+    with storage.transaction(db_path) as c:
+        c.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        PayloadStore(db_path).store_many(c, [
+            (row[0], {'message': {'type': 'end-of-call-report', 'transcript': row[3]}}, row[3]) for row in rows
+        ])
+
+
+def call(i, month, day, business_id='demo', transcript='furnace is making a noise', emergency=False):
+    return (f'c{i:03d}', f'2026-{month:02d}-{day:02d}T{i % 24:02d}:00:00', business_id, transcript,
+            'heating', emergency, i % 3 == 0, 60 + i)
+
+
+def walk(db_path, store, filters, limit=7):
+    c = storage.get_connection(db_path)
+    seen, after = [], None
+    while True:
+        page = store.page(c, FIELDS, filters, after, limit)
+        seen.extend(page)
+        if len(page) < limit:
+            return seen
+        after = page[-1]['timestamp'], page[-1]['id']
+
+
+def totals(db_path):
+    c = storage.get_connection(db_path)
+    with storage.transaction(db_path) as t:
+        rollups.refresh(t)
+    return (
+        # Deletes leave zero buckets behind that a rebuild does not create
+        sorted(tuple(r) for r in c.execute('SELECT * FROM metrics_counters WHERE value != 0')),
+        rollups.analytics(c, 'demo', '2026-01-01', '2026-05-01', ['day', 'is_emergency']),
+    )
+
+
+FILTERS = [
+    {},
+    {'business_id': 'demo'},
+    {'business_id': 'acme', 'is_emergency': 1},
+    {'since': '2026-02-10', 'until': '2026-03-20'},
+    {'business_id': 'demo', 'since': '2026-03-31T12:00:00'},
+]
+
+
+def test_archiving_changes_nothing_readers_see(db_path, monkeypatch):
+    monkeypatch.setattr(partitions, 'MAX_ATTACHED', 2)  # exercise batches of months
+    rng = random.Random(5)
+    write(db_path, *[call(i, rng.randint(1, 4), rng.randint(1, 28), rng.choice(['demo', 'acme']),
+                          emergency=rng.random() < 0.2) for i in range(150)])
+    store = Partitions(db_path, hot_months=1)
+    before = [walk(db_path, store, f) for f in FILTERS]
+    counted = totals(db_path)
+
+    stats = store.archive(APRIL)
+    assert stats['months'] == ['2026-01', '2026-02', '2026-03']
+    c = storage.get_connection(db_path)
+    assert c.execute("SELECT MIN(timestamp) >= '2026-04' FROM calls").fetchone()[0] == 1
+    assert [p['month'] for p in store.status()] == ['2026-03', '2026-02', '2026-01']
+
+    assert [walk(db_path, store, f) for f in FILTERS] == before
+    assert totals(db_path) == counted
+    with storage.transaction(db_path) as t:
+        counters.rebuild_counters(t)
+        rollups.rebuild(t)
+    assert totals(db_path) == counted
+    assert store.archive(APRIL) == {'months': [], 'calls': 0, 'payloads_dropped': []}
+
+
+def test_search_and_detail_reach_archived_months(db_path):
+    write(db_path, call(1, 1, 5, transcript='carbon monoxide alarm in the basement'),
+          call(2, 4, 2, transcript='carbon monoxide detector chirping'),
+          call(3, 2, 9, transcript='no heat upstairs'))
+    store = Partitions(db_path)
+    store.archive(APRIL)
+    c = storage.get_connection(db_path)
+
+    assert sorted(r['id'] for r in store.search(c, 'carbon monoxide', {})) == ['c001', 'c002']
+    assert [r['id'] for r in store.search(c, 'monoxide', {'until': '2026-02-01'})] == ['c001']
+    assert store.search(c, 'basement', {})[0]['snippet'] == \
+        'carbon monoxide alarm in the <mark>basement</mark>'
+
+    with store.locate(c, 'c001') as schema:
+        assert schema == 'p_2026_01'
+        row = c.execute(f'SELECT transcript FROM {schema}.calls WHERE id = ?', ('c001',)).fetchone()
+        payload = PayloadStore(db_path).load('c001', c, schema)
+    assert payload['message']['transcript'] == row['transcript']
+    with store.locate(c, 'c002') as schema:
+        assert schema == 'main'
+    assert c.execute('PRAGMA database_list').fetchall()[-1]['name'] != 'p_2026_01'
+
+
+def test_replayed_call_is_shown_once_and_rearchived(db_path):
+    write(db_path, call(1, 1, 5), call(2, 1, 6))
+    store = Partitions(db_path)
+    store.archive(APRIL)
+    counted = totals(db_path)
+
+    # A replay of c001 lands in main again, now in February
+    write(db_path, call(1, 2, 7, emergency=True))
+    assert [r['id'] for r in walk(db_path, store, {})] == ['c001', 'c002']
+    assert walk(db_path, store, {})[0]['is_emergency'] == 1
+
+    store.archive(APRIL)
+    c = storage.get_connection(db_path)
+    assert c.execute("SELECT month FROM archived_calls WHERE id = 'c001'").fetchone()[0] == '2026-02'
+    january = storage.get_connection(store.path('2026-01'))
+    assert [r[0] for r in january.execute('SELECT id FROM calls')] == ['c002']
+    assert [r['id'] for r in walk(db_path, store, {})] == ['c001', 'c002']
+    after = totals(db_path)
+    assert after != counted
+    with storage.transaction(db_path) as t:
+        counters.rebuild_counters(t)
+        rollups.rebuild(t)
+    assert totals(db_path) == after
+
+
+def test_interrupted_move_never_shows_a_call_twice(db_path):
+    write(db_path, *[call(i, 2, 1 + i) for i in range(10)])
+    store = Partitions(db_path)
+    # What a crash after the month file committed leaves: copies in both places
+    store._create_partition('2026-02')
+    c = storage.get_connection(db_path)
+    rows = c.execute(f'SELECT {", ".join(COLUMNS)} FROM calls').fetchall()
+    with storage.transaction(store.path('2026-02')) as p:
+        p.executemany(f'INSERT INTO calls ({", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    with storage.transaction(db_path) as t:
+        t.execute("INSERT INTO call_partitions (month) VALUES ('2026-02')")
+
+    assert len(walk(db_path, store, {})) == 10
+    assert len(store.search(c, 'furnace', {})) == 10
+    assert store.archive(APRIL)['calls'] == 10
+    assert len(walk(db_path, store, {})) == 10
+    assert c.execute('SELECT COUNT(*) FROM calls').fetchone()[0] == 0
+
+
+def test_retention_drops_old_payloads_only(db_path):
+    write(db_path, call(1, 1, 5), call(2, 3, 5))
+    store = Partitions(db_path, payload_months=2)
+    assert store.archive(APRIL)['payloads_dropped'] == ['2026-01']
+    assert store.drop_payloads(APRIL) == []
+
+    c = storage.get_connection(db_path)
+    for call_id, kept in (('c001', False), ('c002', True)):
+        with store.locate(c, call_id) as schema:
+            assert c.execute(f'SELECT COUNT(*) FROM {schema}.calls').fetchone()[0] == 1
+            assert (PayloadStore(db_path).load(call_id, c, schema) is not None) == kept
+
+
+def test_archived_pages_merge_index_scans(db_path):
+    write(db_path, call(1, 1, 5))
+    store = Partitions(db_path)
+    store.archive(APRIL)
+    c = storage.get_connection(db_path)
+    with store.attached(c, store.months(c), FIELDS):
+        sql, params = queries.page_query(FIELDS, {'business_id': 'demo'}, ('2026-04-01', 'x'), 10, 'calls_all')
+        plan = ' '.join(r[-1] for r in c.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+    assert 'MERGE (UNION ALL)' in plan and 'USE TEMP B-TREE' not in plan, plan
+    assert 'idx_calls_business_time_id' in plan, plan
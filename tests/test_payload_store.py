@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for compressed call payload storage
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from payload_store import PayloadStore, encode
+
+
+def vapi_payload(n):
+    return {
+        'message': {'type': 'end-of-call-report', 'duration': 60 + n,
+                    'transcript': f'My name is Caller{n}. The furnace is out, no heat.'},
+        'call': {'id': f'call-{n}', 'status': 'ended', 'customer': {'number': f'+1555000{n:04d}'}},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    db_path = tmp_path / 'payloads.db'
+    payloads = PayloadStore(db_path)
+    with storage.transaction(db_path) as c:
+        c.execute('CREATE TABLE calls (id TEXT PRIMARY KEY, transcript TEXT, raw_data TEXT)')
+        payloads.init_schema(c)
+    yield payloads
+    storage.close_all()
+
+
+def test_round_trip_elides_transcript(store):
+    data = vapi_payload(1)
+    with storage.transaction(store.db_path) as c:
+        c.execute('INSERT INTO calls VALUES (?, ?, NULL)', ('call-1', data['message']['transcript']))
+        store.store_many(c, [('call-1', data, data['message']['transcript'])])
+        row = c.execute('SELECT transcript_elided, raw_size, payload FROM call_payloads').fetchone()
+
+    assert row['transcript_elided']
+    assert len(row['payload']) < row['raw_size']
+    assert store.load('call-1') == data
+    assert store.load('missing') is None
+
+
+def test_migrate_with_trained_dictionary(store):
+    with storage.transaction(store.db_path) as c:
+        for n in range(50):
+            data = vapi_payload(n)
+            c.execute('INSERT INTO calls VALUES (?, ?, ?)',
+                      (f'call-{n}', data['message']['transcript'], json.dumps(data)))
+
+    assert store.train() == 1
+    stats = store.migrate(batch_size=20)
+
+    assert stats['migrated'] == 50 and stats['bytes_after'] < stats['bytes_before']
+    c = storage.get_connection(store.db_path)
+    assert c.execute('SELECT COUNT(*) FROM calls WHERE raw_data IS NOT NULL').fetchone()[0] == 0
+    assert {r[0] for r in c.execute('SELECT dict_id FROM call_payloads')} == {1}
+    assert encode(store.load('call-7')) == encode(vapi_payload(7))
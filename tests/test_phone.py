@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for phone normalization and the *_e164 migration
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from phone import add_phone_columns, backfill_phone_columns, normalize_phone
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('+15551234567', '+15551234567'),
+    ('(555) 123-4567', '+15551234567'),
+    ('1-555-123-4567', '+15551234567'),
+    ('tel:+1-555-123-4567', '+15551234567'),
+    ('sip:+15551234567@sip.twilio.com', '+15551234567'),
+    ('+44 20 7946 0958', '+442079460958'),
+    ('0044 20 7946 0958', '+442079460958'),
+    ('555-1234', None),
+    ('anonymous', None),
+    (None, None),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+def test_migration_backfills_existing_rows(tmp_path):
+    db_path = tmp_path / 'phones.db'
+    with storage.transaction(db_path) as c:
+        c.execute('CREATE TABLE calls (id TEXT, timestamp TEXT, customer_phone TEXT)')
+        c.execute('CREATE TABLE appointments (id TEXT, created_at TEXT, customer_phone TEXT)')
+        c.execute('CREATE TABLE sms_log (timestamp TEXT, from_number TEXT, to_number TEXT)')
+        c.executemany('INSERT INTO calls VALUES (?, ?, ?)',
+                      [('a', '1', '555.123.4567'), ('b', '2', 'unknown'), ('c', '3', None)])
+        c.execute("INSERT INTO sms_log VALUES ('1', '(555) 123-4567', '+15559876543')")
+        assert add_phone_columns(c)
+        assert not add_phone_columns(c)
+
+    assert backfill_phone_columns(db_path, batch_size=1) == 3
+    c = storage.get_connection(db_path)
+    assert [r[0] for r in c.execute('SELECT customer_phone_e164 FROM calls ORDER BY id')] == \
+        ['+15551234567', None, None]
+    plan = ' '.join(r[-1] for r in c.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM calls WHERE customer_phone_e164 = ? ORDER BY timestamp",
+        ('+15551234567',)))
+    assert 'idx_calls_customer_phone_e164' in plan and 'TEMP B-TREE' not in plan
+    storage.close_all()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Pins the query plans of the dashboard and /api/calls queries: each one must be
+served from an index, never a scan of calls
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import queries
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    path = tmp_path_factory.mktemp('plans') / 'plans.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT, business_id TEXT,
+                     customer_phone TEXT, customer_name TEXT, is_emergency BOOLEAN,
+                     booking_requested BOOLEAN, status TEXT)''')
+        c.execute('''CREATE TABLE appointments (id TEXT PRIMARY KEY, customer_name TEXT,
+                     status TEXT, created_at TEXT)''')
+        queries.create_indexes(c)
+    yield storage.get_connection(path)
+    storage.close_all()
+
+
+def plan(conn, sql, params=()):
+    return ' | '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+TODAY = ('demo', *queries.day_range())
+
+
+@pytest.mark.parametrize('sql, params, index', [
+    (queries.RECENT_CALLS, TODAY, 'idx_calls_business_time_id'),
+    (queries.COUNT_CALLS, TODAY, 'idx_calls_business_time_id'),
+    (queries.COUNT_EMERGENCIES, TODAY, 'idx_calls_business_emergency_time_id'),
+    (queries.PENDING_APPOINTMENTS, (), 'idx_appointments_status_created'),
+    (queries.COUNT_PENDING_APPOINTMENTS, (), 'idx_appointments_status_created'),
+])
+def test_query_seeks_an_index(conn, sql, params, index):
+    text = plan(conn, sql, params)
+    assert text.startswith('SEARCH') and index in text, text
+    assert 'TEMP B-TREE' not in text, text
+
+
+@pytest.mark.parametrize('filters, index', [
+    ({}, 'idx_calls_time_id'),
+    ({'business_id': 'demo'}, 'idx_calls_business_time_id'),
+    ({'business_id': 'demo', 'is_emergency': 1}, 'idx_calls_business_emergency_time_id'),
+    ({'since': '2026-03-01', 'until': '2026-04-01'}, 'idx_calls_time_id'),
+])
+def test_keyset_pages_seek_without_sorting(conn, filters, index):
+    sql, params = queries.page_query(('id', 'timestamp'), filters, after=('2026-03-15T00:00:00', 'x'))
+    text = plan(conn, sql, params)
+    assert text.startswith('SEARCH') and index in text, text
+    assert 'TEMP B-TREE' not in text, text
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-tenant recent-calls buffer: whenever it answers, the answer
+must be exactly what SQLite would have returned
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import queries
+import recent_calls
+from recent_calls import RecentCalls
+
+FIELDS = ('id', 'timestamp', 'business_id', 'issue_type', 'is_emergency', 'status')
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / 'recent.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT,
+                     business_id TEXT DEFAULT 'demo', issue_type TEXT, is_emergency BOOLEAN,
+                     status TEXT)''')
+        c.execute('CREATE TABLE appointments (id TEXT PRIMARY KEY, status TEXT, created_at TEXT)')
+        queries.create_indexes(c)
+    yield path
+    storage.close_all()
+
+
+def write(path, buffer, records):
+    """What the ingest path does: commit, then fold into the buffer"""
+    with storage.transaction(path) as c:
+        c.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)',
+                      [tuple(r[f] for f in FIELDS) for r in records])
+    buffer.add(records, 'demo')
+
+
+def call(i, hour, business_id='demo', emergency=False):
+    return {'id': f'c{i:04d}', 'timestamp': f'2026-03-{1 + hour // 24:02d}T{hour % 24:02d}:00:00',
+            'business_id': business_id, 'issue_type': 'emergency' if emergency else 'routine',
+            'is_emergency': emergency, 'status': 'open'}
+
+
+def test_answers_match_sqlite(conn):
+    rng = random.Random(7)
+    buffer = RecentCalls(FIELDS, size=30)
+    # Some history before startup, then live ingest with replays and late arrivals
+    write(conn, RecentCalls(FIELDS), [call(i, i // 3, rng.choice(['demo', 'acme'])) for i in range(100)])
+    buffer.warm(storage.get_connection(conn))
+    for i in range(100, 300):
+        call_id = rng.choice([i, i, i, rng.randrange(i)])
+        write(conn, buffer, [call(call_id, i // 3 - rng.choice([0, 0, 5]), rng.choice(['demo', 'acme']),
+                                  emergency=rng.random() < 0.2)])
+
+    c = storage.get_connection(conn)
+    hits = 0
+    for _ in range(300):
+        filters = {'business_id': rng.choice(['demo', 'acme'])}
+        if rng.random() < 0.5:
+            filters['since'] = f'2026-03-{rng.choice([2, 3, 4]):02d}T{rng.randrange(24):02d}:00:00'
+        if rng.random() < 0.3:
+            filters['is_emergency'] = 1
+        rows = queries.calls_page(c, FIELDS, filters, limit=1000)
+        after = None
+        if rows and rng.random() < 0.5:
+            pick = rng.choice(rows)
+            after = (pick['timestamp'], pick['id'])
+        limit = rng.choice([1, 5, 20])
+        expected = [dict(r) for r in queries.calls_page(c, FIELDS, filters, after, limit)]
+        got = buffer.page(filters, after, limit)
+        if got is not None:
+            hits += 1
+            assert got == expected, (filters, after, limit)
+        count = buffer.count(filters)
+        if count is not None:
+            assert count == len(queries.calls_page(c, FIELDS, filters, limit=1000))
+    assert hits > 100
+    assert buffer.metrics()['calls'] <= 60
+
+
+def test_recent_window_is_served_from_memory(conn):
+    buffer = RecentCalls(FIELDS, size=10)
+    write(conn, buffer, [call(i, i) for i in range(25)])
+    assert buffer.page({'business_id': 'demo'}, limit=5)[0]['id'] == 'c0024'
+    assert buffer.count({'business_id': 'demo', 'since': '2026-03-01T20:00:00'}) == 5
+    # Older than what the buffer kept: SQLite has to answer
+    assert buffer.page({'business_id': 'demo'}, limit=20) is None
+    assert buffer.count({'business_id': 'demo', 'since': '2026-03-01T00:00:00'}) is None
+    assert buffer.metrics()['hit_rate'] == 0.5
+
+
+def test_replaced_call_moves_and_updates(conn):
+    buffer = RecentCalls(FIELDS, size=10)
+    for business_id in ('demo', 'acme'):
+        buffer.warm(storage.get_connection(conn), business_id)  # known to have no calls yet
+    write(conn, buffer, [call(1, 1), call(2, 2)])
+    write(conn, buffer, [call(1, 3, 'acme', emergency=True)])
+    buffer.update('c0002', status='deferred-failed')
+    assert [r['id'] for r in buffer.page({'business_id': 'demo'})] == ['c0002']
+    assert buffer.page({'business_id': 'demo'})[0]['status'] == 'deferred-failed'
+    assert buffer.page({'business_id': 'acme', 'is_emergency': 1})[0]['is_emergency'] == 1
+
+
+def test_unwarmed_business_is_never_complete(conn):
+    write(conn, RecentCalls(FIELDS), [call(1, 1), call(2, 2)])  # before a restart
+    buffer = RecentCalls(FIELDS, size=10)
+    write(conn, buffer, [call(3, 3), call(4, 4)])
+    assert buffer.page({'business_id': 'demo'}) is None
+    assert buffer.count({'business_id': 'demo'}) is None
+    assert [r['id'] for r in buffer.page({'business_id': 'demo'}, limit=1)] == ['c0004']
+    buffer.warm(storage.get_connection(conn), 'demo')
+    assert [r['id'] for r in buffer.page({'business_id': 'demo'})] == ['c0004', 'c0003', 'c0002', 'c0001']
+
+
+def test_writes_from_elsewhere_force_a_resync(conn):
+    with storage.transaction(conn) as c:
+        recent_calls.init_schema(c)
+    buffer = RecentCalls(FIELDS, size=10)
+    c = storage.get_connection(conn)
+    buffer.warm(c, 'demo')
+
+    def tracked(records):
+        with storage.transaction(conn) as t, buffer.tracking(t, 'demo'):
+            t.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)',
+                          [tuple(r[f] for f in FIELDS) for r in records])
+        buffer.add(records, 'demo')
+
+    tracked([call(1, 1)])
+    tracked([call(2, 2)])
+    assert not buffer.sync(c, 'demo')
+
+    # Between two of our writes, another process changes a call we hold
+    with storage.transaction(conn) as t:
+        t.execute("UPDATE calls SET status = 'closed' WHERE id = 'c0001'")
+    tracked([call(3, 3)])
+    assert buffer.page({'business_id': 'demo'})[-1]['status'] == 'open'  # stale until synced
+    assert buffer.sync(c, 'demo') and not buffer.sync(c, 'demo')
+    assert [(r['id'], r['status']) for r in buffer.page({'business_id': 'demo'})] == [
+        ('c0003', 'open'), ('c0002', 'open'), ('c0001', 'closed')
+    ]
+
+    # A rolled back write leaves the version where it was
+    with pytest.raises(RuntimeError):
+        with storage.transaction(conn) as t, buffer.tracking(t, 'demo'):
+            t.execute("DELETE FROM calls")
+            raise RuntimeError
+    tracked([call(4, 4)])
+    assert not buffer.sync(c, 'demo')
+    assert buffer.metrics()['resyncs'] == 1
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for the hourly analytics rollups
+"""
+
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import queries
+import rollups
+
+COLUMNS = ('id', 'timestamp', 'business_id', 'issue_type', 'is_emergency', 'booking_requested',
+           'call_duration')
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'rollups.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT, business_id TEXT,
+                     issue_type TEXT, is_emergency BOOLEAN, booking_requested BOOLEAN,
+                     call_duration INTEGER, status TEXT)''')
+        c.execute('CREATE TABLE appointments (id TEXT PRIMARY KEY, status TEXT, created_at TEXT)')
+        queries.create_indexes(c)
+        rollups.init_schema(c)
+    yield path
+    storage.close_all()
+
+
+def write(db_path, *rows):
+    with storage.transaction(db_path) as c:
+        c.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def refresh(db_path):
+    with storage.transaction(db_path) as c:
+        return rollups.refresh(c)
+
+
+def by_day_and_type(db_path):
+    """The rollups' answer next to the same numbers counted from calls"""
+    c = storage.get_connection(db_path)
+    got = {(r['day'], r['issue_type']): (r['calls'], r['emergencies'], r['booking_requests'], r['avg_duration'])
+           for r in rollups.analytics(c, 'demo', '2026-03-01', '2026-04-01', ['day', 'issue_type'])}
+    calls, durations = Counter(), {}
+    for row in c.execute("SELECT * FROM calls WHERE business_id = 'demo'"):
+        key = (row['timestamp'][:10], row['issue_type'] or 'unknown')
+        calls[key, 'calls'] += 1
+        calls[key, 'emergencies'] += bool(row['is_emergency'])
+        calls[key, 'bookings'] += bool(row['booking_requested'])
+        if row['call_duration'] is not None:
+            durations.setdefault(key, []).append(row['call_duration'])
+    expected = {
+        key: (calls[key, 'calls'], calls[key, 'emergencies'], calls[key, 'bookings'],
+              round(sum(durations[key]) / len(durations[key]), 1) if key in durations else None)
+        for key in {k for k, _ in calls}
+    }
+    return got, expected
+
+
+def call(i, hour, business_id='demo', issue='leak', emergency=False, booking=False, duration=60):
+    return (f'c{i}', f'2026-03-{1 + hour // 24:02d}T{hour % 24:02d}:{i % 60:02d}:00',
+            business_id, issue, emergency, booking, duration)
+
+
+def test_refresh_tracks_random_writes_exactly(db_path):
+    rng = random.Random(3)
+    for _ in range(20):
+        for _ in range(rng.randrange(1, 15)):
+            i = rng.randrange(60)
+            write(db_path, call(i, rng.randrange(72), rng.choice(['demo', 'demo', 'acme']),
+                                rng.choice(['leak', 'heating', None]), rng.random() < 0.3,
+                                rng.random() < 0.5, rng.choice([30, 90, None])))
+        if rng.random() < 0.3:
+            with storage.transaction(db_path) as c:
+                c.execute("UPDATE calls SET is_emergency = 1, status = 'x' WHERE id = ?", (f'c{rng.randrange(60)}',))
+                c.execute('DELETE FROM calls WHERE id = ?', (f'c{rng.randrange(60)}',))
+        refresh(db_path)
+        got, expected = by_day_and_type(db_path)
+        assert got == expected
+
+
+def test_only_touched_buckets_are_recomputed(db_path):
+    write(db_path, *[call(i, i) for i in range(48)])
+    assert refresh(db_path) == 48
+    assert refresh(db_path) == 0
+    write(db_path, call(100, 5), call(101, 5), call(3, 30))  # c3 moves from hour 3 to hour 30
+    assert refresh(db_path) == 3
+    with storage.transaction(db_path) as c:
+        c.execute("UPDATE calls SET status = 'closed'")  # not a rolled-up column
+    assert refresh(db_path) == 0
+
+    c = storage.get_connection(db_path)
+    assert rollups.state(c)['pending_changes'] == 0
+    rows = rollups.analytics(c, 'demo', '2026-03-01T05:30:00', '2026-03-01T06:00:00', ['hour'])
+    assert rows == [{'hour': '2026-03-01T05:00:00', 'calls': 3, 'emergencies': 0, 'emergency_share': 0.0,
+                     'booking_requests': 0, 'booking_rate': 0.0, 'avg_duration': 60.0}]
+
+
+def test_rebuild_matches_refresh(db_path):
+    write(db_path, *[call(i, i % 50, emergency=i % 4 == 0, booking=i % 3 == 0) for i in range(200)])
+    refresh(db_path)
+    c = storage.get_connection(db_path)
+    incremental = c.execute('SELECT * FROM call_rollups_hourly ORDER BY 1, 2, 3, 4, 5').fetchall()
+    with storage.transaction(db_path) as c:
+        rollups.rebuild(c)
+    rebuilt = c.execute('SELECT * FROM call_rollups_hourly ORDER BY 1, 2, 3, 4, 5').fetchall()
+    assert [tuple(r) for r in incremental] == [tuple(r) for r in rebuilt]
+
+
+def test_weekday_and_hour_of_day(db_path):
+    write(db_path, call(1, 9), call(2, 24 + 9), call(3, 10))  # 2026-03-01 is a Sunday
+    refresh(db_path)
+    c = storage.get_connection(db_path)
+    rows = rollups.analytics(c, 'demo', '2026-03-01', '2026-03-08', ['weekday', 'hour_of_day'])
+    assert [(r['weekday'], r['hour_of_day'], r['calls']) for r in rows] == [(0, 9, 1), (0, 10, 1), (1, 9, 1)]
+    with pytest.raises(ValueError):
+        rollups.analytics(c, 'demo', '2026-03-01', '2026-03-08', ['minute'])
+
+
+def test_bucket_recompute_seeks_the_tenant_time_index(db_path):
+    c = storage.get_connection(db_path)
+    plan = ' '.join(r[-1] for r in c.execute(f'''
+        EXPLAIN QUERY PLAN {rollups._AGGREGATE}
+        WHERE business_id = ? AND timestamp >= ? AND timestamp < ? GROUP BY 3, 4, 5
+    ''', ('demo', '2026-03-01T05', '2026-03-01T06')))
+    assert 'SEARCH calls USING INDEX idx_calls_business_time_id' in plan, plan
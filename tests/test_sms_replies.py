@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for SMS appointment reply handling
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import customer_profiles
+import sms_replies
+from sms_replies import apply_reply, parse_intent
+
+PHONE = '+15551234567'
+
+
+@pytest.mark.parametrize('body, intent', [
+    ('CONFIRM', 'confirm'), ('yes please', 'confirm'), ('C', 'confirm'), ('Yes!', 'confirm'),
+    ('Cancel.', 'cancel'), ('cancel my appointment please', 'cancel'),
+    ('RESCHEDULE', 'reschedule'), ('Reschedule to Friday?', 'reschedule'),
+    ('STOP', None), ('what time are you coming', None), ('', None),
+    ('I am not sure I can make it', None), ('Not ok, the AC died again', None),
+    ('Please do not cancel', None), ('Can you send another tech?', None),
+    ('C you at 9', None), ('yes, cancel it', None),
+])
+def test_parse_intent(body, intent):
+    assert parse_intent(body) == intent
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / 'sms.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE appointments (id TEXT PRIMARY KEY, customer_phone_e164 TEXT,
+                     status TEXT, scheduled_date TEXT, scheduled_time TEXT, created_at TEXT)''')
+        customer_profiles.init_schema(c)
+        sms_replies.init_schema(c)
+        c.executemany('INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?)', [
+            ('old', PHONE, 'pending', '2026-02-01', '9am', '2026-01-01'),
+            ('new', PHONE, 'pending', '2026-02-10', '1pm', '2026-01-02'),
+            ('other', '+15550000000', 'pending', '2026-02-20', None, '2026-01-03'),
+        ])
+    yield storage.get_connection(path)
+    storage.close_all()
+
+
+def status(conn, appointment_id):
+    return conn.execute('SELECT status FROM appointments WHERE id = ?', (appointment_id,)).fetchone()[0]
+
+
+def test_confirm_then_cancel(conn):
+    outcome = apply_reply(conn, PHONE, 'Confirm')
+    assert outcome.appointment_id == 'new' and '2026-02-10 1pm' in outcome.reply
+    assert status(conn, 'new') == 'confirmed' and status(conn, 'old') == 'pending'
+
+    # Cancel prefers a pending appointment, then a confirmed one
+    assert apply_reply(conn, PHONE, 'cancel').appointment_id == 'old'
+    assert apply_reply(conn, PHONE, 'cancel').appointment_id == 'new'
+    assert apply_reply(conn, PHONE, 'cancel').appointment_id is None
+    assert status(conn, 'other') == 'pending'
+    assert customer_profiles.get_profile(conn, PHONE)['open_appointment_id'] is None
+
+
+def test_picks_the_nearest_upcoming_appointment(conn):
+    conn.executemany('INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?)', [
+        ('far', PHONE, 'confirmed', '2026-06-01', '10:00', '2026-01-04'),
+        ('near', PHONE, 'confirmed', '2026-03-05', '14:00', '2026-01-05'),
+        ('near-morning', PHONE, 'confirmed', '2026-03-05', '09:00', '2026-01-06'),
+    ])
+    assert sms_replies.find_appointment(conn, PHONE, 'confirmed', today='2026-03-01')['id'] == 'near-morning'
+    assert sms_replies.find_appointment(conn, PHONE, 'confirmed', today='2026-03-06')['id'] == 'far'
+    # Nothing upcoming: the latest past one
+    assert sms_replies.find_appointment(conn, PHONE, 'confirmed', today='2026-07-01')['id'] == 'far'
+    assert sms_replies.find_appointment(conn, PHONE, 'pending', today='2026-01-15')['id'] == 'old'
+
+
+@pytest.mark.parametrize('query', [
+    "SELECT id FROM appointments WHERE customer_phone_e164 = ? AND status = ? "
+    "AND scheduled_date >= '2026-01-01' ORDER BY scheduled_date, scheduled_time LIMIT 1",
+    "SELECT id FROM appointments WHERE customer_phone_e164 = ? AND status = ? "
+    "ORDER BY scheduled_date DESC, scheduled_time DESC LIMIT 1",
+])
+def test_lookup_uses_index(conn, query):
+    plan = ' '.join(r[-1] for r in conn.execute(f'EXPLAIN QUERY PLAN {query}', (PHONE, 'pending')))
+    assert 'idx_appointments_reply_next' in plan and 'TEMP B-TREE' not in plan
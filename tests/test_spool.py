@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the raw webhook spool
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from spool import Spool, parse_time
+
+
+def test_round_trip_and_time_range(tmp_path):
+    spool = Spool(tmp_path)
+    for i in range(5):
+        spool.append('vapi', f'{{"n": {i}}}'.encode(), received_at=1000.0 + i)
+    spool.append('twilio', b'From=%2B1555', received_at=1010.0)
+    spool.close()
+
+    records = list(spool.read())
+    assert [r.body for r in records][:2] == [b'{"n": 0}', b'{"n": 1}']
+    assert records[-1].source == 'twilio'
+
+    window = list(spool.read(since=1001.0, until=1003.0))
+    assert [r.received_at for r in window] == [1001.0, 1002.0, 1003.0]
+    assert [r.source for r in spool.read(sources={'twilio'})] == ['twilio']
+
+
+def test_segments_rotate_and_old_segments_are_skipped(tmp_path):
+    spool = Spool(tmp_path, segment_bytes=50)
+    for i in range(6):
+        spool.append('vapi', b'x' * 40, received_at=2000.0 + i)
+    spool.close()
+
+    assert len(spool.segments()) == 6
+    assert [r.received_at for r in spool.read(since=2004.0)] == [2004.0, 2005.0]
+
+
+def test_corrupt_tail_stops_segment(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append('vapi', b'{"ok": 1}', received_at=3000.0)
+    spool.append('vapi', b'{"ok": 2}', received_at=3001.0)
+    spool.close()
+
+    segment = spool.segments()[0]
+    data = bytearray(segment.read_bytes())
+    data[-1] ^= 0xFF
+    segment.write_bytes(bytes(data))
+
+    assert [r.body for r in spool.read()] == [b'{"ok": 1}']
+
+
+def test_date_only_upper_bound_covers_the_whole_day():
+    assert parse_time('2026-03-31') == datetime(2026, 3, 31).timestamp()
+    assert parse_time('2026-03-31', end_of_day=True) > datetime(2026, 3, 31, 23, 59, 59).timestamp()
+    assert parse_time('2026-03-31', end_of_day=True) < datetime(2026, 4, 1).timestamp()
+    assert parse_time('2026-03-31T12:00', end_of_day=True) == datetime(2026, 3, 31, 12).timestamp()
+    assert parse_time(None) is None
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared SQLite access layer
+"""
+
+import gc
+import os
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'test.db'
+    yield path
+    storage.close_all()
+
+
+def test_connection_is_reused_per_thread(db_path):
+    first = storage.get_connection(db_path)
+    assert storage.get_connection(db_path) is first
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(storage.get_connection(db_path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_pragmas_applied_once(db_path):
+    conn = storage.get_connection(db_path)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+
+def test_transaction_commits_and_rolls_back(db_path):
+    with storage.transaction(db_path) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction(db_path) as conn:
+            conn.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError('boom')
+
+    rows = storage.get_connection(db_path).execute('SELECT x FROM t').fetchall()
+    assert [r[0] for r in rows] == [1]
+
+
+def test_nested_transaction_uses_savepoint(db_path):
+    with storage.transaction(db_path) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+        with pytest.raises(ValueError):
+            with storage.transaction(db_path) as inner:
+                inner.execute('INSERT INTO t VALUES (2)')
+                raise ValueError('inner only')
+
+    rows = storage.get_connection(db_path).execute('SELECT x FROM t').fetchall()
+    assert [r[0] for r in rows] == [1]
+
+
+def test_thread_churn_does_not_leak_connections(db_path):
+    storage.get_connection(db_path)
+    live = len(storage._registry)
+    fds = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+    ended = []
+
+    def request():
+        conn = storage.get_connection(db_path)
+        conn.execute('SELECT 1')
+        ended.append(conn)
+
+    # Flask's threaded server runs every request on a new thread
+    for _ in range(300):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(storage._registry) == live
+    with pytest.raises(sqlite3.ProgrammingError):
+        ended[0].execute('SELECT 1')
+    if fds is not None:
+        assert len(os.listdir('/proc/self/fd')) < fds + 50  # leaking, it would be 600 more
+    assert storage.get_connection(db_path).execute('SELECT 1').fetchone()[0] == 1
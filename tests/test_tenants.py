@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for per-tenant databases: routing by called number, files created on
+first write only, and the bounded connection cache
+"""
+
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from tenants import TenantDatabases, TenantDirectory
+
+
+def init(c):
+    c.execute('CREATE TABLE IF NOT EXISTS calls (id TEXT PRIMARY KEY, business_id TEXT)')
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    with storage.transaction(tmp_path / 'main.db') as c:
+        init(c)
+    dbs = TenantDatabases(tmp_path / 'main.db', tmp_path / 'tenants', 'demo', init=init, max_open=2)
+    yield dbs
+    dbs.close()
+    storage.close_all()
+
+
+def add(dbs, business_id, call_id):
+    with dbs.transaction(business_id) as c:
+        c.execute('INSERT INTO calls VALUES (?, ?)', (call_id, business_id))
+
+
+def test_directory_resolves_called_numbers(tmp_path):
+    path = tmp_path / 'companies.json'
+    path.write_text(json.dumps({'companies': [
+        {'company_id': 'acme', 'twilio_phone_number': '+1 (312) 555-0100', 'active': True},
+        {'company_id': 'gone', 'phone': '312-555-0101', 'active': False},
+    ]}))
+    directory = TenantDirectory(path, 'demo')
+    assert directory.resolve('3125550100') == 'acme'
+    assert directory.resolve('+13125550101') == 'demo'
+    assert directory.resolve(None) == 'demo'
+
+    path.write_text(json.dumps({'companies': [{'company_id': 'acme2', 'phone': '3125550100'}]}))
+    directory._mtime = None  # same-second rewrite
+    assert directory.resolve('3125550100') == 'acme2'
+
+
+def test_reads_never_create_a_tenant(dbs):
+    assert dbs.read('acme', lambda c: 1, 'none') == 'none'
+    assert dbs.tenants() == ['demo']
+    add(dbs, 'acme', 'c1')
+    add(dbs, 'demo', 'c2')
+    assert dbs.path('acme').exists() and dbs.tenants() == ['demo', 'acme']
+    assert dbs.read('acme', lambda c: c.execute('SELECT id FROM calls').fetchall()[0][0]) == 'c1'
+    assert dbs.aggregate('SELECT COUNT(*) AS calls FROM calls') == [
+        {'business_id': 'demo', 'calls': 1}, {'business_id': 'acme', 'calls': 1}
+    ]
+    for bad in ('../main', 'a/b', '', '.hidden'):
+        with pytest.raises(ValueError):
+            dbs.path(bad)
+
+
+def test_transactions_roll_back_and_nest(dbs):
+    with pytest.raises(RuntimeError):
+        with dbs.transaction('acme') as c:
+            c.execute("INSERT INTO calls VALUES ('c1', 'acme')")
+            raise RuntimeError
+    with dbs.transaction('acme') as c:
+        c.execute("INSERT INTO calls VALUES ('c2', 'acme')")
+        with pytest.raises(RuntimeError):
+            with dbs.transaction('acme') as inner:
+                inner.execute("INSERT INTO calls VALUES ('c3', 'acme')")
+                raise RuntimeError
+    assert dbs.read('acme', lambda c: [r[0] for r in c.execute('SELECT id FROM calls')]) == ['c2']
+
+
+def test_connections_beyond_max_open_or_idle_are_closed(dbs):
+    for business_id in ('a', 'b', 'c'):
+        add(dbs, business_id, 'c1')
+    assert dbs.metrics() == {'hits': 0, 'opened': 3, 'created': 3, 'evicted': 1, 'open': 2}
+
+    # A connection in use is never closed, however far over the limit
+    with dbs.connection('a') as held:
+        add(dbs, 'b', 'c2')
+        add(dbs, 'c', 'c2')
+        held.execute('SELECT 1')
+    assert dbs.metrics()['open'] == 2
+
+    dbs.idle_timeout = 0
+    time.sleep(0.01)
+    dbs.evict_idle()
+    assert dbs.metrics()['open'] == 0
+    assert dbs.read('a', lambda c: c.execute('SELECT COUNT(*) FROM calls').fetchone()[0]) == 1
+
+
+def test_readers_never_wait_for_a_writer(dbs):
+    add(dbs, 'acme', 'c1')
+    writing, done = threading.Event(), threading.Event()
+
+    def writer():
+        with dbs.transaction('acme') as c:
+            c.execute("INSERT INTO calls VALUES ('c2', 'acme')")
+            writing.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert writing.wait(5)
+    started = time.monotonic()
+    # The reader's own connection sees the last commit, without queueing
+    assert dbs.read('acme', lambda c: [r[0] for r in c.execute('SELECT id FROM calls')]) == ['c1']
+    assert time.monotonic() - started < 1
+    done.set()
+    thread.join()
+    assert dbs.read('acme', lambda c: [r[0] for r in c.execute('SELECT id FROM calls')]) == ['c1', 'c2']
+
+
+def test_connections_are_reused_across_threads(dbs):
+    add(dbs, 'acme', 'c1')
+
+    # A thread-per-request server: every read runs on a new thread
+    for _ in range(20):
+        thread = threading.Thread(target=lambda: dbs.read('acme', lambda c: c.execute('SELECT 1').fetchone()))
+        thread.start()
+        thread.join()
+    assert dbs.metrics() == {'hits': 20, 'opened': 1, 'created': 1, 'evicted': 0, 'open': 1}
+
+
+def test_concurrent_first_use_initializes_once(tmp_path):
+    calls, start = [], threading.Barrier(8)
+
+    def slow_init(c):
+        calls.append(1)
+        time.sleep(0.05)
+        init(c)
+
+    dbs = TenantDatabases(tmp_path / 'main.db', tmp_path / 'tenants', 'demo', init=slow_init, max_open=2)
+
+    def writer(n):
+        start.wait()
+        add(dbs, 'acme', f'c{n}')
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert len(calls) == 1
+        assert dbs.read('acme', lambda c: c.execute('SELECT COUNT(*) FROM calls').fetchone()[0]) == 8
+        assert dbs.metrics()['open'] <= 2
+    finally:
+        dbs.close()
+        storage.close_all()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass transcript analyzer
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from transcript_analyzer import analyze_transcript
+
+
+def test_emergency_booking_and_name_in_one_result():
+    result = analyze_transcript(
+        "Hi, my name is Bob. The AC is not working and there's no heat. "
+        "Can you schedule someone to come out?"
+    )
+    assert result.is_emergency and result.issue_type == 'emergency'
+    assert [m[2] for m in result.emergency_matches] == ['not working', 'no heat']
+    assert result.booking_requested
+    assert [m[2] for m in result.booking_matches] == ['schedule', 'come out']
+    assert result.customer_name == 'Bob'
+
+
+def test_keywords_match_whole_words_only():
+    result = analyze_transcript("What's the price for a service visit at my office?")
+    assert not result.is_emergency
+    assert result.issue_type == 'routine'
+
+
+def test_phrase_broken_by_other_word_does_not_match():
+    assert not analyze_transcript('no extra heat needed').is_emergency
+    assert analyze_transcript('No heat!').is_emergency
+
+
+def test_name_pattern_priority_matches_legacy_order():
+    assert analyze_transcript('this is urgent. My name is Tom').customer_name == 'Tom'
+    assert analyze_transcript("hello I'm Sara").customer_name == 'Sara'
+    assert analyze_transcript('my name is').customer_name is None
+    assert analyze_transcript('').customer_name is None
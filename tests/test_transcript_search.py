@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for FTS5 transcript search
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+import transcript_search
+from transcript_search import match_query, search
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'search.db'
+    with storage.transaction(path) as c:
+        c.execute('''CREATE TABLE calls (id TEXT PRIMARY KEY, timestamp TEXT, business_id TEXT,
+                     customer_name TEXT, customer_phone TEXT, transcript TEXT, issue_type TEXT,
+                     is_emergency BOOLEAN, status TEXT)''')
+    yield path
+    storage.close_all()
+
+
+def write(db_path, *rows):
+    with storage.transaction(db_path) as c:
+        c.executemany('''INSERT OR REPLACE INTO calls (id, timestamp, business_id, transcript)
+                         VALUES (?, ?, ?, ?)''', rows)
+
+
+def check_integrity(db_path):
+    """FTS5 compares the index against the calls rows it was built from"""
+    with storage.transaction(db_path) as c:
+        c.execute("INSERT INTO calls_fts (calls_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def ids(db_path, q, **filters):
+    return [r['id'] for r in search(storage.get_connection(db_path), q, filters)]
+
+
+def test_index_follows_inserts_replaces_updates_and_deletes(db_path):
+    with storage.transaction(db_path) as c:
+        transcript_search.init_schema(c)
+    write(db_path, ('a', '2026-03-01T09:00', 'demo', 'The carbon monoxide alarm is beeping'),
+          ('b', '2026-03-02T09:00', 'demo', 'Furnace leaking water'))
+    assert ids(db_path, 'carbon monoxide') == ['a']
+
+    # Retried webhook rewrites the row with a new transcript
+    write(db_path, ('a', '2026-03-01T09:00', 'demo', 'Just a tune-up please'))
+    assert ids(db_path, 'monoxide') == []
+    with storage.transaction(db_path) as c:
+        c.execute("UPDATE calls SET transcript = 'CO detector going off' WHERE id = 'b'")
+        c.execute("UPDATE calls SET status = 'closed'")
+    assert ids(db_path, 'leaking') == [] and ids(db_path, 'detector') == ['b']
+    with storage.transaction(db_path) as c:
+        c.execute("DELETE FROM calls WHERE id = 'b'")
+    assert ids(db_path, 'detector') == []
+    check_integrity(db_path)
+
+
+def test_rebuild_indexes_existing_calls(db_path):
+    write(db_path, ('a', '2026-03-01T09:00', 'demo', 'gas smell in the basement'))
+    with storage.transaction(db_path) as c:
+        assert transcript_search.init_schema(c) is True
+        assert transcript_search.rebuild(c) == 1
+        assert transcript_search.init_schema(c) is False
+    assert ids(db_path, 'smells') == ['a']  # porter stemming
+    check_integrity(db_path)
+
+
+def test_filters_rank_and_snippets(db_path):
+    with storage.transaction(db_path) as c:
+        transcript_search.init_schema(c)
+    write(db_path,
+          ('a', '2026-02-27T09:00', 'demo', 'the unit makes a noise and there may be a leak somewhere'),
+          ('b', '2026-03-01T09:00', 'demo', 'leak leak under the <sink>, big leak'),
+          ('c', '2026-03-01T10:00', 'acme', 'small leak'))
+    assert ids(db_path, 'leak', business_id='demo') == ['b', 'a']
+    assert ids(db_path, 'leak', business_id='demo', since='2026-03-01') == ['b']
+    assert ids(db_path, 'leak', until='2026-03-01') == ['a']
+
+    result = search(storage.get_connection(db_path), 'sink', {})[0]
+    assert result['snippet'] == 'leak leak under the &lt;<mark>sink</mark>&gt;, big leak'
+    assert search(storage.get_connection(db_path), 'leak', {'business_id': 'acme'})[0]['snippet'] == \
+        'small <mark>leak</mark>'
+    assert result['rank'] > 0
+
+
+@pytest.mark.parametrize('q, expected', [
+    ('carbon monoxide', '"carbon" "monoxide"'),
+    ('"carbon monoxide" alarm', '"carbon monoxide" "alarm"'),
+    ('NOT furnace: -AND* OR', '"NOT" "furnace:" "-AND*" "OR"'),
+    ('say "hi', '"say" """hi"'),
+])
+def test_user_text_never_becomes_fts_syntax(db_path, q, expected):
+    assert match_query(q) == expected
+    with storage.transaction(db_path) as c:
+        transcript_search.init_schema(c)
+    search(storage.get_connection(db_path), q, {})  # never an FTS5 syntax error
+
+
+@pytest.mark.parametrize('q', [None, '', '   ', '""'])
+def test_empty_query_is_a_value_error(q):
+    with pytest.raises(ValueError):
+        match_query(q)
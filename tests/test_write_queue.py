@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-behind group-commit queue
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import storage
+from write_queue import PriorityLanes, WriteBehindQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'queue.db'
+    with storage.transaction(path) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER PRIMARY KEY)')
+    yield path
+    storage.close_all()
+
+
+def insert_rows(conn, records):
+    conn.executemany('INSERT INTO t (x) VALUES (?)', [(r,) for r in records])
+
+
+def count(db_path):
+    return storage.get_connection(db_path).execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+
+def test_batches_are_group_committed(db_path):
+    writer = WriteBehindQueue(db_path, insert_rows, max_batch_size=10, max_flush_delay=1)
+    for i in range(25):
+        writer.put(i)
+    assert writer.flush(timeout=5)
+    assert count(db_path) == 25
+    assert writer.metrics()['queue_depth'] == 0
+    assert writer.stats['batches'] <= 4
+    writer.stop()
+
+
+def test_bad_record_does_not_drop_batch(db_path):
+    writer = WriteBehindQueue(db_path, insert_rows, max_batch_size=10, max_flush_delay=1)
+    for x in (1, 2, 2, 3):  # duplicate primary key fails the batch
+        writer.put(x)
+    writer.flush(timeout=5)
+    assert count(db_path) == 3
+    assert writer.stats['errors'] == 1
+    writer.stop()
+
+
+def test_write_first_runs_outside_the_batch_transaction(db_path, tmp_path):
+    other = tmp_path / 'other.db'
+    with storage.transaction(other) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER PRIMARY KEY)')
+    seen = []
+
+    def write_first(records):
+        seen.append(storage.get_connection(db_path).in_transaction)
+        with storage.transaction(other) as conn:
+            insert_rows(conn, records)
+
+    writer = WriteBehindQueue(db_path, insert_rows, write_first=write_first, max_flush_delay=0.01)
+    for i in range(5):
+        writer.put(i)
+    assert writer.flush(timeout=5)
+    writer.stop()
+    assert seen and not any(seen)
+    assert count(db_path) == count(other) == 5
+
+
+def test_stop_flushes_pending_records(db_path):
+    writer = WriteBehindQueue(db_path, insert_rows, max_batch_size=1000, max_flush_delay=60)
+    for i in range(5):
+        writer.put(i)
+    writer.stop()
+    assert count(db_path) == 5
+
+
+def test_emergency_lane_skips_routine_backlog(db_path):
+    def slow_insert(conn, records):
+        time.sleep(0.01 * len(records))
+        insert_rows(conn, records)
+
+    lanes = PriorityLanes(db_path, slow_insert, lanes=('emergency', 'routine'),
+                          lane_of=lambda x: 'emergency' if x < 0 else 'routine',
+                          lane_options={'emergency': {'max_flush_delay': 0}},
+                          max_batch_size=10, max_flush_delay=0.01)
+    for i in range(100):
+        lanes.put(i)
+    time.sleep(0.02)
+    lanes.put(-1)
+    assert lanes.lanes['emergency'].flush(timeout=5)
+    assert count(db_path) < 101  # committed ahead of the routine backlog
+    assert lanes.flush(timeout=10)
+
+    metrics = lanes.metrics()
+    assert count(db_path) == 101 and metrics['queue_depth'] == 0
+    assert metrics['lanes']['emergency']['written'] == 1
+    assert metrics['lanes']['emergency']['wait_ms_max'] < metrics['lanes']['routine']['wait_ms_max']
+    lanes.stop()
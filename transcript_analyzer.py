@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Single-pass transcript analysis
+Tokenizes a transcript once and runs every keyword set (emergency, booking,
+name introductions) through one Aho-Corasick automaton over tokens.
+
+Keywords match whole words: the old substring scan flagged 'ice' inside
+"service" or "price" and 'fire' inside "fireplace".
+"""
+
+import re
+import time
+from collections import deque
+from itertools import compress, count
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EMERGENCY_KEYWORDS = [
+    'no heat', 'no heating', 'no ac', 'no air', 'not working', 'completely dead',
+    'leaking', 'leak', 'leaks', 'water', 'burning smell', 'smoke', 'fire',
+    'frozen', 'ice', 'urgent', 'emergency', 'dangerous',
+    'unsafe', 'gas smell', 'smell gas', 'gas leak', 'carbon monoxide',
+    'pregnant', 'baby', 'elderly'
+]
+
+# Phrases that page the on-call tech mid-call, before the caller hangs up
+HIGH_SEVERITY_KEYWORDS = {
+    'gas smell', 'smell gas', 'gas leak', 'carbon monoxide', 'burning smell',
+    'smoke', 'fire', 'dangerous', 'unsafe'
+}
+
+BOOKING_KEYWORDS = [
+    'schedule', 'scheduled', 'scheduling', 'appointment', 'appointments',
+    'book', 'booking', 'come out', 'send someone'
+]
+
+# Introductions in priority order, the name is the token that follows
+NAME_PATTERNS = [
+    'my name is',
+    'this is',
+    'name is',
+    "hello i'm", "hi i'm", 'hello this is', 'hi this is',
+]
+
+# Punctuation becomes whitespace so str.split() tokenizes at C speed;
+# apostrophes stay inside words ("i'm") and curly ones are normalized
+_PUNCTUATION = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\u2013\u2014\u2026\u201c\u201d'
+TOKEN_TABLE = str.maketrans({**{c: ' ' for c in _PUNCTUATION}, '\u2019': "'"})
+
+Match = Tuple[int, int, str]  # (first token, last token + 1, phrase)
+
+
+def tokenize(text: str) -> List[str]:
+    return text.translate(TOKEN_TABLE).split()
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton whose alphabet is tokens instead of characters"""
+
+    def __init__(self, phrases: Iterable[Tuple[str, str]]):
+        """phrases: (phrase, label) pairs; a phrase is split into tokens"""
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[Tuple[int, str, str]]] = [[]]  # (token length, phrase, label)
+
+        for phrase, label in phrases:
+            tokens = tokenize(phrase.lower())
+            state = 0
+            for token in tokens:
+                nxt = self.goto[state].get(token)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][token] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append((len(tokens), phrase, label))
+
+        self.vocabulary = frozenset(t for edges in self.goto for t in edges)
+        self.max_phrase_tokens = max((o[0][0] for o in self.out if o), default=1)
+
+        # Breadth-first failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and token not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(token, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def step(self, state: int, token: str) -> int:
+        goto, fail = self.goto, self.fail
+        while state and token not in goto[state]:
+            state = fail[state]
+        return goto[state].get(token, 0)
+
+
+@dataclass
+class TranscriptAnalysis:
+    issue_type: str = 'routine'
+    is_emergency: bool = False
+    emergency_matches: List[Match] = field(default_factory=list)
+    booking_requested: bool = False
+    booking_matches: List[Match] = field(default_factory=list)
+    customer_name: Optional[str] = None
+
+
+class TranscriptAnalyzer:
+    """Classify a transcript, detect booking intent and extract the caller's name"""
+
+    def __init__(self, emergency_keywords=EMERGENCY_KEYWORDS,
+                 booking_keywords=BOOKING_KEYWORDS, name_patterns=NAME_PATTERNS):
+        self.name_priority = {p: i for i, p in enumerate(name_patterns)}
+        self.automaton = TokenAutomaton(
+            [(k, 'emergency') for k in emergency_keywords]
+            + [(k, 'booking') for k in booking_keywords]
+            + [(p, 'name') for p in name_patterns]
+        )
+
+    def scan(self, lowered: List[str], state: int = 0, offset: int = 0):
+        """
+        Run lowercase tokens through the automaton starting from `state`.
+
+        Returns (hits, state) where hits are (first token, last token + 1,
+        phrase, label) shifted by `offset`. Passing the returned state and
+        token offset back in continues a phrase across fragments.
+        """
+        automaton = self.automaton
+        step, out, vocabulary = automaton.step, automaton.out, automaton.vocabulary
+        hits = []
+        prev = -1 if state else -2
+        # One C-level pass picks the positions of tokens the automaton knows;
+        # any other token between two of them resets the automaton
+        for i in compress(count(), map(vocabulary.__contains__, lowered)):
+            if i != prev + 1:
+                state = 0
+            prev = i
+            state = step(state, lowered[i])
+            for length, phrase, label in out[state]:
+                hits.append((offset + i - length + 1, offset + i + 1, phrase, label))
+        if prev != len(lowered) - 1:
+            state = 0
+        return hits, state
+
+    def analyze(self, transcript: Optional[str]) -> TranscriptAnalysis:
+        result = TranscriptAnalysis()
+        if not transcript:
+            return result
+
+        lowered = tokenize(transcript.lower())
+        hits, _ = self.scan(lowered)
+
+        best_name = None  # (priority, index of the token after the introduction)
+        for start, end, phrase, label in hits:
+            if label == 'emergency':
+                result.emergency_matches.append((start, end, phrase))
+            elif label == 'booking':
+                result.booking_matches.append((start, end, phrase))
+            elif end < len(lowered):
+                candidate = (self.name_priority[phrase], end)
+                if best_name is None or candidate < best_name:
+                    best_name = candidate
+
+        if result.emergency_matches:
+            result.issue_type, result.is_emergency = 'emergency', True
+        result.booking_requested = bool(result.booking_matches)
+        if best_name is not None:
+            # lower() never introduces whitespace, so token indexes line up
+            result.customer_name = tokenize(transcript)[best_name[1]].strip("'") or None
+        return result
+
+
+ANALYZER = TranscriptAnalyzer()
+
+
+def analyze_transcript(transcript: Optional[str]) -> TranscriptAnalysis:
+    """Analyze with the default keyword sets"""
+    return ANALYZER.analyze(transcript)
+
+
+def _legacy_analysis(transcript: str):
+    """The pre-analyzer implementation, kept for the benchmark"""
+    lowered = transcript.lower()
+    emergency = any(k in lowered for k in EMERGENCY_KEYWORDS)
+    booking = any(k in transcript.lower() for k in BOOKING_KEYWORDS)
+    name = None
+    for pattern in [r'my name is (\w+)', r'this is (\w+)', r'name is (\w+)',
+                    r'(?:hello|hi) (?:i\'m|this is) (\w+)']:
+        match = re.search(pattern, transcript, re.IGNORECASE)
+        if match:
+            name = match.group(1)
+            break
+    return emergency, booking, name
+
+
+def benchmark(words: int = 10000, runs: int = 50):
+    """Throughput on synthetic transcripts of `words` words"""
+    import random
+    vocabulary = ('the unit is making a noise and the thermostat says cool but the house '
+                  'stays warm can you check the filter tomorrow morning thanks').split()
+    rng = random.Random(42)
+    transcript = ' '.join(rng.choice(vocabulary) for _ in range(words))
+    transcript = 'Hi this is Dana. ' + transcript + ' I smell gas, please send someone.'
+
+    results = {}
+    for name, fn in [('analyzer', analyze_transcript), ('legacy', _legacy_analysis)]:
+        fn(transcript)
+        started = time.perf_counter()
+        for _ in range(runs):
+            fn(transcript)
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed / runs
+
+    mb = len(transcript.encode('utf-8')) / 1e6
+    print(f"Transcript: {words} words, {mb * 1000:.0f} KB, {runs} runs")
+    for name, per_run in results.items():
+        print(f"  {name:<9} {per_run * 1000:8.2f} ms/transcript  "
+              f"{words / per_run / 1e6:6.2f} M words/s  {mb / per_run:7.1f} MB/s")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        words = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        benchmark(words)
+    else:
+        print("Usage: python transcript_analyzer.py --bench [words]")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Full-text search over call transcripts
+calls_fts is an external-content FTS5 index on calls.transcript (no second
+copy of the text), kept in sync by triggers. The writers rewrite calls with
+storage.upsert_sql, which goes through the UPDATE trigger. INSERT OR REPLACE
+only reaches the DELETE trigger with recursive_triggers on (storage sets it);
+a plain connection that replaces rows without it leaves the old terms behind,
+so run rebuild afterwards.
+
+Usage:
+    python transcript_search.py rebuild     # index every existing transcript
+    python transcript_search.py optimize    # merge index segments (after bulk loads)
+"""
+
+import html
+import re
+from typing import Dict, List, Optional
+
+import queries
+import storage
+
+TRIGGERS = {
+    'trg_calls_fts_insert': '''AFTER INSERT ON calls BEGIN
+        INSERT INTO calls_fts (rowid, transcript) VALUES (NEW.rowid, NEW.transcript);
+    END''',
+    'trg_calls_fts_delete': '''AFTER DELETE ON calls BEGIN
+        INSERT INTO calls_fts (calls_fts, rowid, transcript) VALUES ('delete', OLD.rowid, OLD.transcript);
+    END''',
+    'trg_calls_fts_update': '''AFTER UPDATE OF transcript ON calls BEGIN
+        INSERT INTO calls_fts (calls_fts, rowid, transcript) VALUES ('delete', OLD.rowid, OLD.transcript);
+        INSERT INTO calls_fts (rowid, transcript) VALUES (NEW.rowid, NEW.transcript);
+    END''',
+}
+
+RESULT_FIELDS = ('id', 'timestamp', 'business_id', 'customer_name', 'customer_phone',
+                 'issue_type', 'is_emergency', 'status')
+
+# Control characters never appear in transcripts, so the snippet can be
+# HTML-escaped first and the matches marked afterwards
+_OPEN, _CLOSE = '\x02', '\x03'
+_TERMS = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def init_schema(c) -> bool:
+    """Create calls_fts and its triggers; True if the index is new (needs rebuild)"""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'calls_fts'"
+    ).fetchone()
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS calls_fts USING fts5(
+            transcript,
+            content = 'calls',
+            content_rowid = 'rowid',
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+    ''')
+    for name, body in TRIGGERS.items():
+        c.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    return exists is None
+
+
+def rebuild(c) -> int:
+    """Re-index every transcript from calls"""
+    c.execute("INSERT INTO calls_fts (calls_fts) VALUES ('rebuild')")
+    return c.execute('SELECT COUNT(*) FROM calls WHERE transcript IS NOT NULL').fetchone()[0]
+
+
+def optimize(c) -> None:
+    c.execute("INSERT INTO calls_fts (calls_fts) VALUES ('optimize')")
+
+
+def match_query(q: Optional[str]) -> str:
+    """
+    FTS5 query for user text: "quoted phrases" stay phrases, every other word
+    is a literal term, all of them required. No FTS operators leak through,
+    so any input is a valid query.
+    """
+    terms = []
+    for phrase, word in _TERMS.findall(q or ''):
+        text = (phrase or word).strip()
+        if text:
+            terms.append('"' + text.replace('"', '""') + '"')
+    if not terms:
+        raise ValueError('q must contain at least one search term')
+    return ' '.join(terms)
+
+
+def search(c, q: str, filters: Dict[str, object], limit: int = 20,
+           schema: str = 'main') -> List[dict]:
+    """
+    Calls whose transcript matches q, best bm25 rank first, each with a
+    highlighted snippet (HTML-escaped, matches in <mark>). filters are
+    queries.CALL_FILTERS keys. schema is an attached month partition, whose
+    calls still present in main (not yet moved) are left to main's index.
+    """
+    where = ['calls_fts MATCH ?', *(queries.CALL_FILTERS[name] for name in filters)]
+    if schema != 'main':
+        where.append('NOT EXISTS (SELECT 1 FROM main.calls m WHERE m.id = calls.id)')
+    rows = c.execute(f'''
+        SELECT {', '.join(f'calls.{f}' for f in RESULT_FIELDS)},
+               snippet(calls_fts, 0, '{_OPEN}', '{_CLOSE}', '…', 16) AS snippet,
+               bm25(calls_fts) AS rank
+        FROM {schema}.calls_fts JOIN {schema}.calls ON calls.rowid = calls_fts.rowid
+        WHERE {' AND '.join(where)}
+        ORDER BY rank
+        LIMIT ?
+    ''', (match_query(q), *filters.values(), limit)).fetchall()
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['snippet'] = html.escape(row['snippet'] or '').replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+        result['rank'] = round(-row['rank'], 4)  # bm25 is lower-is-better; report higher-is-better
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in ("rebuild", "optimize"):
+        from app import DB_PATH
+        with storage.transaction(DB_PATH) as conn:
+            if command == "rebuild":
+                print(f"✅ Indexed {rebuild(conn)} transcripts")
+            else:
+                optimize(conn)
+                print("✅ Optimized transcript index")
+    else:
+        print("Usage: python transcript_search.py rebuild|optimize")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Write-behind group-commit queue
+Request handlers enqueue records; one writer thread drains them in batches
+and commits each batch in a single transaction. PriorityLanes puts one such
+queue per priority lane in front of the database
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+import storage
+
+_STOP = object()
+
+
+class _Flush:
+    """Marker asking the writer to commit everything queued before it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindQueue:
+    """
+    Buffer writes and group-commit them from a dedicated thread.
+
+    write_batch(conn, records) is called inside storage.transaction() with
+    up to max_batch_size records, at most max_flush_delay seconds after the
+    first record of the batch was enqueued. write_first(records), if given,
+    commits the batch's rows that live in other databases before that
+    transaction opens, so they never hold db_path's write lock.
+    after_commit(records), if given, runs once the batch is durable. While
+    yield_to() is true the writer holds its batch back (up to max_yield
+    seconds) so a higher lane commits first.
+    """
+
+    def __init__(self, db_path, write_batch: Callable, max_batch_size: int = 100,
+                 max_flush_delay: float = 0.05, name: str = 'write-behind',
+                 after_commit: Optional[Callable] = None, write_first: Optional[Callable] = None,
+                 yield_to: Optional[Callable[[], bool]] = None, max_yield: float = 0.5):
+        self.db_path = db_path
+        self.write_batch = write_batch
+        self.write_first = write_first
+        self.after_commit = after_commit
+        self.yield_to = yield_to
+        self.max_yield = max_yield
+        self.max_batch_size = max_batch_size
+        self.max_flush_delay = max_flush_delay
+        self.name = name
+        self.stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'errors': 0}
+        self._waits = deque(maxlen=1000)  # enqueue-to-commit seconds, recent records
+        self._writing = 0
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the writer thread lazily, once per process"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Forked worker: the parent's thread and queue did not survive
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def put(self, record) -> None:
+        """Enqueue one record and return immediately"""
+        self._ensure_started()
+        self.stats['enqueued'] += 1
+        self._queue.put((time.monotonic(), record))
+
+    def depth(self) -> int:
+        """Records waiting to be written"""
+        return self._queue.qsize()
+
+    def busy(self) -> bool:
+        """Records queued or being committed right now"""
+        return self._writing > 0 or not self._queue.empty()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything enqueued so far is committed"""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        """Flush remaining records and stop the writer (shutdown hook)"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch: List = []
+            waiters: List[_Flush] = []
+            deadline = time.monotonic() + self.max_flush_delay
+
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, _Flush):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stopping:
+                # Drain whatever arrived before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _Flush):
+                        waiters.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            if batch:
+                self._yield()
+                self._writing = len(batch)
+                try:
+                    self._write(batch)
+                finally:
+                    self._writing = 0
+            for waiter in waiters:
+                waiter.done.set()
+
+        storage.close_connection(self.db_path)
+
+    def _yield(self):
+        if self.yield_to is None:
+            return
+        deadline = time.monotonic() + self.max_yield
+        while self.yield_to() and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def _committed(self, batch: List):
+        now = time.monotonic()
+        self._waits.extend(now - enqueued_at for enqueued_at, _ in batch)
+        records = [record for _, record in batch]
+        self.stats['batches'] += 1
+        self.stats['written'] += len(records)
+        if self.after_commit is not None:
+            try:
+                self.after_commit(records)
+            except Exception as e:
+                print(f"⚠️ {self.name}: after_commit failed ({e})")
+
+    def _write(self, batch: List):
+        """batch holds (enqueued_at, record) pairs"""
+        try:
+            self._commit([record for _, record in batch])
+            self._committed(batch)
+            return
+        except Exception as e:
+            print(f"⚠️ {self.name}: batch of {len(batch)} failed ({e}), retrying one by one")
+
+        # One bad record must not take the rest of the batch down with it
+        for item in batch:
+            try:
+                self._commit([item[1]])
+                self._committed([item])
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"❌ {self.name}: dropped record ({e})")
+
+    def _commit(self, records: List):
+        if self.write_first is not None:
+            self.write_first(records)
+        with storage.transaction(self.db_path) as conn:
+            self.write_batch(conn, records)
+
+    def wait_times(self) -> dict:
+        """Enqueue-to-commit latency over the last 1000 records, in ms"""
+        waits = sorted(self._waits)
+        if not waits:
+            return {'wait_ms_p50': 0.0, 'wait_ms_p99': 0.0, 'wait_ms_max': 0.0}
+        return {
+            'wait_ms_p50': round(waits[len(waits) // 2] * 1000, 2),
+            'wait_ms_p99': round(waits[int(len(waits) * 0.99)] * 1000, 2),
+            'wait_ms_max': round(waits[-1] * 1000, 2),
+        }
+
+    def metrics(self) -> dict:
+        """Queue depth, wait times and lifetime counters"""
+        return {'queue_depth': self.depth(), **self.wait_times(), **self.stats}
+
+
+class PriorityLanes:
+    """
+    One WriteBehindQueue per lane, highest priority first.
+
+    lane_of(record) picks the lane. Every lane has its own writer thread, so
+    capacity reserved for a higher lane can never be taken by a flood on a
+    lower one, and a lower lane holds its next batch back while any higher
+    lane has work. Exposes the WriteBehindQueue interface.
+    """
+
+    def __init__(self, db_path, write_batch: Callable, lanes: Sequence[str],
+                 lane_of: Callable, lane_options: Optional[Dict[str, dict]] = None,
+                 name: str = 'write-behind', **options):
+        self.lane_of = lane_of
+        self.lanes: Dict[str, WriteBehindQueue] = {}
+        for lane in lanes:
+            higher = list(self.lanes.values())
+            self.lanes[lane] = WriteBehindQueue(
+                db_path, write_batch, name=f'{name}-{lane}',
+                yield_to=(lambda higher=higher: any(q.busy() for q in higher)) if higher else None,
+                **{**options, **(lane_options or {}).get(lane, {})}
+            )
+
+    def put(self, record) -> None:
+        self.lanes[self.lane_of(record)].put(record)
+
+    def depth(self) -> int:
+        return sum(q.depth() for q in self.lanes.values())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for q in self.lanes.values():
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not q.flush(remaining):
+                return False
+        return True
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        for q in self.lanes.values():
+            q.stop(timeout)
+
+    def metrics(self) -> dict:
+        """Total depth plus per-lane depth, wait times and counters"""
+        return {
+            'queue_depth': self.depth(),
+            'lanes': {lane: q.metrics() for lane, q in self.lanes.items()}
+        }